@@ -1,6 +1,8 @@
 import json
 import os
-from typing import Literal
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Hashable, Literal
 import sys
 
 from filelock import BaseFileLock, FileLock
@@ -10,17 +12,28 @@ import webview
 import numpy as np
 
 from data import Network, TypedConnection, generate_network
-from line_reader import get_all_lines_at_time
-from multiscale import multiscale
+from network_arrays import NetworkArrays, add_networks, convert_json_store, load_networks as load_network_arrays, save_networks
+from line_reader import LineSet, Region, get_all_lines_at_time, iter_line_windows, region_key
+from multiscale import multiscale_arrays
 from tracking import create_clustermap
+from prefetch import Prefetcher, next_time_offset, previous_time_offset
+from wire import pack_lines, pack_network, to_base64
 
 
 SETTINGS_PATH = "settings.json"
 
-NETWORKS_PATH = "internal_data/networks.json"
+NETWORKS_PATH = "internal_data/networks.bin"
+# Where the networks were stored before NETWORKS_PATH, converted on startup
+NETWORKS_JSON_PATH = "internal_data/networks.json"
 CONTINGENCY_PATH = "internal_data/contingency.json"
 TRACKINGS_PATH = "internal_data/tracking.json"
 
+# The number of timesteps of lines kept ready to send to the frontend
+LINE_DICTS_KEPT = 8
+
+# The last timestep of a run
+LAST_TIME_OFFSET = 240
+
 
 class Settings(BaseModel):
     simStart:       str                     = "2024101900"
@@ -28,38 +41,247 @@ class Settings(BaseModel):
     requiredRatio:  float                   = 0.05
     lineType:       Literal["jet", "mta"]   = "jet"
 
+    # The region the lines are limited to, see line_reader.Region.
+    # The whole globe is used if none of the bounds are set.
+    minLon:         float | None            = None
+    maxLon:         float | None            = None
+    minLat:         float | None            = None
+    maxLat:         float | None            = None
+
+    def region(self) -> Region | None:
+        return Region.from_bounds(self.minLon, self.maxLon, self.minLat, self.maxLat)
+
 
 class Api:
-    networks: dict[str, Network]
+    # The networks are kept as arrays and only converted when they are sent
+    networks: dict[str, NetworkArrays]
     contingency_tables: dict[str, pd.DataFrame]
 
     settings: Settings
 
     lines_lock: BaseFileLock
 
-    def __init__(self, networks: dict[str, Network], contingency_tables: dict[str, pd.DataFrame], settings: Settings):
+    # The lines sent to the frontend for the most recently used timesteps,
+    # by sim_start+time_offset+line_type
+    line_dicts: dict[str, list[dict[str, Any]]]
+    line_dicts_lock: Lock
+
+    # The packed and base64 encoded lines of the most recently used timesteps,
+    # as sent by get_lines_packed, by the same keys as line_dicts
+    packed_lines: dict[str, str]
+    packed_lines_lock: Lock
+
+    # The level of detail the frontend last asked for lines in, used when prefetching
+    lines_lod: int
+
+    # Held while the networks and contingency table of a timestep are computed
+    timestep_lock: Lock
+
+    prefetcher: Prefetcher
+
+    def __init__(self, networks: dict[str, NetworkArrays], contingency_tables: dict[str, pd.DataFrame], settings: Settings):
         self.networks = networks
         self.contingency_tables = contingency_tables
         self.settings = settings
 
         self.lines_lock = FileLock("lines.json.lock")
 
-    def get_network(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["mta", "jet"]) -> Network:
-        key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type
-        return self.networks[key]
+        self.line_dicts = {}
+        self.line_dicts_lock = Lock()
+        self.packed_lines = {}
+        self.packed_lines_lock = Lock()
+        self.lines_lod = 0
+        self.timestep_lock = Lock()
+        self.prefetcher = Prefetcher()
+
+    def get_network(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["mta", "jet"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> Network:
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)
+        if key not in self.networks:
+            self._await_prefetch(("timestep", key))
+            self._build_timestep(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+        return self.networks[key].to_network()
+
+    def get_lines(
+        self,
+        sim_start: str,
+        time_offset: int,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+        lod: int = 0,
+    ):
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        return self._build_lines(sim_start, time_offset, line_type, region, lod)
+
+    def get_network_packed(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["mta", "jet"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> str:
+        """Gets the network like get_network, packed in the format of wire.py and base64 encoded"""
+        network = self.get_network(sim_start, time_offset, dist_threshold, required_ratio, line_type, min_lon, max_lon, min_lat, max_lat)
+        return to_base64(pack_network(network))
+
+    def get_lines_packed(
+        self,
+        sim_start: str,
+        time_offset: int,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+        lod: int = 0,
+    ) -> str:
+        """Gets the lines like get_lines, packed in the format of wire.py and base64 encoded"""
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        self.lines_lod = lod
+        key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if key not in self.packed_lines:
+            self._await_prefetch(("lines", key))
+
+        return self._build_lines_packed(sim_start, time_offset, line_type, region, lod)
+
+    def get_contingency_table(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ):
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)
+        if key not in self.contingency_tables:
+            self._await_prefetch(("timestep", key))
+            self._build_timestep(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+        # The contingency table is the last thing the frontend asks for when showing a
+        # timestep, so start warming up the neighbouring timesteps.
+        self._prefetch_around(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+        return self.contingency_tables[key].to_numpy().tolist()
+
+    def get_settings(self):
+        return self.settings.model_dump()
+
+    def _build_lines(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"], region: Region | None = None, lod: int = 0):
+        key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if key in self.line_dicts:
+            return self.line_dicts[key]
 
-    def get_lines(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"]):
         with self.lines_lock:
-            lines = get_all_lines_at_time(sim_start, time_offset, line_type)
-        lines_dict = [line.to_dict() for line in lines]
+            lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+        lines_dict = [line.to_dict(lod) for line in lines]
+
+        with self.line_dicts_lock:
+            self.line_dicts[key] = lines_dict
+            while len(self.line_dicts) > LINE_DICTS_KEPT:
+                del self.line_dicts[next(iter(self.line_dicts))]
+
         return lines_dict
 
-    def get_contingency_table(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"]):
-        key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type
-        return contingency_tables[key].to_numpy().tolist()
+    def _build_lines_packed(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"], region: Region | None = None, lod: int = 0) -> str:
+        key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if key in self.packed_lines:
+            return self.packed_lines[key]
 
-    def get_settings(self):
-        return self.settings.model_dump()
+        with self.lines_lock:
+            lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+        packed = to_base64(pack_lines(lines, lod))
+
+        with self.packed_lines_lock:
+            self.packed_lines[key] = packed
+            while len(self.packed_lines) > LINE_DICTS_KEPT:
+                del self.packed_lines[next(iter(self.packed_lines))]
+
+        return packed
+
+    def _build_timestep(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"], region: Region | None = None):
+        """Computes the networks and contingency table of a timestep if they are missing
+
+        See get_timestep_data.
+        """
+        key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)
+        with self.timestep_lock:
+            if key in self.networks and key in self.contingency_tables:
+                return
+
+            settings = Settings(simStart=sim_start, distThreshold=dist_threshold, requiredRatio=required_ratio, lineType=line_type)
+            if region is not None:
+                settings = settings.model_copy(update={
+                    "minLon": region.min_lon,
+                    "maxLon": region.max_lon,
+                    "minLat": region.min_lat,
+                    "maxLat": region.max_lat,
+                })
+
+            t1 = next_time_offset(time_offset)
+            with self.lines_lock:
+                lines_t0 = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+                lines_t1 = get_all_lines_at_time(sim_start, t1, line_type, region=region)
+
+            get_timestep_data(settings, self.networks, self.contingency_tables, time_offset, t1, lines_t0, lines_t1)
+
+    def _await_prefetch(self, key: tuple[str, str]):
+        """Waits for the prefetch job computing key, if there is one
+
+        If the data is not being prefetched the user has jumped to a timestep that
+        was not expected, so the pending prefetch jobs are cancelled.
+        """
+        if not self.prefetcher.wait(key):
+            self.prefetcher.cancel()
+
+    def _prefetch_around(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"], region: Region | None = None):
+        """Prefetches the data of the timesteps before and after time_offset
+
+        The lines are prefetched in both directions. The networks and contingency
+        table are only computed ahead, since get_timestep_data maps the cluster ids
+        of a timestep onto those of the timestep before it and has to be run in order.
+        """
+        jobs: list[tuple[Hashable, Callable[[], object]]] = []
+
+        t_next = next_time_offset(time_offset)
+        if next_time_offset(t_next) <= LAST_TIME_OFFSET:
+            jobs.append((
+                ("timestep", sim_start + str(t_next) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)),
+                partial(self._build_timestep, sim_start, t_next, dist_threshold, required_ratio, line_type, region),
+            ))
+
+        for t in [t_next, next_time_offset(t_next), previous_time_offset(time_offset)]:
+            if 0 <= t <= LAST_TIME_OFFSET:
+                jobs.append((
+                    ("lines", sim_start + str(t) + line_type + region_key(region) + "lod" + str(self.lines_lod)),
+                    partial(self._build_lines_packed, sim_start, t, line_type, region, self.lines_lod),
+                ))
+
+        self.prefetcher.schedule(jobs)
 
 
 def init_files():
@@ -68,9 +290,10 @@ def init_files():
             json.dump(Settings().model_dump(), f)
         print("Generated settings file...")
     
-    if not os.path.exists(NETWORKS_PATH):
-        with open(NETWORKS_PATH, "w+") as f:
-            json.dump({}, f)
+    if convert_json_store(NETWORKS_JSON_PATH, NETWORKS_PATH):
+        print("Converted networks file...")
+    elif not os.path.exists(NETWORKS_PATH):
+        save_networks(NETWORKS_PATH, {})
         print("Generated networks file...")
 
     if not os.path.exists(CONTINGENCY_PATH):
@@ -98,24 +321,18 @@ def load_settings() -> Settings:
 
 
 def save_network(network: Network, settings: Settings, timestep: int):
-    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType
+    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType + region_key(settings.region())
 
-    with open(NETWORKS_PATH, "r+") as f:
-        content: dict[str, Network] = json.load(f)
-        content[key] = network
-        _ = f.seek(0)
-        json.dump(content, f)
-        _ = f.truncate()
+    add_networks(NETWORKS_PATH, {key: NetworkArrays.from_network(network)})
 
 
-def load_networks() -> dict[str, Network]:
-    with open(NETWORKS_PATH, "r") as f:
-        networks: dict[str, Network] = json.load(f)
-        return networks
+def load_networks() -> dict[str, NetworkArrays]:
+    # Copied out of the file, since add_networks rewrites it from time to time
+    return {key: arrays.copy() for key, arrays in load_network_arrays(NETWORKS_PATH).items()}
 
 
 def save_contingency_table(contingency_table: pd.DataFrame, settings: Settings, timestep: int):
-    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType
+    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType + region_key(settings.region())
 
     with open(CONTINGENCY_PATH, "r+") as f:
         content: dict[str, str] = json.load(f)
@@ -133,7 +350,7 @@ def load_contingency_tables() -> dict[str, pd.DataFrame]:
 
 
 def save_tracking(tracking: list[tuple[str, str]], settings: Settings, timestep: int):
-    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType
+    key = settings.simStart + str(timestep) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType + region_key(settings.region())
 
     with open(TRACKINGS_PATH, "r+") as f:
         content: dict[str, list[tuple[str, str]]] = json.load(f)
@@ -149,38 +366,36 @@ def load_tracking() -> dict[str, list[tuple[str, str]]]:
         return content
 
 
-def get_timestep_data(settings: Settings, networks: dict[str, Network], contingency_tables: dict[str, pd.DataFrame], t0: int): 
+def get_timestep_data(settings: Settings, networks: dict[str, NetworkArrays], contingency_tables: dict[str, pd.DataFrame], t0: int, t1: int, lines_t0: LineSet, lines_t1: LineSet): 
     """Gets all the data for the current and next timestep
 
     Parameters
     ----------
     settings : The Settings object for the project
     t0 : the starting timestep to get from and next
+    t1 : the timestep following t0
+    lines_t0 : the lines at t0
+    lines_t1 : the lines at t1
     """
 
-    t1 = t0 + (3 if t0 < 72 else 6)
-
-    lines_t0 = get_all_lines_at_time(settings.simStart, t0, settings.lineType)
-    lines_t1 = get_all_lines_at_time(settings.simStart, t1, settings.lineType)
-
     network_t0: Network
-    network_key_t0 = settings.simStart + str(t0) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType
+    network_key_t0 = settings.simStart + str(t0) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType + region_key(settings.region())
     if not network_key_t0 in networks:
-        ico_points_t0, line_points_t0 = multiscale(lines_t0, 2)
+        ico_points_t0, line_points_t0 = multiscale_arrays(lines_t0, 2)
         network_t0 = generate_network(lines_t0, ico_points_t0, line_points_t0, settings.distThreshold, settings.requiredRatio)
         save_network(network_t0, settings, t0)
     else:
-        network_t0 = networks[network_key_t0]
+        network_t0 = networks[network_key_t0].to_network()
 
 
     network_t1: Network
-    network_key_t1 = settings.simStart + str(t1) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType
+    network_key_t1 = settings.simStart + str(t1) + str(settings.distThreshold) + str(settings.requiredRatio) + settings.lineType + region_key(settings.region())
     if not network_key_t1 in networks:
-        ico_points_t1, line_points_t1 = multiscale(lines_t1, 2)
+        ico_points_t1, line_points_t1 = multiscale_arrays(lines_t1, 2)
         network_t1 = generate_network(lines_t1, ico_points_t1, line_points_t1, settings.distThreshold, settings.requiredRatio)
         save_network(network_t1, settings, t1)
     else:
-        network_t1 = networks[network_key_t1]
+        network_t1 = networks[network_key_t1].to_network()
 
     # contingency_table: pd.DataFrame
     # if not network_key_t0 in contingency_tables:
@@ -287,8 +502,8 @@ def get_timestep_data(settings: Settings, networks: dict[str, Network], continge
     ).fillna(0).astype(int)
 
     contingency_tables[network_key_t0] = new_contingency
-    networks[network_key_t0] = network_t0
-    networks[network_key_t1] = network_t1
+    networks[network_key_t0] = NetworkArrays.from_network(network_t0)
+    networks[network_key_t1] = NetworkArrays.from_network(network_t1)
 
 
 if __name__ == "__main__":
@@ -298,12 +513,10 @@ if __name__ == "__main__":
     networks = load_networks()
     contingency_tables = load_contingency_tables()
 
-    t0 = 0
-    while t0 <= 24:
+    # Only the two timesteps being compared are held in memory at once
+    for (t0, lines_t0), (t1, lines_t1) in iter_line_windows(settings.simStart, settings.lineType, size=2, times=range(0, 28, 3), region=settings.region()):
         print("Fetching data for: ", t0)
-        get_timestep_data(settings, networks, contingency_tables, t0)
-
-        t0 += 3 if t0 < 72 else 6
+        get_timestep_data(settings, networks, contingency_tables, t0, t1, lines_t0, lines_t1)
 
     api = Api(networks, contingency_tables, settings)
     _ = webview.create_window('INF319', 'assets/index.html', js_api=api, min_size=(1280, 720))
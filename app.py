@@ -1,17 +1,36 @@
 import sys
 import json
 import os
-from typing import Literal, TypedDict
-
-from line_reader import Line, get_all_lines
-from multiscale import multiscale
-from data import generate_network, Network
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Hashable, Literal, TypedDict
+
+from line_reader import LineSet, Region, get_all_lines_at_time, region_key
+from multiscale import multiscale_arrays
+from data import NetworkSweep, SweepNetwork, generate_network, Network
+from network_arrays import NetworkArrays, add_networks, convert_json_store, load_networks
 from tracking import create_clustermap
+from prefetch import Prefetcher, next_time_offset, previous_time_offset
+from wire import pack_lines, pack_network, to_base64
 
 import webview
 from filelock import BaseFileLock, FileLock
 
 
+NETWORKS_PATH = "networks.bin"
+# Where the networks were stored before NETWORKS_PATH, converted on startup
+NETWORKS_JSON_PATH = "networks.json"
+
+# The number of timesteps of lines kept ready to send to the frontend
+LINE_DICTS_KEPT = 8
+
+# The number of timesteps of network sweeps kept in memory
+SWEEPS_KEPT = 4
+
+# The last timestep of a run
+LAST_TIME_OFFSET = 240
+
+
 class Settings(TypedDict):
     simStart: str
     distThreshold: float
@@ -20,16 +39,34 @@ class Settings(TypedDict):
 
 
 class Api:
-    # The key in this dictionary is a combination of the parameters for the lines 
-    loaded_lines: dict[str, dict[int, list[Line]]]
-
     # The key in this dictionary is a combination of the parameters for the network
     # sim_start+time_offset+dist_threshold_required_ratio
     # eg. "2024101900+0+50+0.05" = "20241019000500.05"
-    loaded_networks: dict[str, Network]
+    # The networks are kept as arrays and only converted when they are sent
+    loaded_networks: dict[str, NetworkArrays]
 
     loaded_contingency: dict[str, list[list[int]]]
 
+    # The lines sent to the frontend for the most recently used timesteps,
+    # by sim_start+time_offset+line_type
+    loaded_line_dicts: dict[str, list[dict[str, Any]]]
+    line_dicts_lock: Lock
+
+    # The packed and base64 encoded lines of the most recently used timesteps,
+    # as sent by get_lines_packed, by the same keys as loaded_line_dicts
+    loaded_packed_lines: dict[str, str]
+    packed_lines_lock: Lock
+
+    # The level of detail the frontend last asked for lines in, used when prefetching
+    lines_lod: int
+
+    # The network sweeps of the most recently swept timesteps, by
+    # sim_start+time_offset+line_type
+    network_sweeps: dict[str, NetworkSweep]
+    sweeps_lock: Lock
+
+    prefetcher: Prefetcher
+
     network_lock: BaseFileLock
     lines_lock: BaseFileLock
     contingency_lock: BaseFileLock
@@ -39,17 +76,18 @@ class Api:
     def __init__(self):
         """Initializes the api
 
-        Reads the networks and lines that have been saved locally on the machine and
-        initializes the loaded_networks and loaded_lines objects. Also initializes
+        Reads the networks that have been saved locally on the machine and
+        initializes the loaded_networks object. Lines are not kept in memory,
+        each timestep is read from the run cache when needed. Also initializes
         the locks needed in order for the files to not be accessed at the same time by 
         different threads.
         """
 
-        if not os.path.exists("networks.json"):
-            self.loaded_networks = {}
-        else:
-            with open("networks.json", "r") as f:
-                self.loaded_networks = json.load(f)
+        if convert_json_store(NETWORKS_JSON_PATH, NETWORKS_PATH):
+            print(f"Converted {NETWORKS_JSON_PATH} to {NETWORKS_PATH}...")
+
+        # Copied out of the file, since add_networks rewrites it from time to time
+        self.loaded_networks = {key: arrays.copy() for key, arrays in load_networks(NETWORKS_PATH).items()}
 
         if not os.path.exists("contingency.json"):
             self.loaded_contingency = {}
@@ -70,14 +108,32 @@ class Api:
             with open("settings.json", "r") as f:
                 self.settings = json.load(f)
 
-        self.loaded_lines = {}
-        
-        self.network_lock = FileLock("networks.json.lock")
+        self.loaded_line_dicts = {}
+        self.line_dicts_lock = Lock()
+        self.loaded_packed_lines = {}
+        self.packed_lines_lock = Lock()
+        self.lines_lod = 0
+        self.network_sweeps = {}
+        self.sweeps_lock = Lock()
+        self.prefetcher = Prefetcher()
+
+        self.network_lock = FileLock(NETWORKS_PATH + ".lock")
         self.lines_lock = FileLock("lines.json.lock")
         self.contingency_lock = FileLock("contingency.json.lock")
 
 
-    def get_network(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["mta", "jet"]) -> Network:
+    def get_network(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["mta", "jet"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> Network:
         """Gets the network given its parameters
 
         If a network with the same parameters exist in loaded_networks then that network will be returned.
@@ -94,58 +150,225 @@ class Api:
         ratio : the ratio of points in two lines which must be closer than the distance threshold
             for the lines to be considered close.
         line_type : the type of line being analyzed (jet or mta)
+        min_lon, max_lon, min_lat, max_lat : optional bounds of the region to limit the lines to
+            See line_reader.Region. If none are given all lines are used.
         """
 
-        network_key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type
-        if network_key in self.loaded_networks:
-            return self.loaded_networks[network_key]
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        network_key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)
+        if network_key not in self.loaded_networks:
+            self._await_prefetch(("network", network_key))
+
+        return self._build_network(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+    def get_lines(
+        self,
+        sim_start: str,
+        time_offset: int,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+        lod: int = 0,
+    ):
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        return self._build_lines(sim_start, time_offset, line_type, region, lod)
+
+    def get_network_sweep(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_thresholds: list[int],
+        required_ratios: list[float],
+        line_type: Literal["mta", "jet"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> list[SweepNetwork]:
+        """Gets the networks of every combination of the distance thresholds and required ratios
+
+        The distances between the lines of the timestep are only computed once, see
+        data.NetworkSweep. The networks are stored like those from get_network, and the
+        sweep is kept, so get_network does not measure the lines again for any threshold
+        up to the largest one swept.
 
-        lines: list[Line]
-        with self.lines_lock:
-            lines_key = sim_start + line_type
-            if not lines_key in self.loaded_lines:
-                self.loaded_lines[lines_key] = get_all_lines(sim_start, line_type)
+        Parameters
+        ----------
+        dist_thresholds : the distance thresholds to compute networks for, see get_network
+        required_ratios : the required ratios to compute networks for, see get_network
+        See get_network for the other parameters.
+        """
+
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        sweep = self._build_sweep(sim_start, time_offset, max(dist_thresholds), line_type, region)
+        networks = sweep.networks(dist_thresholds, required_ratios)
+
+        swept: dict[str, Network] = {}
+        for sweep_network in networks:
+            network_key = sim_start + str(time_offset) + str(sweep_network["dist_threshold"]) + str(sweep_network["required_ratio"]) + line_type + region_key(region)
+            swept[network_key] = sweep_network["network"]
+
+        swept_arrays = {key: NetworkArrays.from_network(network) for key, network in swept.items()}
+        with self.network_lock:
+            self.loaded_networks.update(swept_arrays)
+            add_networks(NETWORKS_PATH, swept_arrays)
+
+        return networks
+
+    def get_network_packed(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["mta", "jet"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> str:
+        """Gets the network like get_network, packed in the format of wire.py and base64 encoded"""
+        network = self.get_network(sim_start, time_offset, dist_threshold, required_ratio, line_type, min_lon, max_lon, min_lat, max_lat)
+        return to_base64(pack_network(network))
+
+    def get_lines_packed(
+        self,
+        sim_start: str,
+        time_offset: int,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+        lod: int = 0,
+    ) -> str:
+        """Gets the lines like get_lines, packed in the format of wire.py and base64 encoded"""
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        self.lines_lod = lod
+        lines_key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if lines_key not in self.loaded_packed_lines:
+            self._await_prefetch(("lines", lines_key))
+
+        return self._build_lines_packed(sim_start, time_offset, line_type, region, lod)
+
+    def get_contingency_table(
+        self,
+        sim_start: str,
+        time_offset: int,
+        dist_threshold: int,
+        required_ratio: float,
+        line_type: Literal["jet", "mta"],
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ):
+        region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+        t1 = next_time_offset(time_offset)
+        contingency_key = sim_start + str(dist_threshold) + str(required_ratio) + line_type + str(time_offset) + str(t1) + region_key(region)
+
+        if contingency_key not in self.loaded_contingency:
+            self._await_prefetch(("contingency", contingency_key))
+
+        contingency = self._build_contingency(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+        # The contingency table is the last thing the frontend asks for when showing a
+        # timestep, so start warming up the neighbouring timesteps.
+        self._prefetch_around(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+
+        return contingency
 
-        lines = self.loaded_lines[lines_key][time_offset]
+    def _build_network(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["mta", "jet"], region: Region | None = None) -> Network:
+        network_key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)
+        if network_key in self.loaded_networks:
+            return self.loaded_networks[network_key].to_network()
 
-        ico_points_ms, line_points_ms = multiscale(lines, 0)
-        network = generate_network(lines, ico_points_ms, line_points_ms, dist_threshold, required_ratio)
+        sweep = self.network_sweeps.get(sim_start + str(time_offset) + line_type + region_key(region))
+        if sweep is not None and sweep.max_dist >= dist_threshold:
+            network = sweep.network(dist_threshold, required_ratio)
+        else:
+            lines = self._lines_at_time(sim_start, time_offset, line_type, region)
+            ico_points_ms, line_points_ms = multiscale_arrays(lines, 0)
+            network = generate_network(lines, ico_points_ms, line_points_ms, dist_threshold, required_ratio)
 
+        network_arrays = NetworkArrays.from_network(network)
         with self.network_lock:
-            self.loaded_networks[network_key] = network
-            with open("networks.json", "w+") as f:
-                json.dump(self.loaded_networks, f)
+            self.loaded_networks[network_key] = network_arrays
+            add_networks(NETWORKS_PATH, {network_key: network_arrays})
 
         return network
 
-    def get_lines(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"]):
-        lines: list[Line]
-        lines_key = sim_start + line_type
+    def _build_sweep(self, sim_start: str, time_offset: int, max_dist: int, line_type: Literal["mta", "jet"], region: Region | None = None) -> NetworkSweep:
+        sweep_key = sim_start + str(time_offset) + line_type + region_key(region)
+        sweep = self.network_sweeps.get(sweep_key)
+        if sweep is not None and sweep.max_dist >= max_dist:
+            return sweep
+
+        lines = self._lines_at_time(sim_start, time_offset, line_type, region)
+        _, line_points_ms = multiscale_arrays(lines, 0)
+        sweep = NetworkSweep(lines, line_points_ms, max_dist)
+
+        with self.sweeps_lock:
+            self.network_sweeps.pop(sweep_key, None)
+            self.network_sweeps[sweep_key] = sweep
+            while len(self.network_sweeps) > SWEEPS_KEPT:
+                del self.network_sweeps[next(iter(self.network_sweeps))]
+
+        return sweep
+
+    def _lines_at_time(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"], region: Region | None = None) -> LineSet:
+        """Gets the lines at a timestep from the run cache
+
+        The lock makes sure only one thread builds the cache of a run the first
+        time it is read. After that this is a slice of the memory mapped cache.
+        """
         with self.lines_lock:
-            if not lines_key in self.loaded_lines:
-                self.loaded_lines[lines_key] = get_all_lines(sim_start, line_type)
+            return get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+
+    def _build_lines(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"], region: Region | None = None, lod: int = 0):
+        lines_key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if lines_key in self.loaded_line_dicts:
+            return self.loaded_line_dicts[lines_key]
 
-        lines = self.loaded_lines[lines_key][time_offset]
-        lines_dict = [line.to_dict() for line in lines]
+        lines = self._lines_at_time(sim_start, time_offset, line_type, region)
+        lines_dict = [line.to_dict(lod) for line in lines]
+
+        with self.line_dicts_lock:
+            self.loaded_line_dicts[lines_key] = lines_dict
+            while len(self.loaded_line_dicts) > LINE_DICTS_KEPT:
+                del self.loaded_line_dicts[next(iter(self.loaded_line_dicts))]
 
         return lines_dict
 
-    def get_contingency_table(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"]):
-        t1 = time_offset + (3 if time_offset < 72 else 6)
-        contingency_key = sim_start + str(dist_threshold) + str(required_ratio) + line_type + str(time_offset) + str(t1)
+    def _build_lines_packed(self, sim_start: str, time_offset: int, line_type: Literal["jet", "mta"], region: Region | None = None, lod: int = 0) -> str:
+        lines_key = sim_start + str(time_offset) + line_type + region_key(region) + "lod" + str(lod)
+        if lines_key in self.loaded_packed_lines:
+            return self.loaded_packed_lines[lines_key]
+
+        lines = self._lines_at_time(sim_start, time_offset, line_type, region)
+        packed = to_base64(pack_lines(lines, lod))
+
+        with self.packed_lines_lock:
+            self.loaded_packed_lines[lines_key] = packed
+            while len(self.loaded_packed_lines) > LINE_DICTS_KEPT:
+                del self.loaded_packed_lines[next(iter(self.loaded_packed_lines))]
+
+        return packed
+
+    def _build_contingency(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"], region: Region | None = None):
+        t1 = next_time_offset(time_offset)
+        contingency_key = sim_start + str(dist_threshold) + str(required_ratio) + line_type + str(time_offset) + str(t1) + region_key(region)
 
         if contingency_key in self.loaded_contingency:
             return self.loaded_contingency[contingency_key]
 
-        network_key = sim_start + str(time_offset) + str(dist_threshold) + str(required_ratio) + line_type
-        network_t0 = self.loaded_networks[network_key]
-
-        network_key = sim_start + str(t1) + str(dist_threshold) + str(required_ratio) + line_type
-        network_t1 = self.loaded_networks[network_key]
+        network_t0 = self._build_network(sim_start, time_offset, dist_threshold, required_ratio, line_type, region)
+        network_t1 = self._build_network(sim_start, t1, dist_threshold, required_ratio, line_type, region)
 
-        lines_key = sim_start + line_type
-        lines_t0 = self.loaded_lines[lines_key][time_offset]
-        lines_t1 = self.loaded_lines[lines_key][t1]
+        lines_t0 = self._lines_at_time(sim_start, time_offset, line_type, region)
+        lines_t1 = self._lines_at_time(sim_start, t1, line_type, region)
 
         contingency = create_clustermap(lines_t0, lines_t1, network_t0, network_t1)
 
@@ -157,6 +380,44 @@ class Api:
 
         return contingency
 
+    def _await_prefetch(self, key: tuple[str, str]):
+        """Waits for the prefetch job computing key, if there is one
+
+        If the data is not being prefetched the user has jumped to a timestep that
+        was not expected, so the pending prefetch jobs are cancelled.
+        """
+        if not self.prefetcher.wait(key):
+            self.prefetcher.cancel()
+
+    def _prefetch_around(self, sim_start: str, time_offset: int, dist_threshold: int, required_ratio: float, line_type: Literal["jet", "mta"], region: Region | None = None):
+        """Prefetches the data of the timesteps before and after time_offset
+
+        The frontend shows a timestep together with the one following it, so stepping
+        to a neighbour needs the lines, networks and contingency table of the neighbour
+        and the timestep after it.
+        """
+        jobs: list[tuple[Hashable, Callable[[], object]]] = []
+        for t0 in [next_time_offset(time_offset), previous_time_offset(time_offset)]:
+            t1 = next_time_offset(t0)
+            if t0 < 0 or t1 > LAST_TIME_OFFSET:
+                continue
+
+            for t in [t0, t1]:
+                jobs.append((
+                    ("lines", sim_start + str(t) + line_type + region_key(region) + "lod" + str(self.lines_lod)),
+                    partial(self._build_lines_packed, sim_start, t, line_type, region, self.lines_lod),
+                ))
+                jobs.append((
+                    ("network", sim_start + str(t) + str(dist_threshold) + str(required_ratio) + line_type + region_key(region)),
+                    partial(self._build_network, sim_start, t, dist_threshold, required_ratio, line_type, region),
+                ))
+
+            jobs.append((
+                ("contingency", sim_start + str(dist_threshold) + str(required_ratio) + line_type + str(t0) + str(t1) + region_key(region)),
+                partial(self._build_contingency, sim_start, t0, dist_threshold, required_ratio, line_type, region),
+            ))
+
+        self.prefetcher.schedule(jobs)
 
     def get_settings(self) -> Settings:
         return self.settings
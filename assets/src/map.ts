@@ -6,6 +6,7 @@ import "leaflet-draw";
 import "leaflet-draw/dist/leaflet.draw.css";
 import { highlightClusters } from "./network";
 import { getNewIds, getOldIds, highlightCellsNewId, highlightCellsOldId } from "./contingencyTable";
+import { decodeLines } from "./wire";
 
 declare module 'leaflet' {
   interface PolylineOptions {
@@ -23,6 +24,10 @@ let lineLayerRight: L.LayerGroup;
 let linesRight: L.Polyline[] = [];
 let t1NodeClusters: Record<string, string>;
 
+// The tolerances in degrees of the levels of detail of the lines, as in
+// LOD_TOLERANCES in line_reader.py
+const lodTolerances = [0.0, 0.1, 0.25, 0.5, 1.0];
+
 let lineColormap: ScaleOrdinal<string, string, never> = scaleOrdinal<string, string>(schemeCategory10)
                                                           .domain(Array.from({length: 50}, (_, i) => i.toString()))
 
@@ -147,7 +152,20 @@ function initMapsContainers(leftContainerId: string, rightContainerId: string):
 }
 
 
+// The coarsest level of detail whose tolerance is within a pixel at the zoom of the map
+function mapLod(map: L.Map): number {
+  const degreesPerPixel = 360 / (256 * Math.pow(2, map.getZoom()));
+  let lod = 0;
+  while (lod + 1 < lodTolerances.length && lodTolerances[lod + 1] <= degreesPerPixel) {
+    lod++;
+  }
+
+  return lod;
+}
+
+
 async function _populateMap(
+  map: L.Map,
   lineLayer: L.LayerGroup,
   linesArray: L.Polyline[],
   nodeClusters: Record<string, string>,
@@ -155,7 +173,9 @@ async function _populateMap(
   timeOffset: number,
   lineType: "jet" | "mta"
 ) {
-  const data = await pywebview.api.get_lines(simStart, timeOffset, lineType); 
+  const data = decodeLines(
+    await pywebview.api.get_lines_packed(simStart, timeOffset, lineType, null, null, null, null, mapLod(map))
+  );
   linesArray.splice(0, linesArray.length);
 
   data.forEach(function(l) {
@@ -196,11 +216,11 @@ export async function populateMap(side: "left" | "right", simStart: string, time
   if (side === "left") {
     lineLayerLeft.clearLayers();
     t0NodeClusters = nodeClusters;
-    await _populateMap(lineLayerLeft, linesLeft, nodeClusters, simStart, timeOffset, lineType);
+    await _populateMap(mapLeft, lineLayerLeft, linesLeft, nodeClusters, simStart, timeOffset, lineType);
   } else {
     lineLayerRight.clearLayers();
     t1NodeClusters = nodeClusters;
-    await _populateMap(lineLayerRight, linesRight, nodeClusters, simStart, timeOffset, lineType);
+    await _populateMap(mapRight, lineLayerRight, linesRight, nodeClusters, simStart, timeOffset, lineType);
   }
 }
 
@@ -6,6 +6,7 @@ import FA2Layout from "graphology-layout-forceatlas2/worker";
 import { inferSettings } from "graphology-layout-forceatlas2"
 import { SigmaNodeEventPayload } from "sigma/dist/declarations/src/types";
 import { NETWORK_NODE_CLICK, NetworkClickEvent } from "./event";
+import { decodeNetwork } from "./wire";
 
 
 // Initialize these here so we can use them later
@@ -109,7 +110,7 @@ async function _populateNetwork(
   requriedRatio: number,
   lineType: "jet" | "mta"
 ): Promise<Record<string, string>> {
-  const data = await pywebview.api.get_network(simStart, timeOffset, distThreshold, requriedRatio, lineType); 
+  const data = decodeNetwork(await pywebview.api.get_network_packed(simStart, timeOffset, distThreshold, requriedRatio, lineType));
   
   const links = Object.values(data.clusters).flat().map(d => ({...d}));
   const nodes = data.nodes.map(d => ({...d}))
@@ -15,6 +15,33 @@ declare global {
         lineType: "jet" | "mta"
       ) => Promise<Line[]>,
 
+      get_network_sweep: (
+        simStart: string,
+        timeOffset: number,
+        distThresholds: number[],
+        requiredRatios: number[],
+        lineType: "jet" | "mta"
+      ) => Promise<SweepNetwork[]>,
+
+      get_network_packed: (
+        simStart: string, 
+        timeOffset: number, 
+        distThreshold: number, 
+        requiredRatio: number,
+        lineType: "jet" | "mta"
+      ) => Promise<string>,
+
+      get_lines_packed: (
+        simStart: string,
+        timeOffset: number,
+        lineType: "jet" | "mta",
+        minLon?: number | null,
+        maxLon?: number | null,
+        minLat?: number | null,
+        maxLat?: number | null,
+        lod?: number
+      ) => Promise<string>,
+
       get_contingency_table: (
         simStart: string,
         timeOffset: number,
@@ -44,6 +71,12 @@ type Network = {
   node_clusters: Record<string, string>;
 }
 
+type SweepNetwork = {
+  dist_threshold: number;
+  required_ratio: number;
+  network: Network;
+}
+
 type CoordGeo = {
   lat: number;
   lon: number;
@@ -62,4 +95,4 @@ type Settings = {
   lineType: "jet" | "mta";
 }
 
-export { Network, Line, Settings };
+export { Network, SweepNetwork, Line, Settings };
@@ -0,0 +1,113 @@
+import { Line, Network } from "./types/pywebview";
+
+// Decoders for the binary format written by wire.py.
+// See wire.py for the layout of the buffers.
+
+const LINES_MAGIC = "LIN1";
+const NETWORK_MAGIC = "NET1";
+const ALIGNMENT = 8;
+
+type ArrayInfo = {
+  dtype: "f4" | "i4";
+  offset: number;
+  length: number;
+}
+
+type Header = {
+  ids: string[];
+  arrays: Record<string, ArrayInfo>;
+}
+
+/**
+  * Decodes a base64 string sent by pywebview into bytes.
+  * @param data - The base64 encoded buffer.
+*/
+function fromBase64(data: string): ArrayBuffer {
+  const binary = atob(data);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+
+  return bytes.buffer;
+}
+
+/**
+  * Reads the string table and the typed array views of a packed buffer.
+  * @param buffer - The packed buffer.
+  * @param magic - The tag the buffer is expected to start with.
+*/
+function unpack(buffer: ArrayBuffer, magic: string): { ids: string[], arrays: Record<string, Float32Array | Int32Array> } {
+  const bytes = new Uint8Array(buffer);
+  const tag = String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]);
+  if (tag !== magic) {
+    throw new Error(`Expected a buffer tagged ${magic}, got ${tag}`);
+  }
+
+  const headerLength = new DataView(buffer).getUint32(4, true);
+  const prefixLength = 8 + headerLength;
+  const header: Header = JSON.parse(new TextDecoder().decode(bytes.subarray(8, prefixLength)));
+  const dataStart = Math.ceil(prefixLength / ALIGNMENT) * ALIGNMENT;
+
+  const arrays: Record<string, Float32Array | Int32Array> = {};
+  Object.keys(header.arrays).forEach(name => {
+    const info = header.arrays[name];
+    const offset = dataStart + info.offset;
+    arrays[name] = info.dtype === "f4"
+      ? new Float32Array(buffer, offset, info.length)
+      : new Int32Array(buffer, offset, info.length);
+  });
+
+  return { ids: header.ids, arrays: arrays };
+}
+
+/**
+  * Decodes lines packed by wire.pack_lines.
+  * @param data - The base64 encoded buffer from get_lines_packed.
+*/
+export function decodeLines(data: string): Line[] {
+  const { ids, arrays } = unpack(fromBase64(data), LINES_MAGIC);
+  const { lon, lat, offsets, centroids } = arrays;
+
+  return ids.map((id, i) => {
+    const coords = [];
+    for (let j = offsets[i]; j < offsets[i + 1]; j++) {
+      coords.push({ lon: lon[j], lat: lat[j] });
+    }
+
+    return {
+      id: id,
+      coords: coords,
+      centroid: { lon: centroids[2 * i], lat: centroids[2 * i + 1] },
+    };
+  });
+}
+
+/**
+  * Decodes a network packed by wire.pack_network.
+  * @param data - The base64 encoded buffer from get_network_packed.
+*/
+export function decodeNetwork(data: string): Network {
+  const { ids, arrays } = unpack(fromBase64(data), NETWORK_MAGIC);
+  const { clusters, node_clusters, edges, weights, edge_clusters } = arrays;
+
+  const network: Network = { nodes: [], clusters: {}, node_clusters: {} };
+  for (let i = 0; i < clusters.length; i++) {
+    network.clusters[clusters[i]] = [];
+  }
+
+  ids.forEach((id, i) => {
+    network.nodes.push({ id: id });
+    network.node_clusters[id] = node_clusters[i].toString();
+  });
+
+  for (let i = 0; i < weights.length; i++) {
+    network.clusters[edge_clusters[i]].push({
+      source: ids[edges[2 * i]],
+      target: ids[edges[2 * i + 1]],
+      weight: weights[i],
+    });
+  }
+
+  return network;
+}
@@ -2,13 +2,15 @@ from __future__ import annotations
 
 
 import math
-from typing import List, Literal
+from typing import Dict, Iterable, Iterator, List, Literal
 
 import numpy as np
 from numpy.typing import NDArray
 
 
 class Coord3D:
+    __slots__ = ("x", "y", "z")
+
     x: float
     y: float
     z: float
@@ -73,10 +75,15 @@ class Coord3D:
         )
 
     def dist(self, o: Coord3D) -> float:
-        return np.sqrt(np.sum((self.to_ndarray() - o.to_ndarray())**2))
+        dx = self.x - o.x
+        dy = self.y - o.y
+        dz = self.z - o.z
+        return math.sqrt(dx * dx + dy * dy + dz * dz)
 
 
 class Coord2D:
+    __slots__ = ("x", "y")
+
     x: float
     y: float
 
@@ -93,6 +100,8 @@ class Coord2D:
 
 
 class CoordGeo:
+    __slots__ = ("lon", "lat")
+
     lon: float
     lat: float
 
@@ -115,3 +124,184 @@ class CoordGeo:
     def to_list(self) -> List[float]:
         """Returns the coordinate as a list of two floats"""
         return [self.lon, self.lat]
+
+    def to_dict(self) -> Dict[str, float]:
+        """Returns the coordinate as a JSON serializable dict"""
+        return {"lon": self.lon, "lat": self.lat}
+
+
+class Coord3DArray:
+    """An array of 3D coordinates.
+
+    The batch counterpart of Coord3D. The coordinates are stored as one
+    (n, 3) array and every operation works on all of them at once. Indexing
+    with an int gives a Coord3D, anything else gives a new Coord3DArray.
+
+    Attributes:
+        xyz (NDArray[np.float64]): The (n, 3) coordinates.
+    """
+
+    __slots__ = ("xyz",)
+
+    xyz: NDArray[np.float64]
+
+    def __init__(self, xyz: NDArray[np.float64]):
+        self.xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_coords(cls, coords: Iterable[Coord3D]) -> Coord3DArray:
+        return cls(np.array([coord.to_list() for coord in coords], dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.xyz)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            x, y, z = self.xyz[key].tolist()
+            return Coord3D(x, y, z)
+
+        return Coord3DArray(self.xyz[key])
+
+    def __iter__(self) -> Iterator[Coord3D]:
+        for x, y, z in self.xyz.tolist():
+            yield Coord3D(x, y, z)
+
+    def __str__(self) -> str:
+        return f"Coord3DArray({len(self)} coordinates)"
+
+    @property
+    def x(self) -> NDArray[np.float64]:
+        return self.xyz[:, 0]
+
+    @property
+    def y(self) -> NDArray[np.float64]:
+        return self.xyz[:, 1]
+
+    @property
+    def z(self) -> NDArray[np.float64]:
+        return self.xyz[:, 2]
+
+    def to_lon_lat(self) -> CoordGeoArray:
+        """Converts the 3D coordinates into longitudes and latitudes."""
+        lon = np.degrees(np.arctan2(self.xyz[:, 1], self.xyz[:, 0]))
+        lat = np.degrees(np.arcsin(self.xyz[:, 2]))
+
+        return CoordGeoArray(lon, lat)
+
+    def to_ndarray(self) -> NDArray[np.float64]:
+        return self.xyz
+
+    def mid_point(self, o: Coord3DArray | Coord3D) -> Coord3DArray:
+        """The midpoints between these and other coordinates.
+
+        o is either an array of the same length or a single coordinate.
+        """
+        return Coord3DArray((self.xyz + _xyz_of(o)) / 2)
+
+    def dist(self, o: Coord3DArray | Coord3D) -> NDArray[np.float64]:
+        """The straight line (chord) distances to other coordinates."""
+        diff = self.xyz - _xyz_of(o)
+        return np.sqrt(np.sum(diff**2, axis=-1))
+
+    def great_circle_dist(self, o: Coord3DArray | Coord3D) -> NDArray[np.float64]:
+        """The angles in radians between these and other coordinates.
+
+        The coordinates are expected to be on the unit sphere.
+        """
+        return 2 * np.arcsin(np.clip(self.dist(o) / 2, 0, 1))
+
+    def centroid(self) -> Coord3D:
+        """The mean of the coordinates."""
+        x, y, z = self.xyz.mean(axis=0).tolist()
+        return Coord3D(x, y, z)
+
+    def centroids(self, offsets: NDArray[np.int64]) -> Coord3DArray:
+        """The mean of each group of consecutive coordinates.
+
+        :param offsets: The start of each group, with the total number of
+            coordinates as the last element, like LineSet.offsets.
+            Groups can not be empty.
+        """
+        if len(offsets) < 2:
+            return Coord3DArray(np.empty((0, 3), dtype=np.float64))
+
+        sums = np.add.reduceat(self.xyz, offsets[:-1], axis=0)
+        return Coord3DArray(sums / np.diff(offsets)[:, None])
+
+
+class CoordGeoArray:
+    """An array of longitudes and latitudes.
+
+    The batch counterpart of CoordGeo. The longitudes and latitudes are
+    stored as two separate arrays, like the columns of a LineSet. Indexing
+    with an int gives a CoordGeo, anything else gives a new CoordGeoArray.
+
+    Attributes:
+        lon (NDArray[np.float64]): The longitudes in degrees.
+        lat (NDArray[np.float64]): The latitudes in degrees.
+    """
+
+    __slots__ = ("lon", "lat")
+
+    lon: NDArray[np.float64]
+    lat: NDArray[np.float64]
+
+    def __init__(self, lon: NDArray[np.float64], lat: NDArray[np.float64]):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+
+    @classmethod
+    def from_coords(cls, coords: Iterable[CoordGeo]) -> CoordGeoArray:
+        lon_lat = np.array([coord.to_list() for coord in coords], dtype=np.float64).reshape(-1, 2)
+        return cls(lon_lat[:, 0], lon_lat[:, 1])
+
+    def __len__(self) -> int:
+        return len(self.lon)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return CoordGeo(float(self.lon[key]), float(self.lat[key]))
+
+        return CoordGeoArray(self.lon[key], self.lat[key])
+
+    def __iter__(self) -> Iterator[CoordGeo]:
+        for lon, lat in zip(self.lon.tolist(), self.lat.tolist()):
+            yield CoordGeo(lon, lat)
+
+    def __str__(self) -> str:
+        return f"CoordGeoArray({len(self)} coordinates)"
+
+    @property
+    def lon_lat(self) -> NDArray[np.float64]:
+        """The coordinates as an (n, 2) array of longitudes and latitudes."""
+        return np.stack((self.lon, self.lat), axis=-1)
+
+    def to_3D(self) -> Coord3DArray:
+        """Converts the longitudes and latitudes to 3D coordinates on the unit sphere."""
+        lon_r = np.radians(self.lon)
+        lat_r = np.radians(self.lat)
+        cos_lat = np.cos(lat_r)
+
+        return Coord3DArray(np.stack((cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)), axis=-1))
+
+    def to_list(self) -> List[List[float]]:
+        """Returns the coordinates as a list of [lon, lat] lists"""
+        return self.lon_lat.tolist()
+
+    def great_circle_dist(self, o: CoordGeoArray | CoordGeo) -> NDArray[np.float64]:
+        """The angles in radians between these and other coordinates."""
+        return self.to_3D().great_circle_dist(o.to_3D())
+
+    def centroid(self) -> CoordGeo:
+        """The centroid of the coordinates.
+
+        The mean of the 3D coordinates converted back to longitude and latitude.
+        """
+        return self.to_3D().centroid().to_lon_lat()
+
+
+def _xyz_of(o: Coord3DArray | Coord3D) -> NDArray[np.float64]:
+    if isinstance(o, Coord3DArray):
+        return o.xyz
+
+    return np.array([o.x, o.y, o.z], dtype=np.float64)
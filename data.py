@@ -1,24 +1,21 @@
-import math
-from typing import TypedDict
-from dataclasses import dataclass
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Literal, TypedDict
 
 from numpy._typing import NDArray
 
-from coords import Coord3D, CoordGeo
-from line_reader import Line, get_all_lines_in_ens, get_all_lines
+from coords import Coord3D
+from line_reader import LineSet, get_all_lines_in_ens, get_all_lines
+from shared_arrays import SharedArrays, SharedHandle
+import kernels
 
 import numpy as np
-from scipy.spatial.distance import cdist
-import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import KDTree
 
-from multiscale import IcoPoint, multiscale
-
-
-@dataclass(frozen=True)
-class Connection:
-    source: str
-    target: str
-    weight: float
+from multiscale import IcoPoint, IcoPointArrays, LinePointsDict, LinePointsMS, multiscale
 
 
 class TypedConnection(TypedDict):
@@ -37,105 +34,308 @@ class Network(TypedDict):
     node_clusters: dict[str, int]
 
 
+class SweepNetwork(TypedDict):
+    dist_threshold: float
+    required_ratio: float
+    network: Network
+
+
 EARTH_RADIUS = 6371
 
+# The fewest close pairs worth sending to a separate process in get_pair_ratios
+MIN_CHUNK_PAIRS = 20000
+
+
+def available_cores() -> int:
+    """The number of cores this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
 
 def distance(c1: Coord3D, c2: Coord3D):
-    return math.sqrt(
-        math.pow(c1.x - c2.x, 2) +
-        math.pow(c1.y - c2.y, 2) +
-        math.pow(c1.z - c2.z, 2)
-    )
+    return c1.dist(c2)
+
+
+def line_coords_3D(lines: LineSet) -> list[NDArray[np.float64]]:
+    '''
+    Gets the (n, 3) unit vectors of the points of each line.
+
+    The arrays are views into lines.xyz, so this is cheap, but looking them
+    up once is still much faster than slicing them again for every pair of lines.
+    '''
+
+    xyz = lines.xyz
+    offsets = lines.offsets.tolist()
+    return [xyz[offsets[i]:offsets[i + 1]] for i in range(len(lines))]
+
+
+def line_coords_ms(
+        lines: LineSet,
+        line_points_ms: LinePointsMS | LinePointsDict,
+        ms_level: int = 0,
+) -> list[NDArray[np.float64]]:
+    '''
+    Gets the unit vectors of the points of each line that are the closest
+    point of the line to an icopoint at a multiscale level.
+
+    Parameters
+    ----------
+    lines : the lines
+    line_points_ms : the multiscale points of the lines, see multiscale_arrays
+        The dicts returned by multiscale work as well.
+    ms_level : the multiscale level
+    '''
+
+    if isinstance(line_points_ms, dict):
+        return [
+            coords[[coord[0] for coord in line_points_ms[line_id][ms_level].values()]]
+            for coords, line_id in zip(line_coords_3D(lines), lines.ids)
+        ]
+
+    points = line_points_ms.levels[ms_level]
+    xyz = lines.xyz[lines.offsets[points["line"]] + points["point"]]
+    starts = line_points_ms.line_starts[ms_level].tolist()
+    return [xyz[starts[i]:starts[i + 1]] for i in range(len(lines))]
+
+
+def get_close_line_pairs(coords_ms_0: list[NDArray[np.float64]], threshold: float | int) -> NDArray[np.int64]:
+    '''
+    Finds all pairs of lines with multiscale level 0 points closer than the threshold.
+
+    See get_close_line_pair_dists.
+
+    Parameters
+    ----------
+    coords_ms_0 : the level 0 points of every line, see line_coords_ms
+    threshold : the distance in km between two points for their lines to be close
+
+    Returns
+    -------
+    The (n_pairs, 2) indices of the close lines. Every pair is included once,
+    with the smaller index first, and the pairs are sorted.
+    '''
+
+    close_pairs, _ = get_close_line_pair_dists(coords_ms_0, threshold)
+    return close_pairs
+
+
+def get_close_line_pair_dists(
+        coords_ms_0: list[NDArray[np.float64]],
+        threshold: float | int,
+) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+    '''
+    Finds all pairs of lines with multiscale level 0 points closer than the
+    threshold, and the distance between the closest level 0 points of each pair.
+
+    All multiscale level 0 points of all lines go into one KD-tree, and the
+    pairs of points closer than the threshold are found in a single query.
+    The tree is queried with a slightly larger radius and the distances of
+    the pairs it finds are then computed from the points, so the result does
+    not depend on rounding in the tree.
+
+    A pair is close at any smaller threshold if its distance is below it.
+
+    Parameters
+    ----------
+    coords_ms_0 : the level 0 points of every line, see line_coords_ms
+    threshold : the distance in km between two points for their lines to be close
+
+    Returns
+    -------
+    (close_pairs, dists) : the (n_pairs, 2) indices of the close lines, as
+        returned by get_close_line_pairs, and the distance in km of each pair
+    '''
 
+    if len(coords_ms_0) == 0:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float64)
 
-def nearby_check(coords1: list[Coord3D], coords2: list[Coord3D], max_dist: float) -> bool:
-    c1_start = coords1[0]
-    c2_start = coords2[0]
-    if distance(c1_start, c2_start) <= max_dist:
-        return True
+    points = np.concatenate(coords_ms_0)
+    point_lines = np.repeat(np.arange(len(coords_ms_0)), [len(coords) for coords in coords_ms_0])
 
-    c1_mid = coords1[len(coords1) // 2]
-    c2_mid = coords2[len(coords2) // 2]
-    if distance(c1_mid, c2_mid) <= max_dist:
-        return True
+    tree = KDTree(points)
+    point_pairs = tree.query_pairs(threshold / EARTH_RADIUS * (1 + 1e-9), output_type="ndarray")
 
-    c1_end = coords1[-1]
-    c2_end = coords2[-1]
-    return distance(c1_end, c2_end) <= max_dist
+    diff = points[point_pairs[:, 0]] - points[point_pairs[:, 1]]
+    dists = np.sqrt(np.sum(diff**2, axis=1)) * EARTH_RADIUS
+    close = dists < threshold
+    point_pairs, dists = point_pairs[close], dists[close]
 
+    line_pairs = np.sort(point_lines[point_pairs], axis=1).reshape(-1, 2)
+    different = line_pairs[:, 0] != line_pairs[:, 1]
+    line_pairs, dists = line_pairs[different], dists[different]
 
-def get_distances(line: Line, lines: list[Line], max_dist: float) -> NDArray[np.float32]:
+    # Keep the smallest distance of each pair
+    order = np.lexsort((dists, line_pairs[:, 1], line_pairs[:, 0]))
+    line_pairs, dists = line_pairs[order], dists[order]
+    first = np.ones(len(line_pairs), dtype=bool)
+    first[1:] = np.any(line_pairs[1:] != line_pairs[:-1], axis=1)
+
+    return line_pairs[first], dists[first]
+
+
+def get_pair_profiles(
+        coords_3D: list[NDArray[np.float64]],
+        close_pairs: NDArray[np.int64],
+        max_dist: float,
+) -> tuple[NDArray[np.float64], NDArray[np.int64]]:
     '''
-    Gets the distances from one line to all other lines.
-    Distance is calculated by calculating the distance of each
-    point in the line with the closest point in another line,
-    summing these up, and taking the average.
+    Finds the distance from every point of the lines of close pairs to the
+    nearest point of the other line of the pair, up to max_dist.
+
+    Only the points of the two lines of each pair are compared, see
+    kernels.nearest_chords, so points of the same line and of lines that are
+    not a close pair are never measured.
+
+    The ratio of line i to line j at any threshold up to max_dist is the number
+    of points of i whose distance to j is at most the threshold, divided by
+    the number of points of i. Distances are computed the same way
+    scipy's cdist does.
 
     Parameters
     ----------
-    line : the line to calculate from
-    lines : all lines (including "line")
+    coords_3D : the coordinates of every line, see line_coords_3D
+    close_pairs : the pairs of close lines, see get_close_line_pairs
+    max_dist : the largest distance in km to keep
 
     Returns
     -------
-    a list of distances between one line and all others
+    (chords, offsets) : the distances as chords on the unit sphere, sorted
+        within each pair and direction. The distances of direction d of pair k
+        are chords[offsets[2 * k + d]:offsets[2 * k + d + 1]], where direction 0
+        holds the points of the first line of the pair.
     '''
 
-    coords = [coord.to_3D() for coord in line.coords]
-    dists: list[list[float]] = []
+    if len(close_pairs) == 0:
+        return np.empty(0, dtype=np.float64), np.zeros(1, dtype=np.int64)
 
-    for line2 in lines:
-        coords2: list[Coord3D] = []
-        for coord in line2.coords:
-            coords2.append(coord.to_3D())
+    offsets = np.zeros(len(coords_3D) + 1, dtype=np.int64)
+    np.cumsum([len(coords) for coords in coords_3D], out=offsets[1:])
 
-        if not nearby_check(coords, coords2, max_dist * 3):
-            dists.append([])
-            continue
+    return kernels.nearest_chords(np.concatenate(coords_3D), offsets, close_pairs, max_dist / EARTH_RADIUS)
 
-        coords_ndarray = np.array([coord.to_ndarray() for coord in coords])
-        coords2_ndarray = np.array([coord.to_ndarray() for coord in coords2])
 
-        dists.append(np.min(cdist(coords_ndarray, coords2_ndarray), axis=1))
+def pair_close_counts_shared(
+        pair_range: tuple[int, int],
+        max_chord: float,
+        required_ratio: float,
+        handle: SharedHandle,
+) -> NDArray[np.int64]:
+    '''
+    Worker function of get_pair_ratios, runs kernels.pair_close_counts on the
+    pairs in pair_range of the shared points, offsets and close_pairs arrays.
+    '''
 
-    return np.array(dists)
+    with SharedArrays.attach(handle) as shared:
+        pairs = shared["close_pairs"][pair_range[0]:pair_range[1]]
+        return kernels.pair_close_counts(shared["points"], shared["offsets"], pairs, max_chord, required_ratio)
 
-def get_close_lines(
-        line: Line,
-        lines: list[Line],
-        ico_points_ms: dict[int, IcoPoint],
-        line_points_ms: dict[str, dict[int, dict[int, tuple[int, float]]]],
-        threshold: float | int
-) -> list[Line]:
-    line_coords_ms_0_idx = line_points_ms[line.id][0]
-    line_coords_ms_0 = [line.coords[coord[0]].to_3D().to_ndarray() for coord in line_coords_ms_0_idx.values()]
 
-    close_lines: list[Line] = []
+def get_pair_ratios(
+        coords_3D: list[NDArray[np.float64]],
+        close_pairs: NDArray[np.int64],
+        max_dist: float,
+        max_workers: int | None = 1,
+        required_ratio: float = 0.0,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    '''
+    Computes the ratio of close points in both directions of close pairs of lines.
 
-    for line_2 in lines:
-        if line_2.id == line.id:
-            continue
+    The ratio of line i to line j is the share of the points of i with a
+    point on j within max_dist km. Distances are computed the same way
+    scipy's cdist does.
 
-        line_2_coords_ms_0_idx = line_points_ms[line_2.id][0]
-        line_2_coords_ms_0 = [line_2.coords[coord[0]].to_3D().to_ndarray() for coord in line_2_coords_ms_0_idx.values()]
-        dists = np.min(cdist(line_coords_ms_0, line_2_coords_ms_0), axis=1) * EARTH_RADIUS
-        
-        if np.any(dists < threshold):
-            close_lines.append(line_2)
+    In a single process the pairs are counted by kernels.pair_close_counts,
+    which stops looking for a close point at the first one found, and stops
+    counting a direction once its ratio can no longer reach required_ratio.
+    Most close pairs are far below it, so this skips most of the comparisons.
 
-    return close_lines
+    With more than one worker the pairs are split into chunks needing about
+    the same number of comparisons at most, which are counted the same way by
+    a pool of processes reading the points from shared memory. The counts of
+    the chunks are joined in order, so the result does not depend on the
+    number of workers.
 
+    Parameters
+    ----------
+    coords_3D : the coordinates of every line, see line_coords_3D
+    close_pairs : the (n_pairs, 2) pairs of close lines with the smaller index first,
+        see get_close_line_pairs
+    max_dist : the distance in km for two points to be close
+    max_workers : the number of processes to use, None uses one per available core
+        No more workers than available cores are used, and inputs with fewer
+        than MIN_CHUNK_PAIRS pairs per worker use fewer workers.
+    required_ratio : the ratio below which the exact ratio is not needed
 
-def get_centroids(lines: list[Line]) -> list[CoordGeo]:
-    return [line.centroid for line in lines]
+    Returns
+    -------
+    (ratios_ij, ratios_ji) : the ratio of the first line of each pair to the
+        second, and of the second to the first. Ratios below required_ratio
+        may be NaN instead.
+    '''
+
+    if len(close_pairs) == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+    lengths = np.array([len(coords) for coords in coords_3D], dtype=np.int64)
+    offsets = np.zeros(len(coords_3D) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.concatenate(coords_3D)
+    max_chord = max_dist / EARTH_RADIUS
+
+    order = np.lexsort((close_pairs[:, 1], close_pairs[:, 0]))
+    sorted_pairs = close_pairs[order]
+
+    n_cores = available_cores()
+    n_chunks = min(max_workers or n_cores, n_cores, len(close_pairs) // MIN_CHUNK_PAIRS)
+    if n_chunks <= 1:
+        counts = kernels.pair_close_counts(points, offsets, sorted_pairs, max_chord, required_ratio)
+    else:
+        # Split the pairs by the number of point comparisons they need at most
+        work = np.cumsum(lengths[sorted_pairs[:, 0]] * lengths[sorted_pairs[:, 1]])
+        bounds = np.unique(np.concatenate((
+            [0], np.searchsorted(work, np.linspace(0, work[-1], n_chunks + 1)[1:-1]), [len(sorted_pairs)],
+        ))).tolist()
+        with SharedArrays({
+            "points": (points.shape, points.dtype),
+            "offsets": (offsets.shape, offsets.dtype),
+            "close_pairs": (sorted_pairs.shape, sorted_pairs.dtype),
+        }) as shared:
+            shared["points"][:] = points
+            shared["offsets"][:] = offsets
+            shared["close_pairs"][:] = sorted_pairs
+
+            with ProcessPoolExecutor(max_workers=n_chunks) as executor:
+                process_func = partial(
+                    pair_close_counts_shared,
+                    max_chord=max_chord,
+                    required_ratio=required_ratio,
+                    handle=shared.handle(),
+                )
+                counts = np.concatenate(list(executor.map(process_func, zip(bounds[:-1], bounds[1:]))))
+
+    ratios_ij = np.empty(len(close_pairs), dtype=np.float64)
+    ratios_ji = np.empty(len(close_pairs), dtype=np.float64)
+    ratios_ij[order] = np.where(counts[:, 0] < 0, np.nan, counts[:, 0] / lengths[sorted_pairs[:, 0]])
+    ratios_ji[order] = np.where(counts[:, 1] < 0, np.nan, counts[:, 1] / lengths[sorted_pairs[:, 1]])
+
+    return ratios_ij, ratios_ji
+
+
+def get_centroids(lines: LineSet) -> list[dict[str, float]]:
+    """The centroid of each line as a JSON serializable dict."""
+    return [line.centroid.to_dict() for line in lines]
 
 
 def generate_network(
-        lines: list[Line],
-        ico_points_ms: dict[int, IcoPoint],
-        line_points_ms: dict[str, dict[int, dict[int, tuple[int, float]]]],
+        lines: LineSet,
+        ico_points_ms: dict[int, IcoPoint] | IcoPointArrays,
+        line_points_ms: LinePointsMS | LinePointsDict,
         max_dist: int,
         required_ratio: float,
+        edge_weight: Literal["last", "max", "min", "mean"] = "last",
+        max_workers: int | None = 1,
 ) -> Network:
     '''
     Generates a network given a list of lines and a max distance
@@ -143,76 +343,217 @@ def generate_network(
 
     Parameters
     ----------
-    lines : a list of the lines to be individual nodes
+    lines : the lines to be individual nodes
     max_dist : the maximum distance for two nodes to be linked
+    edge_weight : how the weight of an edge is chosen from the ratios of its two directions
+        Two lines are linked if the ratio in either direction is at least required_ratio.
+        "last" keeps the weight of the last linked direction, the ratio of the second line
+        to the first if it is linked and else of the first to the second, like the weight
+        networkx used to keep. "max", "min" and "mean" combine both ratios.
+    max_workers : the number of processes computing the ratios, see get_pair_ratios
 
     Returns
     -------
     [{ nodes, links }] : A list of nodes and links representing the network
     '''
 
-    connections: set[Connection] = set()
+    # The coordinates of every line and its multiscale points are looked up
+    # once here instead of for every pair of lines
+    coords_3D = line_coords_3D(lines)
+    coords_ms_0 = line_coords_ms(lines, line_points_ms, 0)
+
+    close_pairs = get_close_line_pairs(coords_ms_0, max_dist * 10)
+    # Only "last" can do without the exact ratio of directions that are not linked
+    skip_below = required_ratio if edge_weight == "last" else 0.0
+    ratios_ij, ratios_ji = get_pair_ratios(coords_3D, close_pairs, max_dist, max_workers, skip_below)
+
+    # NODES WITH NO CONNECTIONS ARENT ADDED
+    edges, weights = link_pairs(close_pairs, ratios_ij, ratios_ji, required_ratio, edge_weight)
+
+    return cluster_network(lines, edges, weights)
+
+
+def link_pairs(
+        close_pairs: NDArray[np.int64],
+        ratios_ij: NDArray[np.float64],
+        ratios_ji: NDArray[np.float64],
+        required_ratio: float,
+        edge_weight: Literal["last", "max", "min", "mean"] = "last",
+) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+    '''
+    Picks the close pairs of lines that are linked and the weights of their edges.
+
+    See generate_network for required_ratio and edge_weight.
+
+    Returns
+    -------
+    (edges, weights) : the (n_edges, 2) indices of the linked lines and the weight of each edge
+    '''
+
+    linked_ij = ratios_ij >= required_ratio
+    linked_ji = ratios_ji >= required_ratio
+    linked = linked_ij | linked_ji
+    if edge_weight == "last":
+        weights = np.where(linked_ji, ratios_ji, ratios_ij)
+    else:
+        combine = {"max": np.maximum, "min": np.minimum, "mean": lambda a, b: (a + b) / 2}[edge_weight]
+        weights = combine(ratios_ij, ratios_ji)
 
-    # bar = alive_it(lines, title="Generating network")
-    for line in lines:
+    return close_pairs[linked], weights[linked]
 
-        close_lines = get_close_lines(line, lines, ico_points_ms, line_points_ms, max_dist * 10)
-        dists = get_distances(line, close_lines, max_dist)
 
-        ratios: list[float] = []
-        for dist in dists:
-            ratios.append(np.sum(dist <= max_dist / EARTH_RADIUS) / len(dist))
+def cluster_network(lines: LineSet, edges: NDArray[np.int64], weights: NDArray[np.float64]) -> Network:
+    '''
+    Splits the lines linked by edges into clusters.
 
-        # NODES WITH NO CONNECTIONS ARENT ADDED
-        for i, ratio in enumerate(ratios):
-            if ratio < required_ratio:
-                continue
+    The clusters are the connected components of the graph of the edges, and
+    lines without edges are not part of any cluster. A cluster can only hold
+    one line of each ensemble member, or of each time if the lines are
+    identified by time, see LineSet.id_field. The edges of a cluster are
+    visited in order, and an edge is dropped if it links a member another line
+    of the cluster has been picked for already, see kernels.first_line_per_group.
+    Lines that are not picked have cluster -1.
 
-            connections.add(Connection(source=line.id,
-                                       target=close_lines[i].id,
-                                       weight=ratio))
+    Parameters
+    ----------
+    lines : the lines to be individual nodes
+    edges : the (n_edges, 2) indices of the lines of each edge
+    weights : the weight of each edge
 
-    clusters: dict[int, list[TypedConnection]] = {}
-    node_to_cluster: dict[str, int] = {}
+    Returns
+    -------
+    The network of the lines
+    '''
+
+    ids = lines.ids
+    n_lines = len(lines)
 
-    G: nx.Graph[str] = nx.Graph()
-    for conn in connections:
-        G.add_edge(conn.source, conn.target, weight=conn.weight)    # type: ignore
+    graph = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n_lines, n_lines))
+    n_components, components = csgraph.connected_components(graph, directed=False)
+    has_edges = np.zeros(n_lines, dtype=bool)
+    has_edges[edges.ravel()] = True
 
-    # communities = list(nx.connected_components(G))   # type: ignore
-    # Attempts the same cluster ids for each run
-    communities = sorted(nx.connected_components(G), key=lambda x: min(x), reverse=True)
+    # Attempts the same cluster ids for each run, the clusters are ordered by
+    # their smallest line id, descending
+    id_ranks = np.empty(n_lines, dtype=np.int64)
+    id_ranks[np.argsort(np.array(ids, dtype=str))] = np.arange(n_lines)
+    min_ranks = np.full(n_components, n_lines, dtype=np.int64)
+    np.minimum.at(min_ranks, components[has_edges], id_ranks[has_edges])
+    linked_components = np.unique(components[has_edges])
+    component_clusters = np.full(n_components, -1, dtype=np.int64)
+    component_clusters[linked_components[np.argsort(-min_ranks[linked_components])]] = np.arange(len(linked_components))
+    line_clusters = component_clusters[components]
 
-    for i, cluster in enumerate(communities):   # type: ignore
-        sub_graph = G.subgraph(cluster)
-        clusters[i] = []
+    _, line_groups = np.unique(lines.ens_ids if lines.id_field == "ens" else lines.times, return_inverse=True)
+    n_clusters = len(linked_components)
+    edge_clusters = line_clusters[edges[:, 0]]
+    keep, picked = kernels.first_line_per_group(edges, edge_clusters, line_groups, n_clusters, int(line_groups.max(initial=0)) + 1)
 
-        added_ens_members = {}
-        for edge in sub_graph.edges(data=True):
-            ens_id0, line_id0 = edge[0].split("|")
-            ens_id1, line_id1 = edge[1].split("|")
-            if (ens_id0 not in added_ens_members or added_ens_members[ens_id0] == line_id0) and (ens_id1 not in added_ens_members or added_ens_members[ens_id1] == line_id1):
-                clusters[i].append(TypedConnection(source=edge[0], target=edge[1], weight=edge[2]["weight"]))
-                added_ens_members[ens_id0] = line_id0
-                added_ens_members[ens_id1] = line_id1
+    clusters: dict[int, list[TypedConnection]] = {i: [] for i in range(n_clusters)}
+    for cluster, source, target, weight in zip(edge_clusters[keep].tolist(), edges[keep, 0].tolist(), edges[keep, 1].tolist(), weights[keep].tolist()):
+        clusters[cluster].append(TypedConnection(source=ids[source], target=ids[target], weight=weight))
 
-        # clusters[i] = [TypedConnection(source=edge[0], target=edge[1], weight=edge[2]["weight"]) for edge in sub_graph.edges(data=True)]
-        for node in cluster:
-            ens_id, line_id = node.split("|")
-            if ens_id in added_ens_members and added_ens_members[ens_id] == line_id:
-                node_to_cluster[node] = i
-            else:
-                node_to_cluster[node] = -1
+    is_picked = np.zeros(n_lines, dtype=bool)
+    is_picked[has_edges] = picked[line_clusters[has_edges], line_groups[has_edges]] == np.flatnonzero(has_edges)
+    node_to_cluster = dict(zip(ids, np.where(is_picked, line_clusters, -1).tolist()))
 
-    nodes: list[Node] = []
-    for line in lines:
-        if line.id not in node_to_cluster:
-            node_to_cluster[line.id] = -1
-        nodes.append({"id": line.id})
+    nodes: list[Node] = [{"id": line_id} for line_id in ids]
 
     return {"nodes": nodes, "clusters": clusters, "node_clusters": node_to_cluster}
 
 
+class NetworkSweep:
+    """The networks of a set of lines for any distance threshold up to max_dist.
+
+    The geometry generate_network needs is the distance from each point of a
+    close pair of lines to the nearest point of the other line. The sweep
+    finds these once for the close pairs at max_dist, so the network for any
+    smaller threshold and any required ratio only takes thresholding arrays
+    and finding the clusters. The networks are the same as those from
+    generate_network.
+
+    Attributes:
+        lines (LineSet): The lines of the networks.
+        max_dist (float): The largest distance threshold in km.
+        close_pairs (NDArray[np.int64]): The close pairs of lines at max_dist.
+        pair_dists (NDArray[np.float64]): The distance of each pair, see
+            get_close_line_pair_dists.
+        chords (NDArray[np.float64]): The distance profiles of the pairs, see
+            get_pair_profiles.
+        chord_offsets (NDArray[np.int64]): The start of the sorted distances of
+            each pair and direction, 2 * pair + direction, in chords.
+    """
+
+    lines: LineSet
+    max_dist: float
+    close_pairs: NDArray[np.int64]
+    pair_dists: NDArray[np.float64]
+    chords: NDArray[np.float64]
+    chord_offsets: NDArray[np.int64]
+
+    def __init__(
+        self,
+        lines: LineSet,
+        line_points_ms: LinePointsMS | LinePointsDict,
+        max_dist: float,
+    ) -> None:
+        self.lines = lines
+        self.max_dist = max_dist
+
+        self.close_pairs, self.pair_dists = get_close_line_pair_dists(line_coords_ms(lines, line_points_ms, 0), max_dist * 10)
+        self.chords, self.chord_offsets = get_pair_profiles(line_coords_3D(lines), self.close_pairs, max_dist)
+
+    def ratios(self, dist_threshold: float) -> tuple[NDArray[np.int64], NDArray[np.float64], NDArray[np.float64]]:
+        """Computes the ratios of the close pairs of lines at a distance threshold.
+
+        :param dist_threshold: The distance in km for two points to be close,
+            at most max_dist.
+        :return: (close_pairs, ratios_ij, ratios_ji) : the close pairs at the
+            threshold and their ratios, see get_pair_ratios
+        """
+        if dist_threshold > self.max_dist:
+            raise ValueError(f"The sweep only holds thresholds up to {self.max_dist}, got {dist_threshold}")
+
+        close = self.pair_dists < dist_threshold * 10
+        counts = kernels.segment_counts(self.chords, self.chord_offsets, dist_threshold / EARTH_RADIUS).reshape(-1, 2)[close]
+        close_pairs = self.close_pairs[close]
+        lengths = self.lines.lengths
+
+        return close_pairs, counts[:, 0] / lengths[close_pairs[:, 0]], counts[:, 1] / lengths[close_pairs[:, 1]]
+
+    def network(
+        self,
+        dist_threshold: float,
+        required_ratio: float,
+        edge_weight: Literal["last", "max", "min", "mean"] = "last",
+    ) -> Network:
+        """Gets the network at a distance threshold and required ratio, see generate_network."""
+        close_pairs, ratios_ij, ratios_ji = self.ratios(dist_threshold)
+        edges, weights = link_pairs(close_pairs, ratios_ij, ratios_ji, required_ratio, edge_weight)
+
+        return cluster_network(self.lines, edges, weights)
+
+    def networks(
+        self,
+        dist_thresholds: list[float],
+        required_ratios: list[float],
+        edge_weight: Literal["last", "max", "min", "mean"] = "last",
+    ) -> list[SweepNetwork]:
+        """Gets the networks of every combination of distance threshold and required ratio."""
+        networks: list[SweepNetwork] = []
+        for dist_threshold in dist_thresholds:
+            close_pairs, ratios_ij, ratios_ji = self.ratios(dist_threshold)
+            for required_ratio in required_ratios:
+                edges, weights = link_pairs(close_pairs, ratios_ij, ratios_ji, required_ratio, edge_weight)
+                networks.append(SweepNetwork(
+                    dist_threshold=dist_threshold,
+                    required_ratio=required_ratio,
+                    network=cluster_network(self.lines, edges, weights),
+                ))
+
+        return networks
+
+
 if __name__ == "__main__":
     lines = get_all_lines("2024101900", "jet")
     ico_points_ms, line_points_ms = multiscale(lines[0], 2)
@@ -0,0 +1,245 @@
+"""A fixed, multi-level subdivided icosphere.
+
+Level 0 is the icosahedron returned by icosphere(). Each level splits every
+triangle of the level above into four at the midpoints of its edges, with
+the midpoints moved out onto the unit sphere. The vertices of all levels are
+stored in one array, ordered by level, so the vertices of levels 0 to L are
+the first level_ends[L] of them and the id of a vertex is the same at every
+level, in every call and for every timestep.
+
+The hierarchy is built once and written to ICO_HIERARCHY_PATH with
+line_cache.write_arrays. Later calls, in any process, map the file read-only.
+The KD-trees over the vertices of each level are built from the mapped
+vertices the first time a level is used in a process.
+"""
+from __future__ import annotations
+
+from functools import cached_property
+import os
+from typing import Any
+
+from icosphere import icosphere
+import numpy as np
+from numpy.typing import NDArray
+from scipy.spatial import KDTree
+
+from coords import Coord3DArray
+from line_cache import read_arrays, write_arrays
+
+
+# Bump when the layout or content of the stored hierarchy changes
+ICO_HIERARCHY_VERSION = 1
+
+ICO_HIERARCHY_PATH = "./internal_data/icosphere.cache"
+
+# The number of levels below the icosahedron built when none is asked for.
+# Level 5 has 10242 vertices, about 220 km apart, and each level halves that.
+DEFAULT_MAX_LEVEL = 5
+
+# Hierarchies loaded by this process, by path
+_loaded_hierarchies: dict[str, IcoHierarchy] = {}
+
+
+class IcoHierarchy:
+    """The vertices and triangles of an icosphere at every subdivision level.
+
+    Attributes:
+        xyz (NDArray[np.float64]): The (n, 3) unit vectors of all vertices,
+            ordered by level. The index of a vertex is its id.
+        levels (NDArray[np.int64]): The level each vertex first appears at.
+        parents (NDArray[np.int64]): The (n, 2) ids of the ends of the edge
+            each vertex was subdivided from, lowest first, or -1 for the
+            vertices of the icosahedron.
+        level_ends (NDArray[np.int64]): The number of vertices of each level,
+            including those of the levels above it.
+        faces (NDArray[np.int64]): The (m, 3) triangles of all levels.
+        face_ends (NDArray[np.int64]): The end of the triangles of each
+            level in faces. The triangles of level L are
+            faces[face_ends[L - 1]:face_ends[L]], starting at 0 for level 0.
+    """
+
+    xyz: NDArray[np.float64]
+    levels: NDArray[np.int64]
+    parents: NDArray[np.int64]
+    level_ends: NDArray[np.int64]
+    faces: NDArray[np.int64]
+    face_ends: NDArray[np.int64]
+    trees: dict[int, KDTree]
+
+    def __init__(
+        self,
+        xyz: NDArray[np.float64],
+        levels: NDArray[np.int64],
+        parents: NDArray[np.int64],
+        level_ends: NDArray[np.int64],
+        faces: NDArray[np.int64],
+        face_ends: NDArray[np.int64],
+    ) -> None:
+        self.xyz = xyz
+        self.levels = levels
+        self.parents = parents
+        self.level_ends = level_ends
+        self.faces = faces
+        self.face_ends = face_ends
+        self.trees = {}
+
+    @classmethod
+    def build(cls, max_level: int) -> IcoHierarchy:
+        """Subdivides the icosahedron max_level times.
+
+        The midpoints of each level are numbered in the order of their
+        edges, sorted by the ids of their ends.
+        """
+        xyz, faces = icosphere()
+        xyz = np.asarray(xyz, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64)
+
+        all_xyz = [xyz]
+        all_faces = [faces]
+        levels = [np.zeros(len(xyz), dtype=np.int64)]
+        parents = [np.full((len(xyz), 2), -1, dtype=np.int64)]
+        n_vertices = len(xyz)
+
+        for level in range(1, max_level + 1):
+            # The three edges of each face, as (face, edge) -> unique edge
+            face_edges = np.sort(faces[:, [[0, 1], [1, 2], [2, 0]]], axis=2)
+            edges, edge_index = np.unique(face_edges.reshape(-1, 2), axis=0, return_inverse=True)
+            mids = n_vertices + edge_index.reshape(-1, 3)
+
+            vertices = np.concatenate(all_xyz)
+            mid_xyz = vertices[edges[:, 0]] + vertices[edges[:, 1]]
+            mid_xyz /= np.linalg.norm(mid_xyz, axis=1, keepdims=True)
+
+            a, b, c = faces.T
+            ab, bc, ca = mids.T
+            faces = np.stack([
+                np.stack([a, ab, ca], axis=1),
+                np.stack([ab, b, bc], axis=1),
+                np.stack([ca, bc, c], axis=1),
+                np.stack([ab, bc, ca], axis=1),
+            ], axis=1).reshape(-1, 3)
+
+            all_xyz.append(mid_xyz)
+            all_faces.append(faces)
+            levels.append(np.full(len(edges), level, dtype=np.int64))
+            parents.append(edges)
+            n_vertices += len(edges)
+
+        return cls(
+            xyz=np.concatenate(all_xyz),
+            levels=np.concatenate(levels),
+            parents=np.concatenate(parents),
+            level_ends=np.cumsum([len(level_xyz) for level_xyz in all_xyz]),
+            faces=np.concatenate(all_faces),
+            face_ends=np.cumsum([len(level_faces) for level_faces in all_faces]),
+        )
+
+    @property
+    def max_level(self) -> int:
+        return len(self.level_ends) - 1
+
+    def level_xyz(self, level: int) -> NDArray[np.float64]:
+        """The vertices of a level."""
+        return self.xyz[:self.level_ends[level]]
+
+    def level_faces(self, level: int) -> NDArray[np.int64]:
+        """The triangles of a level."""
+        start = self.face_ends[level - 1] if level > 0 else 0
+        return self.faces[start:self.face_ends[level]]
+
+    @cached_property
+    def edge_keys(self) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+        """The int64 keys of the edges the vertices were subdivided from, see midpoints.
+
+        :return: (keys, vertices) : the sorted keys and the vertex of each key
+        """
+        subdivided = np.flatnonzero(self.levels > 0)
+        keys = self.parents[subdivided, 0] * len(self.xyz) + self.parents[subdivided, 1]
+        order = np.argsort(keys)
+
+        return keys[order], subdivided[order]
+
+    def midpoints(self, edges: NDArray[np.int64]) -> NDArray[np.int64]:
+        """Finds the vertices subdivided from edges.
+
+        :param edges: The (m, 2) ids of the ends of the edges, in any order.
+        :return: The id of the midpoint of each edge, or -1 for those that
+            are not edges of any level.
+        """
+        edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+        keys, vertices = self.edge_keys
+        query = edges[:, 0] * len(self.xyz) + edges[:, 1]
+
+        if len(keys) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+
+        found = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return np.where(keys[found] == query, vertices[found], -1)
+
+    def tree(self, level: int) -> KDTree:
+        """The KD-tree over the vertices of a level."""
+        if level not in self.trees:
+            self.trees[level] = KDTree(self.level_xyz(level))
+
+        return self.trees[level]
+
+    def closest(self, xyz: NDArray[np.float64], level: int) -> tuple[NDArray[np.float64], NDArray[np.int64]]:
+        """Finds the closest vertex of a level to each point.
+
+        :param xyz: The (n, 3) points.
+        :param level: The level.
+        :return: (dists, ids) : the chord distance to and the id of the closest vertex
+        """
+        dists, ids = self.tree(level).query(xyz)
+        return dists, ids.astype(np.int64)
+
+    def to_lon_lat(self, level: int) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """The longitudes and latitudes of the vertices of a level."""
+        coords_geo = Coord3DArray(self.level_xyz(level)).to_lon_lat()
+        return coords_geo.lon, coords_geo.lat
+
+    def arrays(self) -> dict[str, NDArray[Any]]:
+        return {
+            "xyz": self.xyz,
+            "levels": self.levels,
+            "parents": self.parents,
+            "level_ends": self.level_ends,
+            "faces": self.faces,
+            "face_ends": self.face_ends,
+        }
+
+
+def load_ico_hierarchy(max_level: int = DEFAULT_MAX_LEVEL, path: str = ICO_HIERARCHY_PATH) -> IcoHierarchy:
+    """Gets an icosphere hierarchy with at least max_level levels below the icosahedron.
+
+    The hierarchy is read from path, and built and written there if the file
+    is missing, from another version or has fewer levels. If the file can
+    not be written the built hierarchy is returned directly.
+
+    :param max_level: The deepest level needed.
+    :param path: The path of the hierarchy file.
+    :return: The hierarchy, shared by all callers in this process.
+    """
+    hierarchy = _loaded_hierarchies.get(path)
+    if hierarchy is not None and hierarchy.max_level >= max_level:
+        return hierarchy
+
+    if os.path.exists(path):
+        meta, arrays = read_arrays(path)
+        if meta.get("version") == ICO_HIERARCHY_VERSION and meta.get("max_level", -1) >= max_level:
+            hierarchy = IcoHierarchy(**arrays)
+            _loaded_hierarchies[path] = hierarchy
+            return hierarchy
+
+    hierarchy = IcoHierarchy.build(max(max_level, DEFAULT_MAX_LEVEL))
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write_arrays(path, hierarchy.arrays(), {"version": ICO_HIERARCHY_VERSION, "max_level": hierarchy.max_level})
+    except OSError:
+        return hierarchy
+
+    _, arrays = read_arrays(path)
+    hierarchy = IcoHierarchy(**arrays)
+    _loaded_hierarchies[path] = hierarchy
+
+    return hierarchy
@@ -0,0 +1,243 @@
+"""Compiled kernels for comparing lines point by point.
+
+The points of the lines are (n, 3) unit vectors, and the points of line i
+are points[offsets[i]:offsets[i + 1]], see LineSet. Distances are computed
+the same way scipy's cdist does, so the results match those of data.py.
+"""
+import math
+
+import numpy as np
+from numba import njit
+from numpy.typing import NDArray
+
+
+@njit(cache=True)
+def chord(points1: NDArray[np.float64], p: int, points2: NDArray[np.float64], q: int) -> float:
+    dx = points1[p, 0] - points2[q, 0]
+    dy = points1[p, 1] - points2[q, 1]
+    dz = points1[p, 2] - points2[q, 2]
+    return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+@njit(cache=True)
+def count_close_points(
+    points: NDArray[np.float64],
+    start1: int,
+    end1: int,
+    start2: int,
+    end2: int,
+    max_chord: float,
+    required_ratio: float,
+) -> int:
+    """Counts the points in [start1, end1) with a point in [start2, end2) within max_chord.
+
+    The search for a close point stops at the first one found. The count
+    stops as soon as the ratio of close points can no longer reach
+    required_ratio, even if all remaining points were close.
+
+    :return: The number of close points, or -1 if the ratio is below required_ratio.
+    """
+    n = end1 - start1
+    hits = 0
+    for p in range(start1, end1):
+        for q in range(start2, end2):
+            if chord(points, p, points, q) <= max_chord:
+                hits += 1
+                break
+
+        if (hits + end1 - p - 1) / n < required_ratio:
+            return -1
+
+    return hits
+
+
+@njit(cache=True)
+def count_close_points_both(
+    points: NDArray[np.float64],
+    start1: int,
+    end1: int,
+    start2: int,
+    end2: int,
+    max_chord: float,
+    close2: NDArray[np.bool_],
+) -> tuple[int, int]:
+    """Counts the close points of [start1, end1) and [start2, end2) to each other in one pass.
+
+    Every pair of points is compared at most once, and a pair is skipped if
+    both of its points are known to be close already.
+
+    :param close2: Scratch space of at least end2 - start2 elements.
+    :return: (hits1, hits2) : the number of points of each range with a
+        point of the other within max_chord
+    """
+    n2 = end2 - start2
+    close2[:n2] = False
+    hits1 = 0
+    hits2 = 0
+    for p in range(start1, end1):
+        found = False
+        for q in range(n2):
+            if found and close2[q]:
+                continue
+
+            if chord(points, p, points, start2 + q) <= max_chord:
+                found = True
+                if not close2[q]:
+                    close2[q] = True
+                    hits2 += 1
+
+        if found:
+            hits1 += 1
+
+    return hits1, hits2
+
+
+@njit(cache=True)
+def pair_close_counts(
+    points: NDArray[np.float64],
+    offsets: NDArray[np.int64],
+    pairs: NDArray[np.int64],
+    max_chord: float,
+    required_ratio: float,
+) -> NDArray[np.int64]:
+    """Counts the close points in both directions of pairs of lines.
+
+    If every exact count is needed, required_ratio <= 0, both directions are
+    counted in one pass, see count_close_points_both. Otherwise each direction
+    is counted on its own so it can stop early, see count_close_points.
+
+    :return: The (n_pairs, 2) number of points of the first line close to the
+        second and of the second close to the first, see count_close_points.
+    """
+    counts = np.empty((len(pairs), 2), dtype=np.int64)
+    if required_ratio <= 0:
+        close2 = np.empty(int(np.max(np.diff(offsets))) if len(offsets) > 1 else 0, dtype=np.bool_)
+        for k in range(len(pairs)):
+            i, j = pairs[k, 0], pairs[k, 1]
+            counts[k, 0], counts[k, 1] = count_close_points_both(points, offsets[i], offsets[i + 1], offsets[j], offsets[j + 1], max_chord, close2)
+
+        return counts
+
+    for k in range(len(pairs)):
+        i, j = pairs[k, 0], pairs[k, 1]
+        counts[k, 0] = count_close_points(points, offsets[i], offsets[i + 1], offsets[j], offsets[j + 1], max_chord, required_ratio)
+        counts[k, 1] = count_close_points(points, offsets[j], offsets[j + 1], offsets[i], offsets[i + 1], max_chord, required_ratio)
+
+    return counts
+
+
+@njit(cache=True)
+def line_bounds(points: NDArray[np.float64], offsets: NDArray[np.int64]) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """The mean of the points of each line and the largest chord from it to a point of the line."""
+    n_lines = len(offsets) - 1
+    centers = np.zeros((n_lines, 3), dtype=np.float64)
+    radii = np.zeros(n_lines, dtype=np.float64)
+    for i in range(n_lines):
+        start, end = offsets[i], offsets[i + 1]
+        for p in range(start, end):
+            centers[i] += points[p]
+        centers[i] /= max(end - start, 1)
+        for p in range(start, end):
+            radii[i] = max(radii[i], chord(points, p, centers, i))
+
+    return centers, radii
+
+
+@njit(cache=True)
+def nearest_chords(
+    points: NDArray[np.float64],
+    offsets: NDArray[np.int64],
+    pairs: NDArray[np.int64],
+    max_chord: float,
+) -> tuple[NDArray[np.float64], NDArray[np.int64]]:
+    """Finds the chord from each point of the lines of pairs to the nearest point of the other line.
+
+    Points whose nearest point is further than max_chord are left out, and
+    points too far from the bounds of the other line to have any point
+    within max_chord, see line_bounds, are not compared to its points.
+
+    :return: (chords, chord_offsets) : the chords, sorted within each pair and
+        direction. The chords of direction d of pair k are
+        chords[chord_offsets[2 * k + d]:chord_offsets[2 * k + d + 1]], where
+        direction 0 holds the points of the first line of the pair.
+    """
+    centers, radii = line_bounds(points, offsets)
+    # A little slack, so no point is skipped because of rounding
+    skip_chord = max_chord * (1 + 1e-9)
+
+    size = 0
+    for k in range(len(pairs)):
+        i, j = pairs[k, 0], pairs[k, 1]
+        size += offsets[i + 1] - offsets[i] + offsets[j + 1] - offsets[j]
+
+    chords = np.empty(size, dtype=np.float64)
+    chord_offsets = np.zeros(2 * len(pairs) + 1, dtype=np.int64)
+    n = 0
+    for k in range(len(pairs)):
+        for d in range(2):
+            i, j = pairs[k, d], pairs[k, 1 - d]
+            start = n
+            for p in range(offsets[i], offsets[i + 1]):
+                if chord(points, p, centers, j) - radii[j] > skip_chord:
+                    continue
+
+                nearest = np.inf
+                for q in range(offsets[j], offsets[j + 1]):
+                    nearest = min(nearest, chord(points, p, points, q))
+
+                if nearest <= max_chord:
+                    chords[n] = nearest
+                    n += 1
+
+            chords[start:n] = np.sort(chords[start:n])
+            chord_offsets[2 * k + d + 1] = n
+
+    return chords[:n].copy(), chord_offsets
+
+
+@njit(cache=True)
+def segment_counts(values: NDArray[np.float64], offsets: NDArray[np.int64], threshold: float) -> NDArray[np.int64]:
+    """Counts the values of each sorted segment values[offsets[s]:offsets[s + 1]] that are at most threshold."""
+    counts = np.empty(len(offsets) - 1, dtype=np.int64)
+    for s in range(len(counts)):
+        counts[s] = np.searchsorted(values[offsets[s]:offsets[s + 1]], threshold, side="right")
+
+    return counts
+
+
+@njit(cache=True)
+def first_line_per_group(
+    edges: NDArray[np.int64],
+    edge_clusters: NDArray[np.int64],
+    node_groups: NDArray[np.int64],
+    n_clusters: int,
+    n_groups: int,
+) -> tuple[NDArray[np.bool_], NDArray[np.int64]]:
+    """Keeps the edges of each cluster that link at most one line of each group.
+
+    The edges are visited in order, and an edge is kept if neither of its
+    lines belongs to a group another line of the cluster has been picked for
+    already. The lines of a kept edge are then picked for their groups.
+
+    :param edges: The (n_edges, 2) lines of each edge.
+    :param edge_clusters: The cluster of each edge.
+    :param node_groups: The group of each line, in [0, n_groups).
+    :return: (keep, picked) : whether each edge is kept, and the (n_clusters, n_groups)
+        line picked for each group of each cluster, or -1
+    """
+    keep = np.zeros(len(edges), dtype=np.bool_)
+    picked = np.full((n_clusters, n_groups), -1, dtype=np.int64)
+    for k in range(len(edges)):
+        c = edge_clusters[k]
+        source, target = edges[k, 0], edges[k, 1]
+        group_source, group_target = node_groups[source], node_groups[target]
+        if picked[c, group_source] != -1 and picked[c, group_source] != source:
+            continue
+        if picked[c, group_target] != -1 and picked[c, group_target] != target:
+            continue
+
+        keep[k] = True
+        picked[c, group_source] = source
+        picked[c, group_target] = target
+
+    return keep, picked
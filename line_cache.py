@@ -0,0 +1,109 @@
+"""A simple binary container for storing named arrays in a single file.
+
+The file starts with a magic string and the length of a JSON header, followed
+by the header itself and the raw array data. The header holds the dtype, shape
+and position of every array together with any metadata the writer wants to
+store. Each array is aligned to ALIGNMENT bytes so they can all be read as
+zero-copy views into one memory map of the file.
+
+    MAGIC | header length (uint64, little endian) | JSON header | arrays...
+"""
+import json
+import os
+import tempfile
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+MAGIC = b"LINECACHE\x01"
+ALIGNMENT = 64
+
+
+def file_signature(path: str) -> dict[str, Any]:
+    """Returns the name, size and modification time of a file.
+
+    Used to check whether the source files of a cache have changed since
+    the cache was written.
+    """
+    stat = os.stat(path)
+    return {"name": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_arrays(path: str, arrays: dict[str, NDArray[Any]], meta: dict[str, Any]) -> None:
+    """Writes arrays and metadata to a cache file.
+
+    The file is written to a temporary file in the same folder first and then
+    moved into place, so readers never see a partially written cache.
+
+    Parameters
+    ----------
+    path : the path of the cache file
+    arrays : the arrays to store, by name
+    meta : JSON serializable metadata to store in the header
+    """
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+
+    # The offsets are relative to the start of the data section, which itself
+    # is aligned once the size of the header is known.
+    layout: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    prefix_len = len(MAGIC) + 8 + len(header)
+    data_start = -(-prefix_len // ALIGNMENT) * ALIGNMENT
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            _ = f.write(MAGIC)
+            _ = f.write(np.uint64(data_start).tobytes())
+            _ = f.write(header)
+            for name, arr in arrays.items():
+                _ = f.seek(data_start + layout[name]["offset"])
+                _ = f.write(arr.data)
+            _ = f.truncate(data_start + offset)
+        # mkstemp creates files only readable by the owner
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_header(path: str) -> dict[str, Any]:
+    """Reads the header of a cache file without mapping the arrays."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a cache file")
+        data_start = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        header = f.read(data_start - len(MAGIC) - 8).rstrip(b"\x00")
+
+    header_dict: dict[str, Any] = json.loads(header)
+    header_dict["data_start"] = data_start
+    return header_dict
+
+
+def read_arrays(path: str) -> tuple[dict[str, Any], dict[str, NDArray[Any]]]:
+    """Maps a cache file into memory.
+
+    Returns
+    -------
+    (meta, arrays) : the metadata stored in the header and read-only views
+        of the arrays in the file
+    """
+    header = read_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+    arrays: dict[str, NDArray[Any]] = {}
+    for name, info in header["arrays"].items():
+        dtype = np.dtype(info["dtype"])
+        start = header["data_start"] + info["offset"]
+        count = int(np.prod(info["shape"], dtype=np.int64))
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(info["shape"])
+
+    return header["meta"], arrays
@@ -1,17 +1,146 @@
-from typing import Literal
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Iterable, Iterator, Literal, Sequence
+from collections import deque
 from concurrent.futures import ProcessPoolExecutor
-from functools import partial
+from functools import cached_property, partial
 
-from coords import Coord3D, CoordGeo
+from coords import Coord3DArray, CoordGeo, CoordGeoArray
+from line_cache import file_signature, read_arrays, write_arrays
+from shared_arrays import SharedArrays, SharedHandle
 
 import numpy as np
+from numpy.typing import NDArray
 import xarray as xr
 
 
+# The number of ensemble members in a run
+ENSEMBLE_COUNT = 50
+
+# The default number of processes used to decode a run
+MAX_WORKERS = 8
+
+# The time offsets in hours of the timesteps of a run
+TIME_OFFSETS = [t for t in range(0, 73, 3)] + [t for t in range(78, 241, 6)]
+
+# The tolerance in degrees of arc of each level of detail the lines can be
+# simplified to, see LineSet.importance. Level 0 keeps every point.
+LOD_TOLERANCES = [0.0, 0.1, 0.25, 0.5, 1.0]
+
+
+class Region:
+    """A part of the globe the lines can be limited to.
+
+    A region is a longitude/latitude box. If min_lon is larger than max_lon
+    the box wraps around the dateline, e.g. min_lon=150 and max_lon=-150
+    covers the 60 degrees of longitude around the dateline. A box covering
+    all longitudes is a latitude band, see Region.band. A line is in the
+    region if any of its points are inside the box.
+
+    Attributes:
+        min_lon (float): The western edge of the box.
+        max_lon (float): The eastern edge of the box.
+        min_lat (float): The southern edge of the box.
+        max_lat (float): The northern edge of the box.
+    """
+
+    __slots__ = ("min_lon", "max_lon", "min_lat", "max_lat")
+
+    min_lon: float
+    max_lon: float
+    min_lat: float
+    max_lat: float
+
+    def __init__(
+        self,
+        min_lon: float = -180.0,
+        max_lon: float = 180.0,
+        min_lat: float = -90.0,
+        max_lat: float = 90.0,
+    ) -> None:
+        if min_lat > max_lat:
+            raise ValueError(f"min_lat ({min_lat}) is larger than max_lat ({max_lat})")
+
+        self.min_lon = float(min_lon)
+        self.max_lon = float(max_lon)
+        self.min_lat = float(min_lat)
+        self.max_lat = float(max_lat)
+
+    @classmethod
+    def band(cls, min_lat: float, max_lat: float) -> Region:
+        """A region covering all longitudes between two latitudes."""
+        return cls(min_lat=min_lat, max_lat=max_lat)
+
+    @classmethod
+    def from_bounds(
+        cls,
+        min_lon: float | None = None,
+        max_lon: float | None = None,
+        min_lat: float | None = None,
+        max_lat: float | None = None,
+    ) -> Region | None:
+        """Creates a region from optional bounds, e.g. query parameters.
+
+        Missing bounds default to the edges of the globe, and if no bounds
+        are given there is no region.
+        """
+        if min_lon is None and max_lon is None and min_lat is None and max_lat is None:
+            return None
+
+        return cls(
+            -180.0 if min_lon is None else min_lon,
+            180.0 if max_lon is None else max_lon,
+            -90.0 if min_lat is None else min_lat,
+            90.0 if max_lat is None else max_lat,
+        )
+
+    @property
+    def all_lons(self) -> bool:
+        return self.max_lon - self.min_lon >= 360
+
+    def contains(self, lon: NDArray[np.float64], lat: NDArray[np.float64]) -> NDArray[np.bool_]:
+        """Checks which points are inside the region.
+
+        Longitudes outside of [-180, 180), like those shifted by dateline_fix,
+        are wrapped before being compared.
+        """
+        inside = (lat >= self.min_lat) & (lat <= self.max_lat)
+        if self.all_lons:
+            return inside
+
+        lon = wrap_lon(lon)
+        min_lon, max_lon = wrap_lon(self.min_lon), wrap_lon(self.max_lon)
+        if min_lon <= max_lon:
+            return inside & (lon >= min_lon) & (lon <= max_lon)
+
+        return inside & ((lon >= min_lon) | (lon <= max_lon))
+
+    def key(self) -> str:
+        """A string identifying the region, used in cache keys."""
+        return f"{self.min_lon}:{self.max_lon}:{self.min_lat}:{self.max_lat}"
+
+    def __repr__(self) -> str:
+        return f"Region(lon=[{self.min_lon}, {self.max_lon}], lat=[{self.min_lat}, {self.max_lat}])"
+
+
+def region_key(region: Region | None) -> str:
+    """The key of a region, or an empty string for the whole globe."""
+    return "" if region is None else region.key()
+
+
+def wrap_lon(lon: Any) -> Any:
+    """Wraps longitudes to [-180, 180)."""
+    return (lon + 180) % 360 - 180
+
+
 class Line:
     """A line.
 
-    A line is a collection of ordered points.
+    A line is a collection of ordered points. Lines are lightweight views
+    into a LineSet, the coordinates are only turned into CoordGeo objects
+    when the coords attribute is accessed.
 
     Attributes:
         id (str): The unique identifier of the line.
@@ -21,26 +150,653 @@ class Line:
         coords (List[CoordGeo]): A list of the coordinates of the line.
     """
 
-    id: str
-    coords: list[CoordGeo]
-    centroid: CoordGeo
+    __slots__ = ("line_set", "index")
+
+    line_set: LineSet
+    index: int
+
+    def __init__(self, line_set: LineSet, index: int) -> None:
+        self.line_set = line_set
+        self.index = index
+
+    @property
+    def id(self) -> str:
+        return self.line_set.ids[self.index]
+
+    @property
+    def lon(self) -> NDArray[np.float64]:
+        return self.line_set.lon[self.line_set.point_slice(self.index)]
+
+    @property
+    def lat(self) -> NDArray[np.float64]:
+        return self.line_set.lat[self.line_set.point_slice(self.index)]
 
-    def __init__(self, id: str, coords: list[CoordGeo], centroid: CoordGeo) -> None:
-        self.id = id
-        self.coords = coords
-        self.centroid = centroid
+    @property
+    def xyz(self) -> NDArray[np.float64]:
+        """The points of the line as an (n, 3) array of unit vectors."""
+        return self.line_set.xyz[self.line_set.point_slice(self.index)]
+
+    @property
+    def coords(self) -> list[CoordGeo]:
+        return list(self.coords_array)
+
+    @property
+    def coords_array(self) -> CoordGeoArray:
+        return CoordGeoArray(self.lon, self.lat)
+
+    @property
+    def centroid(self) -> CoordGeo:
+        lon, lat = self.line_set.centroids[self.index].tolist()
+        return CoordGeo(lon, lat)
+
+    def lod_mask(self, lod: int) -> NDArray[np.bool_]:
+        """The points of the line kept at a level of detail, see LOD_TOLERANCES."""
+        return self.line_set.importance[self.line_set.point_slice(self.index)] > LOD_TOLERANCES[lod]
+
+    def to_dict(self, lod: int = 0):
+        """Returns the line as a JSON serializable dict.
+
+        :param lod: The level of detail of the coordinates, see LOD_TOLERANCES.
+            The centroid is always that of the full resolution line.
+        """
+        lon, lat = self.lon, self.lat
+        if lod > 0:
+            mask = self.lod_mask(lod)
+            lon, lat = lon[mask], lat[mask]
 
-    def to_dict(self):
         return {
             "id": self.id,
-            "coords": [{"lon": coord.lon, "lat": coord.lat} for coord in self.coords],
-            "centroid": {"lon": self.centroid.lon, "lat": self.centroid.lat}
+            "coords": [{"lon": lon, "lat": lat} for lon, lat in zip(lon.tolist(), lat.tolist())],
+            "centroid": self.centroid.to_dict()
         }
 
 
+class LineSet:
+    """A collection of lines stored as flat columns.
+
+    The points of all lines are stored in two flat arrays, lon and lat, and
+    the points of line i are found between offsets[i] and offsets[i+1].
+    Every line also has an entry in the ens_ids, line_ids, times and
+    centroids arrays. Iterating over a LineSet or indexing it with an int
+    gives Line views, indexing it with a slice, a list of indices or a
+    boolean mask gives a new LineSet.
+
+    Attributes:
+        lon (NDArray[np.float64]): The longitudes of all points.
+        lat (NDArray[np.float64]): The latitudes of all points.
+        offsets (NDArray[np.int64]): The start of each line in lon and lat.
+            Has one more element than there are lines, the last being the
+            total number of points.
+        ens_ids (NDArray[np.int32]): The ensemble number of each line.
+        line_ids (NDArray[np.int32]): The id of each line in its ensemble.
+        times (NDArray[np.int32]): The time offset in hours of each line.
+        centroids (NDArray[np.float64]): The (n_lines, 2) lon/lat centroids.
+        importance (NDArray[np.float64]): How far in degrees of arc each point
+            is from the simplified line it is added to, see line_importance.
+        id_field (Literal["ens", "time"]): The column used as the first part
+            of the line ids. 'ens' gives 'ensemble_nr|line_id' and 'time'
+            gives 'time_offset|line_id'.
+    """
+
+    lon: NDArray[np.float64]
+    lat: NDArray[np.float64]
+    offsets: NDArray[np.int64]
+    ens_ids: NDArray[np.int32]
+    line_ids: NDArray[np.int32]
+    times: NDArray[np.int32]
+    centroids: NDArray[np.float64]
+    id_field: Literal["ens", "time"]
+
+    def __init__(
+        self,
+        lon: NDArray[np.float64],
+        lat: NDArray[np.float64],
+        offsets: NDArray[np.int64],
+        ens_ids: NDArray[np.int32],
+        line_ids: NDArray[np.int32],
+        times: NDArray[np.int32],
+        centroids: NDArray[np.float64] | None = None,
+        id_field: Literal["ens", "time"] = "ens",
+        xyz: NDArray[np.float64] | None = None,
+        importance: NDArray[np.float64] | None = None,
+    ) -> None:
+        self.lon = lon
+        self.lat = lat
+        self.offsets = offsets
+        self.ens_ids = ens_ids
+        self.line_ids = line_ids
+        self.times = times
+        self.id_field = id_field
+
+        if xyz is not None:
+            self.xyz = xyz
+        if importance is not None:
+            self.importance = importance
+
+        if centroids is None:
+            centroids = line_centroids(self.xyz, offsets)
+        self.centroids = centroids
+
+    @classmethod
+    def empty(cls, id_field: Literal["ens", "time"] = "ens") -> LineSet:
+        return cls(
+            lon=np.empty(0, dtype=np.float64),
+            lat=np.empty(0, dtype=np.float64),
+            offsets=np.zeros(1, dtype=np.int64),
+            ens_ids=np.empty(0, dtype=np.int32),
+            line_ids=np.empty(0, dtype=np.int32),
+            times=np.empty(0, dtype=np.int32),
+            centroids=np.empty((0, 2), dtype=np.float64),
+            id_field=id_field,
+        )
+
+    @classmethod
+    def concatenate(cls, line_sets: Sequence[LineSet]) -> LineSet:
+        """Joins several line sets into one, keeping their order."""
+        if len(line_sets) == 0:
+            return cls.empty()
+        if len(line_sets) == 1:
+            return line_sets[0]
+
+        point_counts = np.cumsum([0] + [len(ls.lon) for ls in line_sets[:-1]])
+        offsets = np.concatenate(
+            [ls.offsets[:-1] + n for ls, n in zip(line_sets, point_counts)]
+            + [np.array([point_counts[-1] + len(line_sets[-1].lon)])]
+        ).astype(np.int64)
+
+        return cls(
+            lon=np.concatenate([ls.lon for ls in line_sets]),
+            lat=np.concatenate([ls.lat for ls in line_sets]),
+            offsets=offsets,
+            ens_ids=np.concatenate([ls.ens_ids for ls in line_sets]),
+            line_ids=np.concatenate([ls.line_ids for ls in line_sets]),
+            times=np.concatenate([ls.times for ls in line_sets]),
+            centroids=np.concatenate([ls.centroids for ls in line_sets]),
+            id_field=line_sets[0].id_field,
+            xyz=np.concatenate([ls.xyz for ls in line_sets]),
+            importance=(
+                np.concatenate([ls.__dict__["importance"] for ls in line_sets])
+                if all("importance" in ls.__dict__ for ls in line_sets) else None
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[Line]:
+        for i in range(len(self)):
+            yield Line(self, i)
+
+    def __getitem__(self, key: int | slice | Sequence[int] | NDArray[np.int_] | NDArray[np.bool_]):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("LineSet index out of range")
+            return Line(self, int(key))
+
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            return self.slice_lines(start, max(start, stop))
+
+        return self.select(np.arange(len(self))[key])
+
+    def __repr__(self) -> str:
+        return f"LineSet({len(self)} lines, {len(self.lon)} points)"
+
+    def point_slice(self, i: int) -> slice:
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    @cached_property
+    def lengths(self) -> NDArray[np.int64]:
+        """The number of points in each line."""
+        return np.diff(self.offsets)
+
+    @cached_property
+    def point_lines(self) -> NDArray[np.int64]:
+        """The index of the line each point belongs to."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.lengths)
+
+    @cached_property
+    def ids(self) -> list[str]:
+        """The ids of the lines, see Line.id."""
+        prefix = self.ens_ids if self.id_field == "ens" else self.times
+        return [f"{p}|{l}" for p, l in zip(prefix.tolist(), self.line_ids.tolist())]
+
+    @cached_property
+    def xyz(self) -> NDArray[np.float64]:
+        """All points as an (n_points, 3) array of unit vectors."""
+        return lon_lat_to_3D(self.lon, self.lat)
+
+    @cached_property
+    def importance(self) -> NDArray[np.float64]:
+        """The Douglas-Peucker importance of all points, see line_importance."""
+        return line_importance(self.xyz, self.offsets)
+
+    def point_columns(self, point_idx: NDArray[np.int64] | slice) -> dict[str, NDArray[Any] | None]:
+        """The cached per point columns at some points, or None for those not computed."""
+        return {
+            name: None if name not in self.__dict__ else self.__dict__[name][point_idx]
+            for name in ("xyz", "importance")
+        }
+
+    def select(self, indices: NDArray[np.int_]) -> LineSet:
+        """Returns a new LineSet with the lines at the given indices."""
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # Index of every selected point in the original point arrays
+        point_idx = np.repeat(self.offsets[:-1][indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return LineSet(
+            lon=self.lon[point_idx],
+            lat=self.lat[point_idx],
+            offsets=offsets,
+            ens_ids=self.ens_ids[indices],
+            line_ids=self.line_ids[indices],
+            times=self.times[indices],
+            centroids=self.centroids[indices],
+            id_field=self.id_field,
+            **self.point_columns(point_idx),
+        )
+
+    def slice_lines(self, start: int, stop: int) -> LineSet:
+        """Returns the lines from start to stop without copying the points."""
+        p_start, p_stop = int(self.offsets[start]), int(self.offsets[stop])
+
+        return LineSet(
+            lon=self.lon[p_start:p_stop],
+            lat=self.lat[p_start:p_stop],
+            offsets=self.offsets[start:stop + 1] - p_start,
+            ens_ids=self.ens_ids[start:stop],
+            line_ids=self.line_ids[start:stop],
+            times=self.times[start:stop],
+            centroids=self.centroids[start:stop],
+            id_field=self.id_field,
+            **self.point_columns(slice(p_start, p_stop)),
+        )
+
+    def with_id_field(self, id_field: Literal["ens", "time"]) -> LineSet:
+        """Returns the same lines with ids built from another column."""
+        if id_field == self.id_field:
+            return self
+
+        return LineSet(
+            lon=self.lon,
+            lat=self.lat,
+            offsets=self.offsets,
+            ens_ids=self.ens_ids,
+            line_ids=self.line_ids,
+            times=self.times,
+            centroids=self.centroids,
+            id_field=id_field,
+            **self.point_columns(slice(None)),
+        )
+
+    @cached_property
+    def times_sorted(self) -> bool:
+        return bool(np.all(self.times[1:] >= self.times[:-1]))
+
+    def at_time(self, time_offset: int) -> LineSet:
+        """Returns the lines at a time offset.
+
+        If the lines are ordered by time this is a zero-copy slice.
+        """
+        if self.times_sorted:
+            start, stop = np.searchsorted(self.times, [time_offset, time_offset + 1])
+            return self.slice_lines(int(start), int(stop))
+
+        return self.select(np.flatnonzero(self.times == time_offset))
+
+    def split_by_time(self) -> dict[int, LineSet]:
+        return {int(t): self.at_time(t) for t in np.unique(self.times)}
+
+    def within(self, region: Region | None) -> LineSet:
+        """Returns the lines with at least one point inside a region.
+
+        :param region: The region, None keeps all lines.
+        """
+        if region is None or len(self) == 0:
+            return self
+
+        hits = np.logical_or.reduceat(region.contains(self.lon, self.lat), self.offsets[:-1])
+        if hits.all():
+            return self
+
+        return self.select(np.flatnonzero(hits))
+
+
+def lon_lat_to_3D(lon: NDArray[np.float64], lat: NDArray[np.float64]) -> NDArray[np.float64]:
+    """Converts arrays of longitudes and latitudes to (n, 3) unit vectors."""
+    return CoordGeoArray(lon, lat).to_3D().xyz
+
+
+def line_centroids(xyz: NDArray[np.float64], offsets: NDArray[np.int64]) -> NDArray[np.float64]:
+    """Computes the lon/lat centroid of each line.
+
+    The centroid is the mean of the 3D coordinates of the line converted
+    back to longitude and latitude.
+
+    :param xyz: The (n_points, 3) coordinates of all points.
+    :param offsets: The start of each line in xyz, see LineSet.offsets.
+    :return: An (n_lines, 2) array of the centroids' lon and lat.
+    """
+    return Coord3DArray(xyz).centroids(offsets).to_lon_lat().lon_lat
+
+
+def line_importance(xyz: NDArray[np.float64], offsets: NDArray[np.int64]) -> NDArray[np.float64]:
+    """Ranks the points of each line by how much they add to its shape.
+
+    Runs the Douglas-Peucker algorithm on the sphere for all lines at once,
+    one level of recursion at a time. Every segment still being split is
+    split at the interior point furthest from the great circle through its
+    end points. The importance of that point is its distance to the great
+    circle, capped by the importance of the point that created the segment.
+    Keeping the points with an importance larger than a tolerance therefore
+    gives the same line as running Douglas-Peucker with that tolerance. The
+    end points of every line are always kept and have an infinite importance.
+
+    :param xyz: The (n_points, 3) coordinates of all points.
+    :param offsets: The start of each line in xyz, see LineSet.offsets.
+    :return: The importance of every point in degrees of arc.
+    """
+    importance = np.zeros(len(xyz), dtype=np.float64)
+    if len(offsets) < 2:
+        return importance
+
+    importance[offsets[:-1]] = np.inf
+    importance[offsets[1:] - 1] = np.inf
+
+    # The first and last point of the segments being split
+    seg_start = offsets[:-1].astype(np.int64)
+    seg_end = offsets[1:].astype(np.int64) - 1
+    seg_limit = np.full(len(seg_start), np.inf)
+
+    while True:
+        splittable = seg_end - seg_start > 1
+        seg_start, seg_end, seg_limit = seg_start[splittable], seg_end[splittable], seg_limit[splittable]
+        if len(seg_start) == 0:
+            return importance
+
+        counts = seg_end - seg_start - 1
+        first = np.cumsum(counts) - counts
+        point_seg = np.repeat(np.arange(len(seg_start)), counts)
+        point_idx = np.repeat(seg_start + 1 - first, counts) + np.arange(int(counts.sum()))
+
+        normals = np.cross(xyz[seg_start], xyz[seg_end])
+        normal_len = np.linalg.norm(normals, axis=1)
+        degenerate = normal_len < 1e-12
+        normals[~degenerate] /= normal_len[~degenerate, None]
+
+        dist = np.abs(np.arcsin(np.clip(np.einsum("ij,ij->i", xyz[point_idx], normals[point_seg]), -1, 1)))
+        # Segments starting and ending in the same place measure the distance to that place
+        on_degenerate = degenerate[point_seg]
+        chord = np.linalg.norm(xyz[point_idx[on_degenerate]] - xyz[seg_start[point_seg[on_degenerate]]], axis=1)
+        dist[on_degenerate] = 2 * np.arcsin(np.clip(chord / 2, 0, 1))
+        dist = np.degrees(dist)
+
+        # The point furthest from each segment, the first one if there are ties
+        order = np.lexsort((point_idx, -dist, point_seg))
+        furthest = order[first]
+        split = point_idx[furthest]
+        split_importance = np.minimum(dist[furthest], seg_limit)
+        importance[split] = split_importance
+
+        seg_start, seg_end = np.concatenate((seg_start, split)), np.concatenate((split, seg_end))
+        seg_limit = np.concatenate((split_importance, split_importance))
+
+
+def start_to_datetime(start: str) -> np.datetime64:
+    """Converts a start time of the format YYYYMMDDTT to a datetime64."""
+    return np.datetime64(
+        f"{start[0:4]}-{start[4:6]}-{start[6:8]}T{start[8:10]}:00:00"
+    )
+
+
+def ensemble_file_path(start: str, ens_id: int, line_type: Literal["mta", "jet"]) -> str:
+    """Returns the path of the NETCDF4 file of an ensemble member.
+
+    See get_all_lines_at_time for the expected layout of the files.
+    """
+    base_path = f"./data/{line_type}/{start}/"
+    file_path = f"ec.ens_{ens_id:02d}.{start}.sfc.mta.nc"
+
+    if line_type == "jet":
+        file_path = f"ec.ens_{ens_id:02d}.{start}.pv2000.jetaxis.nc"
+
+    return base_path + file_path
+
+
+def decode_lines(
+    lon: NDArray[np.floating],
+    lat: NDArray[np.floating],
+    times: NDArray[np.integer],
+    line_ids: NDArray[np.number],
+    ens_id: int,
+    id_field: Literal["ens", "time"] = "ens",
+    region: Region | None = None,
+) -> LineSet:
+    """Splits the raw point columns of an ensemble file into lines.
+
+    A line is made up of all points sharing the same time and line id.
+    The points are ordered by time and line id with a stable sort, so the
+    points of each line keep the order they have in the file, and the lines
+    are split where either of the keys change. Lines outside of the region
+    are dropped, and the dateline fix and the centroids are then computed
+    for the remaining lines at once.
+
+    :param lon: The longitude of each point.
+    :param lat: The latitude of each point.
+    :param times: The time offset in hours of each point.
+    :param line_ids: The line id of each point.
+    :param ens_id: The ensemble number the points belong to.
+    :param id_field: See LineSet.id_field.
+    :param region: If given, only the lines in the region are kept.
+    :return: The lines in the columns.
+    """
+    if len(lon) == 0:
+        return LineSet.empty(id_field)
+
+    times = np.asarray(times, dtype=np.int32)
+    line_ids = np.asarray(line_ids).astype(np.int32)
+
+    order = np.lexsort((line_ids, times))
+    times = times[order]
+    line_ids = line_ids[order]
+    lon = np.asarray(lon, dtype=np.float64)[order]
+    lat = np.asarray(lat, dtype=np.float64)[order]
+
+    starts = np.flatnonzero(
+        np.concatenate(([True], (np.diff(times) != 0) | (np.diff(line_ids) != 0)))
+    )
+    offsets = np.append(starts, len(lon)).astype(np.int64)
+
+    if region is not None:
+        hits = np.logical_or.reduceat(region.contains(lon, lat), starts)
+        lengths = np.diff(offsets)[hits]
+        keep = np.repeat(hits, np.diff(offsets))
+        lon, lat = lon[keep], lat[keep]
+        starts = starts[hits]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    return LineSet(
+        lon=dateline_fix(lon, offsets),
+        lat=lat,
+        offsets=offsets,
+        ens_ids=np.full(len(starts), ens_id, dtype=np.int32),
+        line_ids=line_ids[starts],
+        times=times[starts],
+        id_field=id_field,
+    )
+
+
+# Bump when the layout of the date index changes
+DATE_INDEX_VERSION = 2
+
+# Date indices loaded by this process, by path
+_date_indices: dict[str, dict[str, Any]] = {}
+
+
+def date_index_path(start: str, line_type: Literal["mta", "jet"]) -> str:
+    return f"./data/{line_type}/{start}/dates.index.json"
+
+
+def build_file_date_index(path: str, start: str) -> dict[str, Any]:
+    """Finds the rows of each date in an ensemble file.
+
+    Only the date variable is read. The index holds the time offsets in the
+    file and the number of rows of each. If the rows of every date are
+    contiguous it also holds the range of rows of each time offset, otherwise
+    the ranges are left out and readers fall back to masking the whole file.
+
+    :param path: The path of the ensemble file.
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :return: The signature of the file, see file_signature, with the time
+        offsets, their row counts and the first and last row (exclusive) of each.
+    """
+    with xr.open_dataset(path) as ds:
+        dates = ds.date.values
+
+    times = ((dates - start_to_datetime(start)) // np.timedelta64(1, "h")).astype(np.int64)
+    starts = np.flatnonzero(np.diff(times, prepend=times[:1] - 1) != 0)
+    stops = np.append(starts[1:], len(times))
+
+    unique_times, counts = np.unique(times, return_counts=True)
+
+    index = file_signature(path)
+    index["times"] = unique_times.tolist()
+    index["counts"] = counts.tolist()
+    if len(unique_times) == len(starts):
+        index["starts"] = starts[np.argsort(times[starts])].tolist()
+        index["stops"] = stops[np.argsort(times[starts])].tolist()
+
+    return index
+
+
+def load_date_index(
+    start: str, line_type: Literal["mta", "jet"], ens_ids: Iterable[int] = range(ENSEMBLE_COUNT)
+) -> dict[str, dict[str, Any]]:
+    """Gets the date index of every ensemble file of a run.
+
+    The index is stored next to the data, see date_index_path, and the entry
+    of a file is rebuilt when its size or modification time change.
+
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :param line_type: The type of the lines.
+    :param ens_ids: The ensemble members whose index entries should be valid.
+    :return: The index of each file by file name, see build_file_date_index.
+    """
+    path = date_index_path(start, line_type)
+
+    if path in _date_indices:
+        files = _date_indices[path]
+    elif os.path.exists(path):
+        with open(path, "r") as f:
+            content = json.load(f)
+        files = content["files"] if content.get("version") == DATE_INDEX_VERSION else {}
+    else:
+        files = {}
+
+    changed = False
+    for i in ens_ids:
+        file_path = ensemble_file_path(start, i, line_type)
+        signature = file_signature(file_path)
+        entry = files.get(signature["name"])
+        if entry is None or entry["size"] != signature["size"] or entry["mtime_ns"] != signature["mtime_ns"]:
+            files[signature["name"]] = build_file_date_index(file_path, start)
+            changed = True
+
+    if changed:
+        try:
+            with open(path, "w+") as f:
+                json.dump({"version": DATE_INDEX_VERSION, "files": files}, f)
+        except OSError:
+            pass
+
+    _date_indices[path] = files
+    return files
+
+
+def time_rows(index_entry: dict[str, Any], time_offset: int) -> tuple[int, int] | None:
+    """Gets the range of rows holding a time offset in an ensemble file.
+
+    :param index_entry: The date index of the file, see build_file_date_index.
+    :param time_offset: The time offset to find.
+    :return: The first and last row (exclusive) of the time offset, or None
+        if the rows of the file are not grouped by date.
+    """
+    if "starts" not in index_entry:
+        return None
+
+    if time_offset not in index_entry["times"]:
+        return (0, 0)
+
+    i = index_entry["times"].index(time_offset)
+    return (index_entry["starts"][i], index_entry["stops"][i])
+
+
+def read_ensemble_file(
+    start: str,
+    ens_id: int,
+    line_type: Literal["mta", "jet"],
+    time_offset: int | None = None,
+    id_field: Literal["ens", "time"] = "ens",
+    date_index: dict[str, dict[str, Any]] | None = None,
+    region: Region | None = None,
+) -> LineSet:
+    """Reads the lines of one ensemble member.
+
+    The longitude, latitude, date and line_id variables are read once as
+    arrays and passed to decode_lines. If a time offset is given only the
+    rows of that time offset are read from the file, using the date index of
+    the run, see load_date_index.
+
+    :param start: The start time of the computation, see get_all_lines_at_time.
+    :param ens_id: The ensemble number to read.
+    :param line_type: The type of the lines to read.
+    :param time_offset: If given, only the lines at this time offset are read.
+    :param id_field: See LineSet.id_field.
+    :param date_index: The date index of the run, loaded if not given.
+    :param region: If given, only the lines in the region are decoded.
+    :return: The lines of the ensemble member.
+    """
+    start_time = start_to_datetime(start)
+    path = ensemble_file_path(start, ens_id, line_type)
+
+    rows = None
+    if time_offset is not None:
+        if date_index is None:
+            date_index = load_date_index(start, line_type, [ens_id])
+        rows = time_rows(date_index[os.path.basename(path)], time_offset)
+
+    with xr.open_dataset(path) as ds:
+        if rows is not None:
+            ds = ds.isel({ds.date.dims[0]: slice(*rows)})
+
+        dates = ds.date.values
+        lon = ds.longitude.values
+        lat = ds.latitude.values
+        line_ids = ds.line_id.values
+
+    if time_offset is not None and rows is None:
+        mask = dates == start_time + np.timedelta64(time_offset, "h")
+        dates, lon, lat, line_ids = dates[mask], lon[mask], lat[mask], line_ids[mask]
+
+    times = (dates - start_time) // np.timedelta64(1, "h")
+
+    return decode_lines(lon, lat, times, line_ids, ens_id, id_field, region)
+
+
 def get_all_lines_at_time(
-    start: str, time_offset: int, line_type: Literal["mta", "jet"]
-) -> list[Line]:
+    start: str,
+    time_offset: int,
+    line_type: Literal["mta", "jet"],
+    use_cache: bool = True,
+    n_ens: int = ENSEMBLE_COUNT,
+    region: Region | None = None,
+) -> LineSet:
     """Reads all lines from a NETCDF4 file and returns them.
 
     Reads a group of NETCDF4 files of a specific format and returns the lines
@@ -65,163 +821,378 @@ def get_all_lines_at_time(
         The offset is given in hours from the start time.
     :param line_type: The type of the lines to get.
         Currently supported line types are 'mta' and 'jet'.
-    :return: A list of the lines from the 50 ensembles at the time offset.
+    :param use_cache: Whether to read the lines from the run cache,
+        see load_run. If False the NETCDF4 files are read directly.
+    :param n_ens: The number of ensemble members in the run.
+    :param region: If given, only the lines in the region are returned.
+    :return: The lines from the 50 ensembles at the time offset.
     """
-    all_lines = []
+    if use_cache:
+        return load_run(start, line_type, n_ens=n_ens).at_time(time_offset).within(region)
 
-    start_time = np.datetime64(
-        f"{start[0:4]}-{start[4:6]}-{start[6:8]}T{start[8:10]}:00:00"
-    )
+    date_index = load_date_index(start, line_type, range(n_ens))
+    return LineSet.concatenate([
+        read_ensemble_file(start, i, line_type, time_offset=time_offset, date_index=date_index, region=region)
+        for i in range(n_ens)
+    ])
 
-    for i in range(50):
-        base_path = f"./data/{line_type}/{start}/"
-        file_path = f"ec.ens_{i:02d}.{start}.sfc.mta.nc"
 
-        if line_type == "jet":
-            file_path = f"ec.ens_{i:02d}.{start}.pv2000.jetaxis.nc"
-        full_path = base_path + file_path
+def get_all_lines_in_ens(
+    start: str,
+    ens_nr: int,
+    line_type: Literal["mta", "jet"],
+    use_cache: bool = True,
+    n_ens: int = ENSEMBLE_COUNT,
+    region: Region | None = None,
+) -> LineSet:
+    if use_cache:
+        lines = load_run(start, line_type, n_ens=n_ens)
+        return lines.select(np.flatnonzero(lines.ens_ids == ens_nr)).within(region).with_id_field("time")
 
-        ds = xr.open_dataset(full_path)
-        date_ds = ds.where(
-            ds.date == start_time + np.timedelta64(time_offset, "h"), drop=True
-        )
+    return read_ensemble_file(start, ens_nr, line_type, id_field="time", region=region)
 
-        grouped_ds = list(date_ds.groupby("line_id"))
 
-        for id_, line in grouped_ds:
-            coords = [
-                CoordGeo(lon, lat)
-                for lon, lat in zip(line.longitude.values, line.latitude.values)
-            ]
+def process_single_file(
+    ens_id: int, start: str, line_type: Literal["mta", "jet"], region: Region | None = None
+) -> LineSet:
+    return read_ensemble_file(start, ens_id, line_type, region=region)
 
-            if max(line.longitude.values) - min(line.longitude.values) > 180:
-                coords = dateline_fix(coords)
 
-            centroid = Coord3D(0, 0, 0)
-            for coord in coords:
-                coord_3D = coord.to_3D()
-                centroid += coord_3D
+def decode_into_shared(
+    ens_id: int,
+    point_starts: dict[int, int],
+    start: str,
+    line_type: Literal["mta", "jet"],
+    handle: SharedHandle,
+    region: Region | None = None,
+) -> tuple[NDArray[np.int64], NDArray[np.int32], NDArray[np.int32], NDArray[np.float64]]:
+    """Decodes an ensemble file, writing its points into shared arrays.
 
-            centroid_geo = (centroid * (1/len(coords))).to_lon_lat()
+    Worker function of decode_run. The points of each timestep are written
+    to the shared lon, lat, xyz and importance arrays starting at
+    point_starts[time]. If a region is given only the lines in it are
+    decoded and written.
 
-            all_lines.append(Line(id=f"{i}|{int(id_)}", coords=coords, centroid=centroid_geo))
+    :return: The number of points, line id, time and centroid of each line
+        in the file. These are small, so they are returned normally.
+    """
+    lines = read_ensemble_file(start, ens_id, line_type, region=region)
 
-    return all_lines
+    with SharedArrays.attach(handle) as shared:
+        for t in np.unique(lines.times).tolist():
+            lines_t = lines.at_time(t)
+            dest = slice(point_starts[t], point_starts[t] + len(lines_t.lon))
+            shared["lon"][dest] = lines_t.lon
+            shared["lat"][dest] = lines_t.lat
+            shared["xyz"][dest] = lines_t.xyz
+            shared["importance"][dest] = lines_t.importance
 
+    return lines.lengths, lines.line_ids, lines.times, lines.centroids
 
-def get_all_lines_in_ens(
-    start: str, ens_nr: int, line_type: Literal["mta", "jet"]
-) -> list[Line]:
-    all_lines = []
 
-    start_time = np.datetime64(
-        f"{start[0:4]}-{start[4:6]}-{start[6:8]}T{start[8:10]}:00:00"
-    )
+def decode_run(
+    start: str,
+    line_type: Literal["mta", "jet"],
+    n_ens: int = ENSEMBLE_COUNT,
+    max_workers: int | None = MAX_WORKERS,
+    region: Region | None = None,
+) -> LineSet:
+    """Reads the lines of all ensemble members of a run.
 
-    base_path = f"./data/{line_type}/{start}/"
-    file_path = f"ec.ens_{ens_nr:02d}.{start}.sfc.mta.nc"
+    The lines are ordered by time, then by ensemble and then by line id,
+    so the lines of each timestep are stored next to each other.
 
-    if line_type == "jet":
-        file_path = f"ec.ens_{ens_nr:02d}.{start}.pv2000.jetaxis.nc"
-    full_path = base_path + file_path
-
-    ds = xr.open_dataset(full_path)
-    ds = ds.assign_coords(
-        date_line=xr.DataArray(
-            [f"{d}_{l}" for d, l in zip(ds.date.values, ds.line_id.values)],
-            dims=ds.date.dims  # or whichever dimension these variables share
-        )
-    )
-    grouped_ds = list(ds.groupby("date_line"))
+    The files are decoded by a pool of processes. The number of points of
+    each member at each timestep is known from the date index, see
+    load_date_index, so the workers write their points straight to their
+    final position in shared memory instead of sending them back pickled.
+    The point arrays of the returned lines are the shared blocks themselves,
+    see SharedArrays.release, so they are never copied.
 
-    for id_, line in grouped_ds:
-        coords = [
-            CoordGeo(lon, lat)            
-            for lon, lat in zip(line.longitude.values, line.latitude.values)
-        ]
-        hour_offset = (line.date.values[0] - start_time) // np.timedelta64(1, "h")
-        if max(line.longitude.values) - min(line.longitude.values) > 180:
-            coords = dateline_fix(coords)
+    If a region is given the workers drop the lines outside of it before
+    computing their 3D coordinates and importance, and only write the points
+    of the remaining lines, at the start of the space of each member and
+    timestep. The kept points are then gathered out of the shared blocks.
 
-        centroid = Coord3D(0, 0, 0)
-        for coord in coords:
-            coord_3D = coord.to_3D()
-            centroid += coord_3D
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :param line_type: The type of the lines.
+    :param n_ens: The number of ensemble members in the run.
+    :param max_workers: The number of processes to use, None uses one per core.
+    :param region: If given, only the lines in the region are returned.
+    :return: All lines of the run.
+    """
+    date_index = load_date_index(start, line_type, range(n_ens))
+    entries = [date_index[os.path.basename(ensemble_file_path(start, i, line_type))] for i in range(n_ens)]
 
-        centroid_geo = (centroid * (1/len(coords))).to_lon_lat()
+    times = sorted(set(t for entry in entries for t in entry["times"]))
+    time_idx = {t: i for i, t in enumerate(times)}
+    counts = np.zeros((len(times), n_ens), dtype=np.int64)
+    for i, entry in enumerate(entries):
+        counts[[time_idx[t] for t in entry["times"]], i] = entry["counts"]
 
-        all_lines.append(Line(id=f"{hour_offset}|{line.line_id.values[0]}", coords=coords, centroid=centroid_geo))
+    # Points are stored ordered by time and then by ensemble
+    starts = (np.cumsum(counts.ravel()) - counts.ravel()).reshape(counts.shape)
+    point_starts = [{t: int(starts[time_idx[t], i]) for t in times} for i in range(n_ens)]
+    n_points = int(counts.sum())
 
-    return all_lines
+    with SharedArrays({
+        "lon": ((n_points,), np.float64),
+        "lat": ((n_points,), np.float64),
+        "xyz": ((n_points, 3), np.float64),
+        "importance": ((n_points,), np.float64),
+    }) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            process_func = partial(
+                decode_into_shared,
+                start=start,
+                line_type=line_type,
+                handle=shared.handle(),
+                region=region,
+            )
+            results = list(executor.map(process_func, range(n_ens), point_starts))
 
+        if region is None:
+            # The points stay in the shared blocks, which are freed with the lines
+            points = shared.release()
+        else:
+            # The number of points written by each member at each timestep
+            written = np.zeros_like(counts)
+            for i, (lengths, _, line_times, _) in enumerate(results):
+                written[:, i] = np.bincount(
+                    [time_idx[t] for t in line_times.tolist()], weights=lengths, minlength=len(times)
+                ).astype(np.int64)
 
-def process_single_file(ens_id: int, start: str, line_type: Literal["mta", "jet"]):
-    times = [t for t in range(0, 73, 3)] + [t for t in range(78, 241, 6)]
-    lines_at_time = {t: [] for t in times}
+            slot_pos = np.arange(n_points) - np.repeat(starts.ravel(), counts.ravel())
+            keep = slot_pos < np.repeat(written.ravel(), counts.ravel())
+            points = {name: shared[name][keep] for name in ("lon", "lat", "xyz", "importance")}
+            n_points = int(written.sum())
 
-    start_time = np.datetime64(
-        f"{start[0:4]}-{start[4:6]}-{start[6:8]}T{start[8:10]}:00:00"
+    lengths, line_ids, line_times, centroids = (np.concatenate(col) for col in zip(*results))
+    ens_ids = np.repeat(np.arange(n_ens, dtype=np.int32), [len(result[0]) for result in results])
+
+    order = np.lexsort((line_ids, ens_ids, line_times))
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths[order], out=offsets[1:])
+
+    if offsets[-1] != n_points:
+        raise ValueError(f"The files of '{start}' changed while being read")
+
+    return LineSet(
+        lon=points["lon"],
+        lat=points["lat"],
+        offsets=offsets,
+        ens_ids=ens_ids[order],
+        line_ids=line_ids[order],
+        times=line_times[order],
+        centroids=centroids[order],
+        xyz=points["xyz"],
+        importance=points["importance"],
     )
 
-    base_path = f"./data/{line_type}/{start}/"
-    file_path = f"ec.ens_{ens_id:02d}.{start}.sfc.mta.nc"
 
-    if line_type == "jet":
-        file_path = f"ec.ens_{ens_id:02d}.{start}.pv2000.jetaxis.nc"
-    full_path = base_path + file_path
+# Bump when the layout or content of the run cache changes
+RUN_CACHE_VERSION = 2
 
-    with xr.open_dataset(full_path) as ds:
-        lines = list(ds.groupby(["line_id", "date"]))
-        for _, line in lines:
-            t = int((line.date.values[0] - start_time) / np.timedelta64(1, "h"))
-            coords = [
-                CoordGeo(lon, lat)
-                for lon, lat in zip(line.longitude.values, line.latitude.values)
-            ]
+# Run caches opened by this process, by path, together with the signatures
+# of the source files they were validated against.
+_loaded_runs: dict[str, tuple[list[dict[str, Any]], LineSet]] = {}
 
-            if max(line.longitude.values) - min(line.longitude.values) > 180:
-                coords = dateline_fix(coords)
 
-            centroid = Coord3D(0, 0, 0)
-            for coord in coords:
-                coord_3D = coord.to_3D()
-                centroid += coord_3D
+def run_cache_path(start: str, line_type: Literal["mta", "jet"]) -> str:
+    return f"./data/{line_type}/{start}/lines.cache"
 
-            centroid_geo = (centroid * (1/len(coords))).to_lon_lat()
-            lines_at_time[t].append(Line(id=f"{ens_id}|{line.line_id.values[0]}", coords=coords, centroid=centroid_geo))
 
-    return lines_at_time
+def cached_run(start: str, line_type: Literal["mta", "jet"], n_ens: int = ENSEMBLE_COUNT) -> LineSet | None:
+    """Gets all lines of a run from its cache file if the cache is valid.
 
+    See load_run, this function does not build the cache.
 
-def get_all_lines(start: str, line_type: Literal["mta", "jet"]) -> dict[int, list[Line]]:
-    with ProcessPoolExecutor(max_workers=8) as executor:
-        process_func = partial(
-            process_single_file,
-            start=start,
-            line_type=line_type,
+    :return: The lines of the run, or None if there is no valid cache.
+    """
+    path = run_cache_path(start, line_type)
+    sources = [file_signature(ensemble_file_path(start, i, line_type)) for i in range(n_ens)]
+
+    if path in _loaded_runs and _loaded_runs[path][0] == sources:
+        return _loaded_runs[path][1]
+
+    if os.path.exists(path):
+        meta, arrays = read_arrays(path)
+        if meta.get("version") == RUN_CACHE_VERSION and meta.get("sources") == sources:
+            lines = LineSet(**arrays)
+            _loaded_runs[path] = (sources, lines)
+            return lines
+
+    return None
+
+
+def load_run(
+    start: str,
+    line_type: Literal["mta", "jet"],
+    n_ens: int = ENSEMBLE_COUNT,
+    max_workers: int | None = MAX_WORKERS,
+) -> LineSet:
+    """Gets all lines of a run from its cache file.
+
+    The first time a run is read all the ensemble files are decoded and
+    written to a single cache file next to them, see line_cache.py. The cache
+    stores the packed coordinates, offsets, the ensemble, line and time
+    columns, the centroids, the 3D coordinates and the simplification
+    importance of the points, see line_importance, with the
+    lines ordered as in decode_run. Later calls map the file into memory, so
+    getting the lines of a timestep is a slice into the mapped arrays.
+
+    The cache is rebuilt if the size or modification time of any of the
+    ensemble files differ from when the cache was written. If the cache
+    can not be written the decoded lines are returned directly.
+
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :param line_type: The type of the lines.
+    :param n_ens: The number of ensemble members in the run.
+    :param max_workers: The number of processes used to decode the run.
+    :return: All lines of the run.
+    """
+    path = run_cache_path(start, line_type)
+    sources = [file_signature(ensemble_file_path(start, i, line_type)) for i in range(n_ens)]
+
+    lines = cached_run(start, line_type, n_ens)
+    if lines is not None:
+        return lines
+
+    lines = decode_run(start, line_type, n_ens, max_workers)
+    try:
+        write_arrays(
+            path,
+            {
+                "lon": lines.lon,
+                "lat": lines.lat,
+                "offsets": lines.offsets,
+                "ens_ids": lines.ens_ids,
+                "line_ids": lines.line_ids,
+                "times": lines.times,
+                "centroids": lines.centroids,
+                "xyz": lines.xyz,
+                "importance": lines.importance,
+            },
+            {"version": RUN_CACHE_VERSION, "sources": sources},
         )
-        process_dicts = list(executor.map(process_func, range(50)))
+    except OSError:
+        return lines
+
+    _, arrays = read_arrays(path)
+    lines = LineSet(**arrays)
+    _loaded_runs[path] = (sources, lines)
+
+    return lines
+
 
-    lines_at_time = process_dicts[0]
-    for process_dict in process_dicts[1:]:
-        for t in lines_at_time.keys():
-            lines_at_time[t] += process_dict[t]
+def get_all_lines(
+    start: str,
+    line_type: Literal["mta", "jet"],
+    use_cache: bool = True,
+    n_ens: int = ENSEMBLE_COUNT,
+    max_workers: int | None = MAX_WORKERS,
+    region: Region | None = None,
+) -> dict[int, LineSet]:
+    if use_cache:
+        lines = load_run(start, line_type, n_ens, max_workers)
+        return {t: lines.at_time(t).within(region) for t in TIME_OFFSETS}
 
-    return lines_at_time
+    lines = decode_run(start, line_type, n_ens, max_workers, region)
+    return {t: lines.at_time(t) for t in TIME_OFFSETS}
 
 
+def iter_lines(
+    start: str,
+    line_type: Literal["mta", "jet"],
+    times: Iterable[int] | None = None,
+    members: Iterable[int] | None = None,
+    use_cache: bool = True,
+    n_ens: int = ENSEMBLE_COUNT,
+    region: Region | None = None,
+) -> Iterator[tuple[int, LineSet]]:
+    """Iterates over the timesteps of a run.
 
-def dateline_fix(coords: list[CoordGeo]) -> list[CoordGeo]:
-    """Shifts a list of coordinates by 360 degrees longitude.
+    Only one timestep is read at a time, so walking through a whole run
+    does not need more memory than its largest timestep. If the run cache
+    exists each timestep is a slice of the mapped cache, otherwise only the
+    rows of the timestep are read from each file, see read_ensemble_file.
+    The cache is never built by this function.
 
-    :param coords: The list of coordinates to shift.
-    :return: The original coordinates shifted by 360 degrees longitude.
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :param line_type: The type of the lines.
+    :param times: The time offsets to read, in the order they are given.
+        Defaults to all of TIME_OFFSETS.
+    :param members: The ensemble members to read. Defaults to all.
+    :param use_cache: Whether to read from the run cache if it exists.
+    :param n_ens: The number of ensemble members in the run.
+    :param region: If given, only the lines in the region are returned.
+    :return: An iterator of the time offsets and the lines at each.
     """
-    for i, coord in enumerate(coords):
-        if coord.lon < 0:
-            coords[i] = CoordGeo(coord.lon + 360, coord.lat)
+    times = TIME_OFFSETS if times is None else times
+    members = list(range(n_ens)) if members is None else sorted(members)
+
+    lines = cached_run(start, line_type, n_ens) if use_cache else None
+    date_index = load_date_index(start, line_type, members) if lines is None else None
+
+    for t in times:
+        if lines is not None:
+            lines_t = lines.at_time(t)
+            if len(members) != n_ens:
+                lines_t = lines_t.select(np.flatnonzero(np.isin(lines_t.ens_ids, members)))
+            lines_t = lines_t.within(region)
+        else:
+            lines_t = LineSet.concatenate([
+                read_ensemble_file(start, i, line_type, time_offset=t, date_index=date_index, region=region)
+                for i in members
+            ])
+
+        yield t, lines_t
+
+
+def iter_line_windows(
+    start: str,
+    line_type: Literal["mta", "jet"],
+    size: int = 2,
+    **kwargs: Any,
+) -> Iterator[tuple[tuple[int, LineSet], ...]]:
+    """Iterates over windows of consecutive timesteps of a run.
+
+    Every window holds size consecutive timesteps from iter_lines, and
+    moves one timestep at a time. At most size timesteps are held at once.
+    Useful for comparing a timestep to the next, e.g. when tracking lines.
+
+    :param start: The start time of the run, see get_all_lines_at_time.
+    :param line_type: The type of the lines.
+    :param size: The number of timesteps in each window.
+    :param kwargs: Passed on to iter_lines.
+    :return: An iterator of tuples of (time offset, lines) pairs.
+    """
+    window: deque[tuple[int, LineSet]] = deque(maxlen=size)
+    for step in iter_lines(start, line_type, **kwargs):
+        window.append(step)
+        if len(window) == size:
+            yield tuple(window)
+
+
+def dateline_fix(lon: NDArray[np.float64], offsets: NDArray[np.int64]) -> NDArray[np.float64]:
+    """Shifts the negative longitudes of lines crossing the dateline by 360 degrees.
+
+    A line is considered to cross the dateline if its longitudes span more
+    than 180 degrees.
+
+    :param lon: The longitudes of all points.
+    :param offsets: The start of each line in lon, see LineSet.offsets.
+    :return: The longitudes with the negative ones shifted by 360 degrees
+        for the lines crossing the dateline.
+    """
+    if len(lon) == 0:
+        return lon
+
+    starts = offsets[:-1]
+    span = np.maximum.reduceat(lon, starts) - np.minimum.reduceat(lon, starts)
+    crossing = np.repeat(span > 180, np.diff(offsets))
 
-    return coords
+    return np.where(crossing & (lon < 0), lon + 360, lon)
 
 
 if __name__ == "__main__":
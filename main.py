@@ -1,13 +1,14 @@
 from typing import List, Dict, Literal
 
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from data import generate_network, get_centroids
-from line_reader import get_all_lines_at_time, get_all_lines_in_ens
-from multiscale import multiscale
+from data import NetworkSweep, generate_network, get_centroids
+from line_reader import LOD_TOLERANCES, Region, get_all_lines_at_time, get_all_lines_in_ens
+from multiscale import multiscale_arrays
 from tracking import create_clustermap
+from wire import pack_lines, pack_network
 
 
 app = FastAPI()
@@ -41,7 +42,13 @@ class Network(BaseModel):
     node_clusters: Dict[str, int]
 
 
-@app.get("/get-networks", response_model=Network)
+class SweepNetwork(BaseModel):
+    dist_threshold: float
+    required_ratio: float
+    network: Network
+
+
+@app.get("/get-networks", response_model=Network, responses={200: {"content": {"application/octet-stream": {}}}})
 def get_network(sim_start: str = "2024101900",
                 time_offset: int = 0,
                 ens_id: int = 0,
@@ -49,32 +56,77 @@ def get_network(sim_start: str = "2024101900",
                 required_ratio: float = 0.05,
                 line_type: Literal["jet", "mta"] = "jet",
                 all_or_one: Literal["all", "one"] = "all",
+                min_lon: float | None = None,
+                max_lon: float | None = None,
+                min_lat: float | None = None,
+                max_lat: float | None = None,
+                format: Literal["json", "packed"] = "json",
                 ):
 
+    region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
     if all_or_one == "one":
-        lines = get_all_lines_in_ens(sim_start, ens_id, line_type)
+        lines = get_all_lines_in_ens(sim_start, ens_id, line_type, region=region)
     else:
-        lines = get_all_lines_at_time(sim_start, time_offset, line_type)
+        lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+
+    ico_points_ms, line_points_ms = multiscale_arrays(lines, 0)
+    network = generate_network(lines, ico_points_ms, line_points_ms, dist_threshold, required_ratio, max_workers=None)
 
-    ico_points_ms, line_points_ms = multiscale(lines, 0)
-    network = generate_network(lines, ico_points_ms, line_points_ms, dist_threshold, required_ratio)
+    if format == "packed":
+        return Response(content=pack_network(network), media_type="application/octet-stream")
 
     return network
 
 
+@app.get("/get-network-sweep", response_model=List[SweepNetwork])
+def get_network_sweep(sim_start: str = "2024101900",
+                      time_offset: int = 0,
+                      ens_id: int = 0,
+                      dist_thresholds: List[int] = Query([50]),
+                      required_ratios: List[float] = Query([0.05]),
+                      line_type: Literal["jet", "mta"] = "jet",
+                      all_or_one: Literal["all", "one"] = "all",
+                      min_lon: float | None = None,
+                      max_lon: float | None = None,
+                      min_lat: float | None = None,
+                      max_lat: float | None = None,
+                      ):
+
+    region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
+    if all_or_one == "one":
+        lines = get_all_lines_in_ens(sim_start, ens_id, line_type, region=region)
+    else:
+        lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+
+    _, line_points_ms = multiscale_arrays(lines, 0)
+    sweep = NetworkSweep(lines, line_points_ms, max(dist_thresholds))
+
+    return sweep.networks(dist_thresholds, required_ratios)
+
+
 @app.get("/get-coords")
 def get_coords(sim_start: str = "2024101900",
                time_offset: int = 0,
                ens_id: int = 0,
                line_type: Literal["jet", "mta"] = "jet",
-               all_or_one: Literal["all", "one"] = "all"):
-
+               all_or_one: Literal["all", "one"] = "all",
+               min_lon: float | None = None,
+               max_lon: float | None = None,
+               min_lat: float | None = None,
+               max_lat: float | None = None,
+               lod: int = Query(0, ge=0, lt=len(LOD_TOLERANCES)),
+               format: Literal["json", "packed"] = "json"):
+
+    region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
     if all_or_one == "one":
-        lines = get_all_lines_in_ens(sim_start, ens_id, line_type)
+        lines = get_all_lines_in_ens(sim_start, ens_id, line_type, region=region)
     else:
-        lines = get_all_lines_at_time(sim_start, time_offset, line_type)
+        lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
+
+    if format == "packed":
+        return Response(content=pack_lines(lines, lod), media_type="application/octet-stream")
 
-    return lines
+    return [line.to_dict(lod) for line in lines]
 
 
 @app.get("/get-centroids")
@@ -82,12 +134,17 @@ def get_line_centroids(sim_start: str = "2024101900",
                time_offset: int = 0,
                ens_id: int = 0,
                line_type: Literal["jet", "mta"] = "jet",
-               all_or_one: Literal["all", "one"] = "all"):
+               all_or_one: Literal["all", "one"] = "all",
+               min_lon: float | None = None,
+               max_lon: float | None = None,
+               min_lat: float | None = None,
+               max_lat: float | None = None):
 
+    region = Region.from_bounds(min_lon, max_lon, min_lat, max_lat)
     if all_or_one == "one":
-        lines = get_all_lines_in_ens(sim_start, ens_id, line_type)
+        lines = get_all_lines_in_ens(sim_start, ens_id, line_type, region=region)
     else:
-        lines = get_all_lines_at_time(sim_start, time_offset, line_type)
+        lines = get_all_lines_at_time(sim_start, time_offset, line_type, region=region)
 
     return get_centroids(lines)
 
@@ -1,13 +1,10 @@
 from __future__ import annotations
-from typing import List
 from dataclasses import dataclass
-from itertools import combinations
 
-from coords import Coord3D, CoordGeo
-from line_reader import Line
+from coords import Coord3D, Coord3DArray, CoordGeo
+from ico_hierarchy import IcoHierarchy, load_ico_hierarchy
+from line_reader import LineSet
 
-from icosphere import icosphere
-from scipy.spatial import KDTree
 import numpy as np
 from numpy.typing import NDArray
 
@@ -49,137 +46,215 @@ class LinePointMS:
     line_point_coord_geo: CoordGeo
 
 
-def inside_check(pt: NDArray[np.float_], tri: NDArray[np.float_]) -> bool:
-    a = (
-        (tri[1][1] - tri[2][1]) * (pt[0] - tri[2][0])
-        + (tri[2][0] - tri[1][0]) * (pt[1] - tri[2][1])
-    ) / (
-        (tri[1][1] - tri[2][1]) * (tri[0][0] - tri[2][0])
-        + (tri[2][0] - tri[1][0]) * (tri[0][1] - tri[2][1])
-    )
-    b = (
-        (tri[2][1] - tri[0][1]) * (pt[0] - tri[2][0])
-        + (tri[0][0] - tri[2][0]) * (pt[1] - tri[2][1])
-    ) / (
-        (tri[1][1] - tri[2][1]) * (tri[0][0] - tri[2][0])
-        + (tri[2][0] - tri[1][0]) * (tri[0][1] - tri[2][1])
-    )
-    c = 1 - a - b
-
-    return 0 <= a <= 1 and 0 <= b <= 1 and 0 <= c <= 1
-
-
-def multiscale(lines: List[Line], subdivs: int):
-    ico_verts, _ = icosphere()
-    ico_points_ms: dict[int, IcoPoint]= {}
-    subdivided_edges: dict[tuple[int, int], int] = {}
-    line_points_ms: dict[str, dict[int, dict[int, tuple[int, float]]]] = {}
-
-    for i, pt in enumerate(ico_verts):
-        coord = Coord3D(x=pt[0], y=pt[1], z=pt[2])
-        ico_pt = IcoPoint(
-            id=i,
-            ms_level=0,
-            coord_3D=coord,
-            coord_geo=coord.to_lon_lat()
+# The closest point of a line to an icopoint at a multiscale level
+LINE_POINT_DTYPE = np.dtype([
+    ("line", np.int32),
+    ("ico", np.int32),
+    ("point", np.int32),
+    ("dist", np.float64),
+])
+
+# The multiscale points as nested dicts, by line id, level and icopoint id,
+# of (index of the point in the line, distance to the icopoint)
+LinePointsDict = dict[str, dict[int, dict[int, tuple[int, float]]]]
+
+
+class IcoPointArrays:
+    """The icopoints of the levels up to max_level of a hierarchy, as arrays.
+
+    The arrays are views of those of the hierarchy, so the icopoints take
+    no memory of their own. The index of an icopoint is its id.
+
+    Attributes:
+        hierarchy (IcoHierarchy): The icosphere.
+        max_level (int): The deepest level.
+        xyz (NDArray[np.float64]): The (n, 3) coordinates.
+        levels (NDArray[np.int64]): The level of each icopoint.
+        parents (NDArray[np.int64]): The (n, 2) ids of the ends of the edge
+            each icopoint was subdivided from, or -1.
+    """
+
+    hierarchy: IcoHierarchy
+    max_level: int
+    xyz: NDArray[np.float64]
+    levels: NDArray[np.int64]
+    parents: NDArray[np.int64]
+
+    def __init__(self, hierarchy: IcoHierarchy, max_level: int) -> None:
+        self.hierarchy = hierarchy
+        self.max_level = max_level
+        n = int(hierarchy.level_ends[max_level])
+        self.xyz = hierarchy.xyz[:n]
+        self.levels = hierarchy.levels[:n]
+        self.parents = hierarchy.parents[:n]
+
+    def __len__(self) -> int:
+        return len(self.xyz)
+
+    def __getitem__(self, id: int) -> IcoPoint:
+        coord_3D = Coord3D(*self.xyz[id].tolist())
+        parent_1, parent_2 = self.parents[id].tolist()
+        return IcoPoint(
+            id=int(id),
+            ms_level=int(self.levels[id]),
+            coord_3D=coord_3D,
+            coord_geo=coord_3D.to_lon_lat(),
+            parent_1=parent_1,
+            parent_2=parent_2,
         )
-        ico_points_ms[i] = ico_pt
-
-    ico_points_base_kd = KDTree([pt.coord_3D.to_list() for pt in ico_points_ms.values()])
-
-
-    outside = 0
-    outside_after_flip = 0
-    for line in lines:
-        line_points_ms[line.id] = {}
-        for ms_level in range(0, subdivs+1):
-            line_points_ms[line.id][ms_level] = {}
-
-        for i, pt in enumerate(line.coords):
-            coord_3D = pt.to_3D().to_list()
-
-            closest_dists: list[float]
-            closest_idx: list[int]
-            closest_dists, closest_idx = ico_points_base_kd.query(coord_3D, 4)  # type: ignore
-            closest_points = [ico_points_ms[closest_idx[0]],
-                              ico_points_ms[closest_idx[1]],
-                              ico_points_ms[closest_idx[2]]]
-
-            # Get two of the edges and the normal of the triangle closest_3 make up
-            tri_edge_1 = closest_points[1].coord_3D - closest_points[0].coord_3D
-            tri_edge_2 = closest_points[2].coord_3D - closest_points[0].coord_3D
-            tri_normal = np.cross(tri_edge_1.to_list(), tri_edge_2.to_list())
-
-            # Project the point onto the plane formed by the three points
-            n = np.dot(closest_points[0].coord_3D.to_list(), tri_normal) 
-            d = np.dot(coord_3D, tri_normal)
-            scale = n / d
-            projected_pt_list = np.multiply(coord_3D, scale)
-            projected_pt = Coord3D(projected_pt_list[0], projected_pt_list[1], projected_pt_list[2])
-            
-            # Check if point is inside the triangle
-            u = tri_edge_1.to_ndarray() / np.linalg.norm(tri_edge_1.to_ndarray())
-            v = np.cross(tri_normal, u)
-            v = v / np.linalg.norm(v)
-            transform = np.vstack([u, v])
-
-            points = np.vstack([[pt.coord_3D.to_ndarray() for pt in closest_points], projected_pt_list])
-            points_2D = np.dot(points - points[0], transform.T)
-            is_inside = inside_check(points_2D[3], points_2D[:3])
-            if not is_inside:
-                outside += 1
-                flip_point_projected = np.dot(ico_points_ms[closest_idx[3]].coord_3D.to_ndarray() - points[0], transform.T)
-                closest_idx[2] = closest_idx[3]
-                points_2D[2] = flip_point_projected
-
-                is_inside = inside_check(points_2D[3], points_2D[:3])
-                if not is_inside:
-                    outside_after_flip += 1
-
-            # Check if the current point is the closest of any other line point to its closest ico point
-            if closest_idx[0] not in line_points_ms[line.id][0]:
-                line_points_ms[line.id][0][closest_idx[0]] = (i, closest_dists[0])
-            elif line_points_ms[line.id][0][closest_idx[0]][1] > closest_dists[0]:
-                line_points_ms[line.id][0][closest_idx[0]] = (i, closest_dists[0])
-
-            for ms_level in range(1, subdivs+1):
-                # Check for degen triangle ?
-                edges = [tuple(sorted(edge)) for edge in combinations(closest_idx[:3], 2)]
-                local_points = [ico_points_ms[closest_idx[0]],
-                                ico_points_ms[closest_idx[1]],
-                                ico_points_ms[closest_idx[2]]]
-
-                for edge in edges:
-                    if edge in subdivided_edges:
-                        local_points += [ico_points_ms[subdivided_edges[edge]]]
-                        continue
-                    
-
-                    subdivided_point = ico_points_ms[edge[0]].coord_3D.mid_point(ico_points_ms[edge[1]].coord_3D)
-                    id = len(ico_points_ms)
-                    subdivided_edges[edge] = id
-
-                    ico_points_ms[id] = IcoPoint(
-                        id=id,
-                        ms_level=ms_level,
-                        parent_1=edge[0],
-                        parent_2=edge[1],
-                        coord_3D=subdivided_point,
-                        coord_geo=subdivided_point.to_lon_lat()
-                    )
-                    local_points += [ico_points_ms[id]]
-
-                closest_idx = [ico_pt.id for ico_pt in sorted(local_points, 
-                                                              key=lambda ico_pt: projected_pt.dist(ico_pt.coord_3D))][:3]
-
-                dist = ico_points_ms[closest_idx[0]].coord_3D.dist(projected_pt)
-                if closest_idx[0] not in line_points_ms[line.id][ms_level]:
-                    line_points_ms[line.id][ms_level][closest_idx[0]] = (i, dist)
-                elif line_points_ms[line.id][ms_level][closest_idx[0]][1] > dist:
-                    line_points_ms[line.id][ms_level][closest_idx[0]] = (i, dist)
-
-
-    # print(f"{outside} points outside and needed flipping...")
-    # print(f"{outside_after_flip} points still outside after flipping...")
-
-    return ico_points_ms, line_points_ms
+
+    def lon_lat(self) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """The longitudes and latitudes of the icopoints."""
+        return self.hierarchy.to_lon_lat(self.max_level)
+
+    def to_dict(self) -> dict[int, IcoPoint]:
+        """The icopoints as IcoPoint objects, by id."""
+        coords = Coord3DArray(self.xyz)
+        coords_geo = coords.to_lon_lat()
+        levels = self.levels.tolist()
+        parents = self.parents.tolist()
+
+        return {
+            i: IcoPoint(
+                id=i,
+                ms_level=levels[i],
+                coord_3D=coords[i],
+                coord_geo=coords_geo[i],
+                parent_1=parents[i][0],
+                parent_2=parents[i][1],
+            )
+            for i in range(len(coords))
+        }
+
+
+class LinePointsMS:
+    """The closest points of lines to icopoints at every multiscale level.
+
+    The points of each level are a record array of LINE_POINT_DTYPE, sorted
+    by line and, within a line, by the first point of the line closest to
+    the icopoint.
+
+    Attributes:
+        ids (list[str]): The ids of the lines.
+        levels (list[NDArray[np.void]]): The points of each level.
+        line_starts (list[NDArray[np.int64]]): The points of line i at
+            level L are levels[L][line_starts[L][i]:line_starts[L][i + 1]].
+    """
+
+    ids: list[str]
+    levels: list[NDArray[np.void]]
+    line_starts: list[NDArray[np.int64]]
+
+    def __init__(self, ids: list[str], levels: list[NDArray[np.void]]) -> None:
+        self.ids = ids
+        self.levels = levels
+        self.line_starts = [
+            np.searchsorted(points["line"], np.arange(len(ids) + 1)).astype(np.int64)
+            for points in levels
+        ]
+
+    @classmethod
+    def from_dict(cls, lines: LineSet, line_points_ms: LinePointsDict) -> LinePointsMS:
+        """Converts the nested dicts returned by multiscale."""
+        levels: list[NDArray[np.void]] = []
+        for ms_level in range(len(next(iter(line_points_ms.values()), {}))):
+            records = [
+                (line, ico_id, i, dist)
+                for line, line_id in enumerate(lines.ids)
+                for ico_id, (i, dist) in line_points_ms[line_id][ms_level].items()
+            ]
+            levels.append(np.array(records, dtype=LINE_POINT_DTYPE))
+
+        return cls(list(lines.ids), levels)
+
+    def line_points(self, line: int, ms_level: int) -> NDArray[np.void]:
+        """The points of a line at a level."""
+        starts = self.line_starts[ms_level]
+        return self.levels[ms_level][starts[line]:starts[line + 1]]
+
+    def to_dict(self) -> LinePointsDict:
+        """Converts the points to nested dicts, as returned by multiscale."""
+        line_points_ms: LinePointsDict = {line_id: {} for line_id in self.ids}
+        for ms_level, points in enumerate(self.levels):
+            for line_id, line_points in zip(self.ids, np.split(points, self.line_starts[ms_level][1:-1])):
+                line_points_ms[line_id][ms_level] = dict(zip(
+                    line_points["ico"].tolist(),
+                    zip(line_points["point"].tolist(), line_points["dist"].tolist()),
+                ))
+
+        return line_points_ms
+
+
+def closest_per_ico_point(
+    lines: LineSet,
+    closest: NDArray[np.int64],
+    dists: NDArray[np.float64],
+) -> NDArray[np.void]:
+    """Finds the point of each line closest to each icopoint any of its points is closest to.
+
+    :param lines: The lines.
+    :param closest: The closest icopoint of each point.
+    :param dists: The distance of each point to its closest icopoint.
+    :return: The closest points as a record array of LINE_POINT_DTYPE,
+        sorted by line and then by where the line first reaches the icopoint.
+        Ties go to the first point.
+    """
+    point_lines = lines.point_lines
+    point_idx = np.arange(len(closest)) - lines.offsets[point_lines]
+    n_ico = int(closest.max(initial=0)) + 1
+    keys = point_lines * n_ico + closest
+
+    # The closest point of each group, and where each group is first reached
+    order = np.lexsort((point_idx, dists, keys))
+    group_keys, group_starts = np.unique(keys[order], return_index=True)
+    best = order[group_starts]
+    _, first_reached = np.unique(keys, return_index=True)
+
+    # Groups sorted by line, then by where they are first reached
+    best = best[np.lexsort((first_reached, group_keys // n_ico))]
+
+    points = np.empty(len(best), dtype=LINE_POINT_DTYPE)
+    points["line"] = point_lines[best]
+    points["ico"] = closest[best]
+    points["point"] = point_idx[best]
+    points["dist"] = dists[best]
+
+    return points
+
+
+def multiscale_arrays(lines: LineSet, subdivs: int) -> tuple[IcoPointArrays, LinePointsMS]:
+    """Maps the points of lines to the closest points of a subdivided icosphere.
+
+    The icosphere is the fixed hierarchy of ico_hierarchy.py, so the ids of
+    the icopoints are the same for every set of lines. Every point is
+    assigned to its closest icopoint at each level by a lookup in the
+    KD-tree of the level.
+
+    :param lines: The lines to map.
+    :param subdivs: The number of subdivision levels.
+    :return: (ico_points, line_points) : the icopoints of all levels, and for
+        each level the point of each line closest to each icopoint, see
+        closest_per_ico_point
+    """
+    hierarchy = load_ico_hierarchy(subdivs)
+
+    levels: list[NDArray[np.void]] = []
+    for ms_level in range(subdivs + 1):
+        dists, closest = hierarchy.closest(lines.xyz, ms_level)
+        levels.append(closest_per_ico_point(lines, closest, dists))
+
+    return IcoPointArrays(hierarchy, subdivs), LinePointsMS(list(lines.ids), levels)
+
+
+def multiscale(lines: LineSet, subdivs: int) -> tuple[dict[int, IcoPoint], LinePointsDict]:
+    """Maps the points of lines to the closest points of a subdivided icosphere.
+
+    See multiscale_arrays, which this converts to dicts. The dicts take a lot
+    of memory for deep levels and many lines, prefer multiscale_arrays there.
+
+    :return: (ico_points_ms, line_points_ms) : the icopoints of all levels by
+        id, and for each line and level the index and distance of the point
+        of the line closest to each icopoint, by icopoint id
+    """
+    ico_points, line_points = multiscale_arrays(lines, subdivs)
+    return ico_points.to_dict(), line_points.to_dict()
@@ -0,0 +1,287 @@
+"""An array backed representation of networks.
+
+A Network stores every node and edge as Python strings and dicts, which is
+slow to build, look up and store for many timesteps. NetworkArrays holds the
+same network as a few flat arrays: the node ids are split into their ensemble
+and line numbers, the edges are a CSR adjacency matrix over the node indices
+and the clusters are integer labels.
+
+Many networks can be stored in one file with save_networks. The arrays of
+all networks are concatenated and written with line_cache.write_arrays, so
+load_networks only maps the file and slices views of it. add_networks does
+not rewrite the file, it writes the new networks to a numbered segment file
+next to it, and the segments are only merged into the file once there are
+MAX_SEGMENTS of them.
+"""
+from __future__ import annotations
+
+from functools import cached_property
+import json
+import os
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+from data import Network, TypedConnection
+from line_cache import read_arrays, write_arrays
+
+
+# Bump when the layout of the stored arrays changes
+NETWORK_STORE_VERSION = 2
+
+# The number of segments add_networks writes before merging them into the store
+MAX_SEGMENTS = 32
+
+# The dtype of each array of NetworkArrays
+ARRAY_DTYPES: dict[str, type[np.generic]] = {
+    "ens_ids": np.int32,
+    "line_ids": np.int32,
+    "node_clusters": np.int32,
+    "indptr": np.int64,
+    "indices": np.int32,
+    "weights": np.float64,
+    "edge_clusters": np.int32,
+    "clusters": np.int32,
+}
+
+
+class NetworkArrays:
+    """A network stored as arrays indexed by node.
+
+    Attributes:
+        ens_ids (NDArray[np.int32]): The first part of each node id, the
+            ensemble member of the line, or its time if the lines are
+            identified by time, see LineSet.id_field.
+        line_ids (NDArray[np.int32]): The second part of each node id, the
+            id of the line.
+        node_clusters (NDArray[np.int32]): The cluster of each node, or -1.
+        indptr (NDArray[np.int64]): The CSR row pointers of the edges. The
+            edges from node i are at indptr[i]:indptr[i + 1].
+        indices (NDArray[np.int32]): The target node of each edge.
+        weights (NDArray[np.float64]): The weight of each edge.
+        edge_clusters (NDArray[np.int32]): The cluster each edge is part of.
+        clusters (NDArray[np.int32]): The ids of all clusters.
+    """
+
+    ens_ids: NDArray[np.int32]
+    line_ids: NDArray[np.int32]
+    node_clusters: NDArray[np.int32]
+    indptr: NDArray[np.int64]
+    indices: NDArray[np.int32]
+    weights: NDArray[np.float64]
+    edge_clusters: NDArray[np.int32]
+    clusters: NDArray[np.int32]
+
+    def __init__(
+        self,
+        ens_ids: NDArray[np.int32],
+        line_ids: NDArray[np.int32],
+        node_clusters: NDArray[np.int32],
+        indptr: NDArray[np.int64],
+        indices: NDArray[np.int32],
+        weights: NDArray[np.float64],
+        edge_clusters: NDArray[np.int32],
+        clusters: NDArray[np.int32],
+    ) -> None:
+        self.ens_ids = ens_ids
+        self.line_ids = line_ids
+        self.node_clusters = node_clusters
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_clusters = edge_clusters
+        self.clusters = clusters
+
+    @classmethod
+    def from_network(cls, network: Network) -> NetworkArrays:
+        """Converts a Network, as built by generate_network or read back from JSON.
+
+        The edges are sorted by source and target.
+        """
+        ids = [node["id"] for node in network["nodes"]]
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        id_parts = np.array([node_id.split("|") for node_id in ids], dtype=np.int32).reshape(-1, 2)
+
+        edges = [
+            (index[connection["source"]], index[connection["target"]], connection["weight"], int(cluster))
+            for cluster, connections in network["clusters"].items()
+            for connection in connections
+        ]
+        sources, targets, weights, edge_clusters = (np.array(column) for column in zip(*edges)) if edges else (np.empty(0),) * 4
+
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[order].astype(np.int64), minlength=len(ids)), out=indptr[1:])
+
+        return cls(
+            ens_ids=id_parts[:, 0].copy(),
+            line_ids=id_parts[:, 1].copy(),
+            node_clusters=np.array([network["node_clusters"][node_id] for node_id in ids], dtype=np.int32),
+            indptr=indptr,
+            indices=targets[order].astype(np.int32),
+            weights=weights[order].astype(np.float64),
+            edge_clusters=edge_clusters[order].astype(np.int32),
+            clusters=np.array([int(cluster) for cluster in network["clusters"]], dtype=np.int32),
+        )
+
+    def to_network(self) -> Network:
+        """Converts the arrays back into a Network.
+
+        The edges of each cluster are listed by source and target.
+        """
+        ids = self.ids
+        sources = np.repeat(np.arange(len(ids)), np.diff(self.indptr))
+
+        clusters: dict[int, list[TypedConnection]] = {cluster: [] for cluster in self.clusters.tolist()}
+        for source, target, weight, cluster in zip(sources.tolist(), self.indices.tolist(), self.weights.tolist(), self.edge_clusters.tolist()):
+            clusters[cluster].append(TypedConnection(source=ids[source], target=ids[target], weight=weight))
+
+        return {
+            "nodes": [{"id": node_id} for node_id in ids],
+            "clusters": clusters,
+            "node_clusters": dict(zip(ids, self.node_clusters.tolist())),
+        }
+
+    def __len__(self) -> int:
+        return len(self.ens_ids)
+
+    @cached_property
+    def ids(self) -> list[str]:
+        """The ids of the nodes, see Line.id."""
+        return [f"{e}|{l}" for e, l in zip(self.ens_ids.tolist(), self.line_ids.tolist())]
+
+    @cached_property
+    def node_index(self) -> dict[str, int]:
+        """The index of each node by id."""
+        return {node_id: i for i, node_id in enumerate(self.ids)}
+
+    def indices_of(self, ids: list[str]) -> NDArray[np.int64]:
+        """Looks up the indices of nodes by id."""
+        node_index = self.node_index
+        return np.array([node_index[node_id] for node_id in ids], dtype=np.int64)
+
+    def copy(self) -> NetworkArrays:
+        """Copies the arrays, detaching them from the file they were loaded from."""
+        return NetworkArrays(**{name: arr.copy() for name, arr in self.arrays().items()})
+
+    def arrays(self) -> dict[str, NDArray[Any]]:
+        """The arrays of the network by name, see ARRAY_DTYPES."""
+        return {name: getattr(self, name) for name in ARRAY_DTYPES}
+
+
+def as_network_arrays(network: Network | NetworkArrays) -> NetworkArrays:
+    """Converts a Network to NetworkArrays, passing NetworkArrays through."""
+    if isinstance(network, NetworkArrays):
+        return network
+
+    return NetworkArrays.from_network(network)
+
+
+def save_networks(path: str, networks: dict[str, NetworkArrays]) -> None:
+    """Writes networks to a single file, replacing the networks stored there.
+
+    The arrays of the same name are concatenated over all networks, and the
+    range of each network in them is stored in the header.
+
+    :param path: The path of the file.
+    :param networks: The networks to store, by key.
+    """
+    write_store(path, networks)
+    for segment in segment_paths(path):
+        os.remove(segment)
+
+
+def load_networks(path: str) -> dict[str, NetworkArrays]:
+    """Reads the networks written by save_networks and add_networks.
+
+    The arrays are read-only views of memory maps of the files. A missing
+    file or a file written by another version gives no networks.
+    """
+    networks: dict[str, NetworkArrays] = {}
+    for store_path in [path] + segment_paths(path):
+        networks.update(read_store(store_path))
+
+    return networks
+
+
+def add_networks(path: str, networks: dict[str, NetworkArrays]) -> None:
+    """Adds networks to the file written by save_networks, replacing those with the same keys.
+
+    Only the new networks are written, to the next segment of the file. Once
+    there are MAX_SEGMENTS segments all networks are written to the file
+    again and the segments are removed.
+    """
+    segments = segment_paths(path)
+    if len(segments) + 1 < MAX_SEGMENTS:
+        number = int(segments[-1].rsplit(".", 1)[1]) + 1 if segments else 1
+        write_store(f"{path}.{number}", networks)
+        return
+
+    stored = {key: network.copy() for key, network in load_networks(path).items()}
+    stored.update(networks)
+    save_networks(path, stored)
+
+
+def convert_json_store(json_path: str, path: str) -> bool:
+    """Converts networks stored as JSON, the format used before this store, into the file at path.
+
+    Nothing is done if the file at path already exists or there is no JSON
+    file, so this can be run every time the networks are loaded. The JSON
+    file is left in place.
+
+    :param json_path: The path of the JSON file, a dict of Networks by key.
+    :param path: The path of the file to write, see save_networks.
+    :return: Whether the networks were converted.
+    """
+    if os.path.exists(path) or not os.path.exists(json_path):
+        return False
+
+    with open(json_path, "r") as f:
+        networks: dict[str, Network] = json.load(f)
+
+    save_networks(path, {key: NetworkArrays.from_network(network) for key, network in networks.items()})
+    return True
+
+
+def segment_paths(path: str) -> list[str]:
+    """The paths of the segments add_networks wrote next to a file, in the order they were written."""
+    folder = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    if not os.path.isdir(folder):
+        return []
+
+    numbers = sorted(
+        int(name[len(prefix):]) for name in os.listdir(folder)
+        if name.startswith(prefix) and name[len(prefix):].isdigit()
+    )
+    return [os.path.join(os.path.dirname(path), f"{prefix}{number}") for number in numbers]
+
+
+def write_store(path: str, networks: dict[str, NetworkArrays]) -> None:
+    """Writes networks to one file, see save_networks."""
+    ranges: dict[str, dict[str, list[int]]] = {key: {} for key in networks}
+    arrays: dict[str, NDArray[Any]] = {}
+    for name, dtype in ARRAY_DTYPES.items():
+        columns = [network.arrays()[name] for network in networks.values()]
+        bounds = np.cumsum([0] + [len(arr) for arr in columns]).tolist()
+        for key, start, stop in zip(networks, bounds[:-1], bounds[1:]):
+            ranges[key][name] = [start, stop]
+        arrays[name] = np.concatenate(columns).astype(dtype) if columns else np.empty(0, dtype=dtype)
+
+    write_arrays(path, arrays, {"version": NETWORK_STORE_VERSION, "networks": ranges})
+
+
+def read_store(path: str) -> dict[str, NetworkArrays]:
+    """Reads the networks of one file, see load_networks."""
+    if not os.path.exists(path):
+        return {}
+
+    meta, arrays = read_arrays(path)
+    if meta.get("version") != NETWORK_STORE_VERSION:
+        return {}
+
+    return {
+        key: NetworkArrays(**{name: arrays[name][start:stop] for name, (start, stop) in ranges.items()})
+        for key, ranges in meta["networks"].items()
+    }
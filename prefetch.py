@@ -0,0 +1,87 @@
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class Prefetcher:
+    """Computes data the user is likely to ask for next on a background thread.
+
+    Jobs are identified by a key. Scheduling a new set of jobs cancels the
+    pending jobs that are not part of the new set, so work for a part of the
+    forecast the user has moved away from is dropped. A job that has already
+    started can not be stopped, but it is allowed to finish since its result
+    is cached by the job itself.
+
+    Attributes:
+        executor (ThreadPoolExecutor): The threads running the jobs.
+        futures (dict[Hashable, Future]): The scheduled jobs by key.
+        lock (Lock): Guards futures.
+    """
+
+    executor: ThreadPoolExecutor
+    futures: dict[Hashable, Future[Any]]
+    lock: Lock
+
+    def __init__(self, max_workers: int = 1) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.futures = {}
+        self.lock = Lock()
+
+    def schedule(self, jobs: list[tuple[Hashable, Callable[[], Any]]]) -> None:
+        """Schedules jobs, cancelling pending jobs that are not among them.
+
+        Jobs are started in the order given. A job with the same key as one
+        that is already scheduled is not scheduled again.
+
+        :param jobs: The key and function of each job.
+        """
+        keys = {key for key, _ in jobs}
+        with self.lock:
+            for key, future in list(self.futures.items()):
+                if future.done() or (key not in keys and future.cancel()):
+                    del self.futures[key]
+
+            for key, fn in jobs:
+                if key not in self.futures:
+                    self.futures[key] = self.executor.submit(fn)
+
+    def cancel(self) -> None:
+        """Cancels all jobs that have not started yet."""
+        self.schedule([])
+
+    def wait(self, key: Hashable) -> bool:
+        """Waits for a scheduled job to finish.
+
+        Lets a request for data that is being prefetched wait for the job
+        instead of computing the same data a second time.
+
+        :param key: The key of the job.
+        :return: True if a job with the key was scheduled and finished
+            without errors, False otherwise.
+        """
+        with self.lock:
+            future = self.futures.get(key)
+
+        if future is None:
+            return False
+
+        # The job can be cancelled by a schedule call on another thread while
+        # this one is waiting for it
+        try:
+            return future.exception() is None
+        except CancelledError:
+            return False
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+
+def previous_time_offset(time_offset: int) -> int:
+    """The timestep before a time offset, steps are 3h up to 72h and 6h after."""
+    return time_offset - (3 if time_offset < 78 else 6)
+
+
+def next_time_offset(time_offset: int) -> int:
+    """The timestep after a time offset, steps are 3h up to 72h and 6h after."""
+    return time_offset + (3 if time_offset < 72 else 6)
@@ -0,0 +1,145 @@
+"""Numpy arrays backed by shared memory blocks.
+
+Lets worker processes in a process pool read or fill large arrays owned by
+the parent process without pickling them. The parent creates a SharedArrays
+and passes its handle to the workers, which attach to the same blocks:
+
+    # In the parent
+    with SharedArrays({"lon": ((n,), np.float64)}) as shared:
+        executor.map(partial(work, handle=shared.handle()), ...)
+        lon = shared["lon"].copy()
+        # or, to keep the arrays without copying them
+        lon = shared.release()["lon"]
+
+    # In the worker
+    with SharedArrays.attach(handle) as shared:
+        shared["lon"][i:j] = ...
+"""
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+from typing import Any
+
+import numpy as np
+from numpy.typing import DTypeLike, NDArray
+
+
+# The picklable description of a set of shared arrays:
+# array name -> (shared memory block name, shape, dtype)
+SharedHandle = dict[str, tuple[str, tuple[int, ...], str]]
+
+
+class SharedArrays:
+    """A set of named arrays stored in shared memory.
+
+    The process that creates the arrays owns the memory blocks and frees
+    them when closed. Views of the arrays must not be kept after closing,
+    copy out anything that is needed first.
+    """
+
+    blocks: dict[str, shared_memory.SharedMemory]
+    arrays: dict[str, NDArray[Any]]
+    owner: bool
+
+    def __init__(self, specs: dict[str, tuple[tuple[int, ...], DTypeLike]]) -> None:
+        """Creates zero initialized shared arrays.
+
+        Parameters
+        ----------
+        specs : the shape and dtype of each array, by name
+        """
+        self.blocks = {}
+        self.arrays = {}
+        self.owner = True
+
+        for name, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            # Shared memory blocks can not be empty
+            size = max(1, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            self.arrays[name].fill(0)
+
+    @classmethod
+    def attach(cls, handle: SharedHandle) -> SharedArrays:
+        """Attaches to shared arrays created by another process."""
+        shared = cls.__new__(cls)
+        shared.blocks = {}
+        shared.arrays = {}
+        shared.owner = False
+
+        for name, (block_name, shape, dtype) in handle.items():
+            # Pool workers share the resource tracker of the parent process, so
+            # attaching does not make the worker free the block when it exits.
+            block = shared_memory.SharedMemory(name=block_name)
+            shared.blocks[name] = block
+            shared.arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+        return shared
+
+    def handle(self) -> SharedHandle:
+        """Returns the handle other processes use to attach to the arrays."""
+        return {
+            name: (self.blocks[name].name, arr.shape, arr.dtype.str)
+            for name, arr in self.arrays.items()
+        }
+
+    def __getitem__(self, name: str) -> NDArray[Any]:
+        return self.arrays[name]
+
+    def release(self) -> dict[str, NDArray[Any]]:
+        """Hands the arrays over to the caller without copying them.
+
+        Only the process that created the arrays can release them. The blocks
+        are unlinked, so no process can attach to them any more, and each is
+        unmapped once the last array using it is freed. The SharedArrays is
+        empty afterwards.
+        """
+        if not self.owner:
+            raise ValueError("Only the process that created the arrays can release them")
+
+        arrays: dict[str, NDArray[Any]] = {}
+        for name, block in self.blocks.items():
+            mapped = MappedBlock(block, self.arrays[name])
+            block.unlink()
+            arrays[name] = np.asarray(mapped)
+
+        self.arrays = {}
+        self.blocks = {}
+        return arrays
+
+    def close(self) -> None:
+        """Detaches from the arrays, freeing them if this process owns them."""
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+    def __enter__(self) -> SharedArrays:
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+
+class MappedBlock:
+    """Keeps a shared memory block mapped for as long as arrays use it.
+
+    Numpy arrays made from it with np.asarray reference it as their base,
+    so the block is closed once the last of them is freed.
+    """
+
+    block: shared_memory.SharedMemory
+
+    def __init__(self, block: shared_memory.SharedMemory, arr: NDArray[Any]) -> None:
+        self.block = block
+        # The address stays valid while the block is open. Not keeping arr
+        # itself lets the block close, which fails while views of it exist.
+        self.__array_interface__ = dict(arr.__array_interface__)
+
+    def __del__(self) -> None:
+        self.block.close()
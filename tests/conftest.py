@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the top of the repository and are imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from line_reader import LineSet, decode_lines  # noqa: E402
+
+
+def random_lines(rng: np.random.Generator, n_lines: int, n_ens: int = 1, center_lon: float = 0.0) -> LineSet:
+    """Random walks on the globe, like the lines of a few ensemble members at one time."""
+    line_sets = []
+    for ens_id in range(n_ens):
+        lon, lat, line_ids = [], [], []
+        for line_id in range(n_lines):
+            n_points = int(rng.integers(2, 30))
+            lon.append(center_lon + rng.uniform(-20, 20) + np.cumsum(rng.normal(0.5, 0.3, n_points)))
+            lat.append(rng.uniform(30, 60) + np.cumsum(rng.normal(0, 0.3, n_points)))
+            line_ids.append(np.full(n_points, line_id))
+
+        lon = (np.concatenate(lon) + 180) % 360 - 180
+        line_sets.append(decode_lines(
+            lon, np.concatenate(lat), np.zeros(len(lon), dtype=np.int32), np.concatenate(line_ids), ens_id,
+        ))
+
+    return LineSet.concatenate(line_sets)
+
+
+@pytest.fixture
+def rng() -> np.random.Generator:
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    """Runs a test in an empty folder, so the caches it writes do not end up in the repository."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,19 @@
+import numpy as np
+
+import kernels
+from conftest import random_lines
+from data import EARTH_RADIUS
+
+
+def test_pair_close_counts_single_pass_matches_both_directions(rng):
+    lines = random_lines(rng, n_lines=30)
+    pairs = np.array([(i, j) for i in range(len(lines)) for j in range(i + 1, len(lines))], dtype=np.int64)
+    max_chord = 100 / EARTH_RADIUS
+
+    counts = kernels.pair_close_counts(lines.xyz, lines.offsets, pairs, max_chord, 0.0)
+
+    offsets = lines.offsets
+    for (i, j), (count_ij, count_ji) in zip(pairs, counts):
+        assert count_ij == kernels.count_close_points(lines.xyz, offsets[i], offsets[i + 1], offsets[j], offsets[j + 1], max_chord, 0.0)
+        assert count_ji == kernels.count_close_points(lines.xyz, offsets[j], offsets[j + 1], offsets[i], offsets[i + 1], max_chord, 0.0)
+    assert counts.sum() > 0
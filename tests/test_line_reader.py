@@ -0,0 +1,143 @@
+import math
+
+import numpy as np
+import pytest
+
+from coords import Coord3D, CoordGeo
+from line_reader import LOD_TOLERANCES, Region, decode_lines, line_importance, lon_lat_to_3D
+
+
+def read_lines_per_line(lon, lat, times, line_ids, ens_id):
+    """The lines of an ensemble file as the per-line reader built them, one group of points at a time."""
+    groups: dict[tuple[int, int], list[int]] = {}
+    for i, key in enumerate(zip(times.tolist(), line_ids.tolist())):
+        groups.setdefault(key, []).append(i)
+
+    lines = []
+    for (time, line_id), idx in sorted(groups.items()):
+        coords = [CoordGeo(lon[i], lat[i]) for i in idx]
+        if max(lon[idx]) - min(lon[idx]) > 180:
+            coords = [CoordGeo(c.lon + 360, c.lat) if c.lon < 0 else c for c in coords]
+
+        centroid = Coord3D(0, 0, 0)
+        for coord in coords:
+            centroid += coord.to_3D()
+
+        lines.append((f"{ens_id}|{line_id}", time, coords, (centroid * (1 / len(coords))).to_lon_lat()))
+
+    return lines
+
+
+def file_columns(rng, n_lines=40):
+    """Points of lines at a few times, shuffled like the rows of an ensemble file can be."""
+    lon, lat, times, line_ids = [], [], [], []
+    for i in range(n_lines):
+        n_points = int(rng.integers(1, 20))
+        start = rng.uniform(-180, 180)
+        lon.append((start + np.cumsum(rng.normal(2, 1, n_points)) + 180) % 360 - 180)
+        lat.append(rng.uniform(-80, 80) + np.cumsum(rng.normal(0, 1, n_points)))
+        times.append(np.full(n_points, 3 * (i % 4)))
+        line_ids.append(np.full(n_points, i // 4 + 1.0))
+
+    # The rows of the lines are interleaved, keeping the order of the points of each line
+    line_of_point = np.concatenate([np.full(len(x), i) for i, x in enumerate(lon)])
+    rows = np.argsort(rng.permutation(line_of_point), kind="stable")
+    columns = []
+    for column in (lon, lat, times, line_ids):
+        shuffled = np.empty(len(rows))
+        shuffled[rows] = np.concatenate(column)
+        columns.append(shuffled)
+
+    return columns
+
+
+def test_decode_lines_matches_per_line_reader(rng):
+    lon, lat, times, line_ids = file_columns(rng)
+    lines = decode_lines(lon, lat, times, line_ids, ens_id=7)
+    expected = read_lines_per_line(lon, lat, times, line_ids.astype(int), 7)
+
+    assert len(lines) == len(expected)
+    for line, (line_id, time, coords, centroid) in zip(lines, expected):
+        assert line.id == line_id
+        assert lines.times[line.index] == time
+        np.testing.assert_allclose(line.lon, [c.lon for c in coords])
+        np.testing.assert_allclose(line.lat, [c.lat for c in coords])
+        assert line.centroid.lon == pytest.approx(centroid.lon, abs=1e-9)
+        assert line.centroid.lat == pytest.approx(centroid.lat, abs=1e-9)
+
+
+def test_decode_lines_empty():
+    lines = decode_lines(np.empty(0), np.empty(0), np.empty(0), np.empty(0), ens_id=0)
+    assert len(lines) == 0
+
+
+def test_region_across_dateline():
+    region = Region(min_lon=170, max_lon=-170, min_lat=0, max_lat=10)
+    lon = np.array([175.0, -175.0, 180.0, 190.0, 0.0, 160.0, -160.0, 175.0])
+    lat = np.array([5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 20.0])
+
+    np.testing.assert_array_equal(region.contains(lon, lat), [True, True, True, True, False, False, False, False])
+
+
+def test_decode_lines_region_across_dateline():
+    # A line crossing the dateline, one just west of the box and one far away
+    lon = np.array([178.0, -178.0, 160.0, 165.0, 10.0, 20.0])
+    lat = np.full(6, 5.0)
+    line_ids = np.array([1, 1, 2, 2, 3, 3])
+    region = Region(min_lon=170, max_lon=-170, min_lat=0, max_lat=10)
+
+    lines = decode_lines(lon, lat, np.zeros(6), line_ids, ens_id=0, region=region)
+
+    assert lines.ids == ["0|1"]
+    # The dateline fix is applied to the lines that are kept
+    np.testing.assert_allclose(lines.lon, [178.0, 182.0])
+    np.testing.assert_array_equal(lines.offsets, [0, 2])
+
+
+def test_region_band_and_bounds():
+    assert Region.from_bounds() is None
+    band = Region.band(-10, 10)
+    assert band.all_lons
+    np.testing.assert_array_equal(band.contains(np.array([-179.0, 179.0]), np.array([0.0, 11.0])), [True, False])
+    with pytest.raises(ValueError):
+        Region(min_lat=10, max_lat=0)
+
+
+def douglas_peucker(xyz, tolerance):
+    """The indices kept by the recursive Douglas-Peucker algorithm on the sphere, tolerance in degrees."""
+    def arc_to_great_circle(point, start, end):
+        normal = np.cross(start, end)
+        if np.linalg.norm(normal) < 1e-12:
+            return math.degrees(2 * math.asin(min(np.linalg.norm(point - start) / 2, 1)))
+        return math.degrees(abs(math.asin(np.clip(point @ (normal / np.linalg.norm(normal)), -1, 1))))
+
+    def simplify(first, last):
+        if last - first < 2:
+            return []
+        dists = [arc_to_great_circle(xyz[i], xyz[first], xyz[last]) for i in range(first + 1, last)]
+        split = first + 1 + int(np.argmax(dists))
+        if max(dists) <= tolerance:
+            return []
+        return simplify(first, split) + [split] + simplify(split, last)
+
+    return [0] + simplify(0, len(xyz) - 1) + [len(xyz) - 1]
+
+
+def test_line_importance_matches_douglas_peucker(rng):
+    lengths = [2, 3, 10, 50, 200]
+    lon = np.concatenate([np.cumsum(rng.normal(0.2, 0.5, n)) for n in lengths])
+    lat = np.concatenate([45 + np.cumsum(rng.normal(0, 0.5, n)) for n in lengths])
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    xyz = lon_lat_to_3D(lon, lat)
+
+    importance = line_importance(xyz, offsets)
+
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        assert np.isinf(importance[start]) and np.isinf(importance[stop - 1])
+        for tolerance in LOD_TOLERANCES[1:]:
+            kept = np.flatnonzero(importance[start:stop] > tolerance).tolist()
+            assert kept == douglas_peucker(xyz[start:stop], tolerance)
+
+
+def test_line_importance_no_lines():
+    assert len(line_importance(np.empty((0, 3)), np.zeros(1, dtype=np.int64))) == 0
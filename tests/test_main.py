@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+# The server needs fastapi and the plotting packages of tracking.py
+main = pytest.importorskip("main")
+TestClient = pytest.importorskip("fastapi.testclient").TestClient
+
+from conftest import random_lines  # noqa: E402
+
+
+def test_get_centroids(rng, monkeypatch):
+    lines = random_lines(rng, n_lines=5)
+    monkeypatch.setattr(main, "get_all_lines_at_time", lambda *args, **kwargs: lines)
+
+    response = TestClient(main.app).get("/get-centroids", params={"time_offset": 0, "line_type": "jet"})
+
+    assert response.status_code == 200
+    centroids = response.json()
+    assert len(centroids) == len(lines)
+    np.testing.assert_allclose([[c["lon"], c["lat"]] for c in centroids], lines.centroids)
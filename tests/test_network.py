@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from conftest import random_lines
+from data import NetworkSweep, generate_network
+from multiscale import multiscale_arrays
+from network_arrays import NetworkArrays
+
+
+def edge_set(network):
+    return {
+        (connection["source"], connection["target"], round(connection["weight"], 12))
+        for connections in network["clusters"].values()
+        for connection in connections
+    }
+
+
+def cluster_sets(network):
+    members: dict[int, set[str]] = {}
+    for node_id, cluster in network["node_clusters"].items():
+        members.setdefault(int(cluster), set()).add(node_id)
+    return sorted(map(sorted, members.values()))
+
+
+@pytest.fixture
+def lines_ms(rng, in_tmp_path):
+    lines = random_lines(rng, n_lines=25, n_ens=4)
+    ico_points, line_points = multiscale_arrays(lines, 2)
+    return lines, ico_points, line_points
+
+
+@pytest.mark.parametrize("edge_weight", ["last", "max", "min", "mean"])
+def test_sweep_matches_generate_network(lines_ms, edge_weight):
+    lines, ico_points, line_points = lines_ms
+    sweep = NetworkSweep(lines, line_points, max_dist=100)
+
+    dist_thresholds, required_ratios = [25, 50, 100], [0.0, 0.05, 0.3]
+    sweep_networks = sweep.networks(dist_thresholds, required_ratios, edge_weight)
+
+    n_edges = 0
+    for swept in sweep_networks:
+        network = generate_network(
+            lines, ico_points, line_points, swept["dist_threshold"], swept["required_ratio"], edge_weight,
+        )
+        assert [node["id"] for node in swept["network"]["nodes"]] == [node["id"] for node in network["nodes"]]
+        assert edge_set(swept["network"]) == edge_set(network)
+        assert cluster_sets(swept["network"]) == cluster_sets(network)
+        n_edges += len(edge_set(network))
+
+    # The grid should not be trivial
+    assert n_edges > 0
+
+
+def test_sweep_rejects_larger_threshold(lines_ms):
+    lines, _, line_points = lines_ms
+    with pytest.raises(ValueError):
+        NetworkSweep(lines, line_points, max_dist=50).ratios(60)
+
+
+def test_generate_network_round_trips_through_arrays(lines_ms):
+    lines, ico_points, line_points = lines_ms
+    network = generate_network(lines, ico_points, line_points, 50, 0.05, "max")
+
+    restored = NetworkArrays.from_network(network).to_network()
+
+    assert edge_set(restored) == edge_set(network)
+    assert cluster_sets(restored) == cluster_sets(network)
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+import network_arrays
+from network_arrays import NetworkArrays, add_networks, convert_json_store, load_networks, save_networks, segment_paths
+
+
+def make_network(rng, n_nodes=12, n_edges=20) -> NetworkArrays:
+    ids = [f"{rng.integers(0, 50)}|{i}" for i in range(n_nodes)]
+    sources = rng.integers(0, n_nodes, n_edges)
+    targets = rng.integers(0, n_nodes, n_edges)
+    clusters: dict[int, list] = {}
+    node_clusters = {node_id: -1 for node_id in ids}
+    for source, target in zip(sources, targets):
+        cluster = int(min(source, target) % 3)
+        clusters.setdefault(cluster, []).append({"source": ids[source], "target": ids[target], "weight": float(rng.random())})
+        node_clusters[ids[source]] = node_clusters[ids[target]] = cluster
+
+    return NetworkArrays.from_network({
+        "nodes": [{"id": node_id} for node_id in ids],
+        "clusters": clusters,
+        "node_clusters": node_clusters,
+    })
+
+
+def assert_same(a: NetworkArrays, b: NetworkArrays):
+    for name, arr in a.arrays().items():
+        np.testing.assert_array_equal(b.arrays()[name], arr, err_msg=name)
+
+
+def test_network_round_trip(rng):
+    network = make_network(rng)
+    assert_same(NetworkArrays.from_network(network.to_network()), network)
+
+
+def test_save_load_round_trip(rng, tmp_path):
+    path = str(tmp_path / "networks.bin")
+    networks = {f"key{i}": make_network(rng) for i in range(3)}
+    networks["empty"] = make_network(rng, n_nodes=0, n_edges=0)
+
+    save_networks(path, networks)
+    loaded = load_networks(path)
+
+    assert list(loaded) == list(networks)
+    for key, network in networks.items():
+        assert_same(network, loaded[key])
+        assert loaded[key].weights.dtype == np.float64
+
+
+def test_load_missing_store(tmp_path):
+    assert load_networks(str(tmp_path / "missing.bin")) == {}
+
+
+def test_add_networks_segments_and_compacts(rng, tmp_path, monkeypatch):
+    monkeypatch.setattr(network_arrays, "MAX_SEGMENTS", 3)
+    path = str(tmp_path / "networks.bin")
+    expected = {"a": make_network(rng)}
+    save_networks(path, expected)
+
+    for i in range(4):
+        added = {f"new{i}": make_network(rng), "a": make_network(rng)}
+        add_networks(path, added)
+        expected.update(added)
+
+        loaded = load_networks(path)
+        assert sorted(loaded) == sorted(expected)
+        for key, network in expected.items():
+            assert_same(network, loaded[key])
+
+    # The third add merged the segments back into the store, the fourth started a new one
+    assert len(segment_paths(path)) == 1
+
+    save_networks(path, {"b": make_network(rng)})
+    assert segment_paths(path) == []
+    assert list(load_networks(path)) == ["b"]
+
+
+def test_convert_json_store(rng, tmp_path):
+    json_path, path = str(tmp_path / "networks.json"), str(tmp_path / "networks.bin")
+    networks = {f"key{i}": make_network(rng) for i in range(2)}
+    with open(json_path, "w") as f:
+        json.dump({key: network.to_network() for key, network in networks.items()}, f)
+
+    assert convert_json_store(json_path, path)
+    loaded = load_networks(path)
+    for key, network in networks.items():
+        assert_same(network, loaded[key])
+
+    # An existing store is never overwritten
+    add_networks(path, {"new": make_network(rng)})
+    assert not convert_json_store(json_path, path)
+    assert "new" in load_networks(path)
+    assert not convert_json_store(str(tmp_path / "missing.json"), str(tmp_path / "other.bin"))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from conftest import random_lines
+from line_reader import LOD_TOLERANCES
+from wire import pack, pack_lines, pack_network, to_base64, unpack, unpack_lines, unpack_network
+
+
+def test_pack_round_trip():
+    arrays = {
+        "a": np.arange(5, dtype=np.int32),
+        "b": np.linspace(0, 1, 3, dtype=np.float64),
+        "c": np.array([1.5], dtype=np.float32),
+    }
+    buffer = pack(b"TEST", ["x", "y|1"], arrays)
+    ids, read = unpack(b"TEST", buffer)
+
+    assert ids == ["x", "y|1"]
+    for name, arr in arrays.items():
+        assert read[name].dtype == arr.dtype
+        np.testing.assert_array_equal(read[name], arr)
+    with pytest.raises(ValueError):
+        unpack(b"NOPE", buffer)
+
+
+@pytest.mark.parametrize("lod", range(len(LOD_TOLERANCES)))
+def test_pack_lines_round_trip(rng, lod):
+    lines = random_lines(rng, n_lines=10, n_ens=2)
+
+    unpacked = unpack_lines(pack_lines(lines, lod))
+
+    expected = [line.to_dict(lod) for line in lines]
+    assert [line["id"] for line in unpacked] == [line["id"] for line in expected]
+    for got, want in zip(unpacked, expected):
+        assert len(got["coords"]) == len(want["coords"])
+        for key in ("lon", "lat"):
+            np.testing.assert_allclose([c[key] for c in got["coords"]], [c[key] for c in want["coords"]], atol=1e-4)
+            assert got["centroid"][key] == pytest.approx(want["centroid"][key], abs=1e-4)
+
+
+def test_pack_network_round_trip():
+    network = {
+        "nodes": [{"id": "0|1"}, {"id": "0|2"}, {"id": "1|1"}, {"id": "2|5"}],
+        "clusters": {
+            0: [{"source": "0|1", "target": "0|2", "weight": 0.5}, {"source": "0|2", "target": "1|1", "weight": 0.25}],
+            1: [],
+        },
+        "node_clusters": {"0|1": 0, "0|2": 0, "1|1": 0, "2|5": 1},
+    }
+
+    buffer = pack_network(network)
+
+    assert unpack_network(buffer) == network
+    assert isinstance(to_base64(buffer), str)
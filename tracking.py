@@ -1,13 +1,14 @@
 from typing import Literal, TypedDict
-import json
 
 from pandas.core.api import DataFrame
 
-from line_reader import Line, get_all_lines, get_all_lines_at_time
+from line_reader import ENSEMBLE_COUNT, LineSet, get_all_lines, get_all_lines_at_time
 from data import Network, generate_network
+from network_arrays import NetworkArrays, as_network_arrays, load_networks
 from multiscale import multiscale
 from track_lines_devel import add_length_col, track_lines
 
+import numpy as np
 import pandas as pd
 from alive_progress import alive_it
 
@@ -18,22 +19,23 @@ class Row(TypedDict):
     longitude: float
 
 
+def lines_to_dataframe(lines: LineSet) -> DataFrame:
+    """Creates a dataframe with one row per point, see Row, directly from the columns of the lines."""
+    return pd.DataFrame({
+        "line_id": np.repeat(np.array(lines.ids, dtype=object), lines.lengths),
+        "latitude": lines.lat,
+        "longitude": lines.lon,
+    })
+
+
 # def create_clustermap(simstart: str, time_offset: int, line_type: Literal["mta", "jet"]) -> list[list[int]]:
-def create_clustermap(lines_t0: list[Line], lines_t1: list[Line], network_t0: Network, network_t1: Network) -> DataFrame:#list[list[int]]:
+def create_clustermap(lines_t0: LineSet, lines_t1: LineSet, network_t0: Network | NetworkArrays, network_t1: Network | NetworkArrays) -> DataFrame:#list[list[int]]:
     # Generate clusters at t0
     # lines_t0 = get_all_lines_at_time(simstart, time_offset, line_type)
     # ico_points_ms_t0, line_points_ms_t0 = multiscale(lines_t0, 2)
     # network_t0 = generate_network(lines_t0, ico_points_ms_t0, line_points_ms_t0, 50, 0.05)
 
-    rows: list[Row] = []
-    for line in lines_t0:
-        for coord in line.coords:
-            rows.append({
-                "line_id": line.id,
-                "latitude": coord.lat,
-                "longitude": coord.lon,
-            })
-    df0 = pd.DataFrame(rows)
+    df0 = lines_to_dataframe(lines_t0)
     add_length_col(df0)
 
     # Generate clusters at t1
@@ -41,21 +43,13 @@ def create_clustermap(lines_t0: list[Line], lines_t1: list[Line], network_t0: Ne
     # ico_points_ms_t1, line_points_ms_t1 = multiscale(lines_t1, 2)
     # network_t1 = generate_network(lines_t1, ico_points_ms_t1, line_points_ms_t1, 50, 0.05)
 
-    rows = []
-    for line in lines_t1:
-        for coord in line.coords:
-            rows.append({
-                "line_id": line.id,
-                "latitude": coord.lat,
-                "longitude": coord.lon,
-            })
-    df1 = pd.DataFrame(rows)
+    df1 = lines_to_dataframe(lines_t1)
     add_length_col(df1)
 
     all_matches: list[tuple[str, str]] = []
     unmatched_ids_t0: set[str] = set(df0["line_id"])    # type: ignore
     unmatched_ids_t1: set[str] = set(df1['line_id'])    # type: ignore
-    bar = alive_it(range(50), title="Tracking lines")
+    bar = alive_it(range(ENSEMBLE_COUNT), title="Tracking lines")
     for i in bar:
         df0_i = df0[df0["line_id"].str.split('|').str[0] == str(i)]  # type: ignore
         df1_i = df1[df1["line_id"].str.split('|').str[0] == str(i)]  # type: ignore
@@ -69,30 +63,24 @@ def create_clustermap(lines_t0: list[Line], lines_t1: list[Line], network_t0: Ne
 
         all_matches += matches
 
-    all_ids = sorted(set(
-        list(network_t0["node_clusters"].values()) + 
-        list(network_t1["node_clusters"].values())
-    ))
-
-    contingency = pd.DataFrame(
-        0, 
-        index=all_ids+["no_match"],
-        columns=all_ids+["no_match"]
-    )
-
-    for match in all_matches:
-        cluster_t0 = network_t0["node_clusters"][match[0]]
-        cluster_t1 = network_t1["node_clusters"][match[1]]
+    arrays_t0 = as_network_arrays(network_t0)
+    arrays_t1 = as_network_arrays(network_t1)
+    all_ids = np.union1d(arrays_t0.node_clusters, arrays_t1.node_clusters)
+    no_match = len(all_ids)
 
-        contingency.loc[cluster_t0, cluster_t1] += 1    # type: ignore
+    # The row or column of the cluster of each line, looked up by node index
+    rows_t0 = np.searchsorted(all_ids, arrays_t0.node_clusters)
+    cols_t1 = np.searchsorted(all_ids, arrays_t1.node_clusters)
 
-    for no_match in unmatched_ids_t0:
-        cluster_t0 = network_t0["node_clusters"][no_match]
-        contingency.loc[cluster_t0, "no_match"] += 1    # type: ignore
+    counts = np.zeros((no_match + 1, no_match + 1), dtype=np.int64)
+    if all_matches:
+        matched_t0, matched_t1 = zip(*all_matches)
+        np.add.at(counts, (rows_t0[arrays_t0.indices_of(list(matched_t0))], cols_t1[arrays_t1.indices_of(list(matched_t1))]), 1)
+    np.add.at(counts, (rows_t0[arrays_t0.indices_of(list(unmatched_ids_t0))], no_match), 1)
+    np.add.at(counts, (no_match, cols_t1[arrays_t1.indices_of(list(unmatched_ids_t1))]), 1)
 
-    for no_match in unmatched_ids_t1:
-        cluster_t1 = network_t1["node_clusters"][no_match]
-        contingency.loc["no_match", cluster_t1] += 1    # type: ignore
+    labels = all_ids.tolist() + ["no_match"]
+    contingency = pd.DataFrame(counts, index=labels, columns=labels)
 
     # row_totals = contingency.sum(axis=1)  # type: ignore
     # col_totals = contingency.sum(axis=0)  # type: ignore
@@ -108,9 +96,7 @@ def create_clustermap(lines_t0: list[Line], lines_t1: list[Line], network_t0: Ne
 
 
 if __name__ == "__main__":
-    loaded_networks: dict[str, Network]
-    with open("networks.json", "r") as f:
-        loaded_networks = json.load(f)
+    loaded_networks = load_networks("networks.bin")
 
     lines = get_all_lines("2024101900", "jet")
 
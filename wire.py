@@ -0,0 +1,182 @@
+"""A compact binary format for sending lines and networks to the frontend.
+
+Lists of dicts with one entry per point are slow to encode and parse, so
+the payload is sent as flat little endian arrays instead, which the
+frontend reads as typed array views without parsing the numbers:
+
+    MAGIC (4 bytes) | header length (uint32) | JSON header | padding | arrays...
+
+The JSON header holds the string table of the line ids and the dtype,
+offset and length of every array. The offsets are relative to the start of
+the data section, which is aligned to ALIGNMENT bytes, as is every array.
+
+Lines ('LIN1'):
+    lon, lat (float32): the points of all lines
+    offsets (int32): the start of each line in lon and lat, plus the total
+        number of points, see LineSet.offsets
+    centroids (float32): the lon and lat of each line's centroid, interleaved
+
+Networks ('NET1'):
+    clusters (int32): the ids of the clusters
+    node_clusters (int32): the cluster of each node in the id table
+    edges (int32): the source and target of each edge as indices into the
+        id table, interleaved
+    weights (float32): the weight of each edge
+    edge_clusters (int32): the cluster each edge is part of
+
+See assets/src/wire.ts for the decoder used by the frontend.
+"""
+import base64
+import json
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+from data import Network, TypedConnection
+from line_reader import LOD_TOLERANCES, LineSet
+
+
+LINES_MAGIC = b"LIN1"
+NETWORK_MAGIC = b"NET1"
+ALIGNMENT = 8
+
+
+def pack(magic: bytes, ids: list[str], arrays: dict[str, NDArray[Any]]) -> bytes:
+    """Packs a string table and flat arrays into a single buffer.
+
+    :param magic: The 4 byte tag identifying the content.
+    :param ids: The string table.
+    :param arrays: The arrays to store, by name. They are flattened and
+        stored little endian.
+    :return: The packed buffer.
+    """
+    arrays = {name: np.ascontiguousarray(arr.ravel(), dtype=arr.dtype.newbyteorder("<")) for name, arr in arrays.items()}
+
+    layout: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str[1:], "offset": offset, "length": len(arr)}
+        offset += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({"ids": ids, "arrays": layout}, separators=(",", ":")).encode()
+    prefix_len = len(magic) + 4 + len(header)
+    data_start = -(-prefix_len // ALIGNMENT) * ALIGNMENT
+
+    buffer = bytearray(data_start + offset)
+    buffer[:len(magic)] = magic
+    buffer[len(magic):len(magic) + 4] = np.uint32(len(header)).tobytes()
+    buffer[len(magic) + 4:prefix_len] = header
+    for name, arr in arrays.items():
+        start = data_start + layout[name]["offset"]
+        buffer[start:start + arr.nbytes] = arr.tobytes()
+
+    return bytes(buffer)
+
+
+def unpack(magic: bytes, buffer: bytes) -> tuple[list[str], dict[str, NDArray[Any]]]:
+    """Reads a buffer written by pack.
+
+    :return: (ids, arrays) : the string table and read-only views of the arrays
+    """
+    if buffer[:len(magic)] != magic:
+        raise ValueError(f"Expected a buffer tagged {magic!r}, got {buffer[:len(magic)]!r}")
+
+    header_len = int(np.frombuffer(buffer, dtype="<u4", count=1, offset=len(magic))[0])
+    prefix_len = len(magic) + 4 + header_len
+    header = json.loads(buffer[len(magic) + 4:prefix_len])
+    data_start = -(-prefix_len // ALIGNMENT) * ALIGNMENT
+
+    arrays = {
+        name: np.frombuffer(buffer, dtype="<" + info["dtype"], count=info["length"], offset=data_start + info["offset"])
+        for name, info in header["arrays"].items()
+    }
+
+    return header["ids"], arrays
+
+
+def pack_lines(lines: LineSet, lod: int = 0) -> bytes:
+    """Packs lines into the binary line format.
+
+    :param lines: The lines to pack.
+    :param lod: The level of detail of the points, see LOD_TOLERANCES.
+    :return: The packed lines.
+    """
+    lon, lat, offsets = lines.lon, lines.lat, lines.offsets
+    if lod > 0 and len(lines) > 0:
+        keep = lines.importance > LOD_TOLERANCES[lod]
+        lon, lat = lon[keep], lat[keep]
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lines.point_lines[keep], minlength=len(lines)), out=offsets[1:])
+
+    return pack(LINES_MAGIC, lines.ids, {
+        "lon": lon.astype(np.float32),
+        "lat": lat.astype(np.float32),
+        "offsets": offsets.astype(np.int32),
+        "centroids": lines.centroids.astype(np.float32),
+    })
+
+
+def unpack_lines(buffer: bytes) -> list[dict[str, Any]]:
+    """Reads packed lines into the same dicts as Line.to_dict."""
+    ids, arrays = unpack(LINES_MAGIC, buffer)
+    lon, lat = arrays["lon"].tolist(), arrays["lat"].tolist()
+    offsets = arrays["offsets"].tolist()
+    centroids = arrays["centroids"].reshape(-1, 2).tolist()
+
+    return [
+        {
+            "id": line_id,
+            "coords": [{"lon": lon[j], "lat": lat[j]} for j in range(offsets[i], offsets[i + 1])],
+            "centroid": {"lon": centroids[i][0], "lat": centroids[i][1]},
+        }
+        for i, line_id in enumerate(ids)
+    ]
+
+
+def pack_network(network: Network) -> bytes:
+    """Packs a network into the binary network format.
+
+    The cluster ids must be integers, or strings of integers as in networks
+    read back from JSON.
+    """
+    ids = [node["id"] for node in network["nodes"]]
+    index = {node_id: i for i, node_id in enumerate(ids)}
+
+    edges: list[int] = []
+    weights: list[float] = []
+    edge_clusters: list[int] = []
+    for cluster, connections in network["clusters"].items():
+        for connection in connections:
+            edges.extend((index[connection["source"]], index[connection["target"]]))
+            weights.append(connection["weight"])
+            edge_clusters.append(int(cluster))
+
+    return pack(NETWORK_MAGIC, ids, {
+        "clusters": np.array([int(cluster) for cluster in network["clusters"]], dtype=np.int32),
+        "node_clusters": np.array([int(network["node_clusters"][node_id]) for node_id in ids], dtype=np.int32),
+        "edges": np.array(edges, dtype=np.int32),
+        "weights": np.array(weights, dtype=np.float32),
+        "edge_clusters": np.array(edge_clusters, dtype=np.int32),
+    })
+
+
+def unpack_network(buffer: bytes) -> Network:
+    """Reads a packed network back into a Network."""
+    ids, arrays = unpack(NETWORK_MAGIC, buffer)
+    edges = arrays["edges"].reshape(-1, 2).tolist()
+
+    clusters: dict[int, list[TypedConnection]] = {cluster: [] for cluster in arrays["clusters"].tolist()}
+    for (source, target), weight, cluster in zip(edges, arrays["weights"].tolist(), arrays["edge_clusters"].tolist()):
+        clusters[cluster].append(TypedConnection(source=ids[source], target=ids[target], weight=weight))
+
+    return {
+        "nodes": [{"id": node_id} for node_id in ids],
+        "clusters": clusters,
+        "node_clusters": dict(zip(ids, arrays["node_clusters"].tolist())),
+    }
+
+
+def to_base64(buffer: bytes) -> str:
+    """Encodes a packed buffer for pywebview, which can only send strings."""
+    return base64.b64encode(buffer).decode("ascii")